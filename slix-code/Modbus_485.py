@@ -1,7 +1,20 @@
-import serial
-import minimalmodbus
 import time
 import struct
+from collections import deque
+from rs485_bus import get_bus
+from functools import lru_cache
+from modbus_crc import crc16, append_crc, request_frame
+from modbus_errors import ModbusTimeoutError, ModbusFrameError, check_response
+
+@lru_cache(maxsize=256)
+def _encode_frame(hex):
+    return append_crc(bytes.fromhex(hex))
+
+@lru_cache(maxsize=64)
+def _register_struct(fmt, count):
+    # เช่น (">H", 2) -> Struct(">2H") ใช้ซ้ำได้ทุกรอบ
+    return struct.Struct(fmt[0] + str(count) + fmt[1:])
+
 class Modbus_Film69():
     # def __init__(self, port="/dev/ttyS2", slaveaddress=1, baudrate=9600):
                  
@@ -16,29 +29,36 @@ class Modbus_Film69():
         # instrument.address =1
     
     def __init__(self, port="/dev/ttyS2", slaveaddress=1, baudrate=9600):
-        self.instrument = minimalmodbus.Instrument(port, slaveaddress)
-        self.instrument.serial.baudrate = baudrate
-        self.instrument.serial.parity = serial.PARITY_NONE
-        self.instrument.serial.bytesize = 8
-        self.instrument.serial.stopbits = 1
-        self.instrument.mode = minimalmodbus.MODE_RTU
-        self.instrument.serial.timeout = 0.300
+        # ทุก instance บน tty เดียวกันใช้ bus (file descriptor) ตัวเดียวกัน
+        self.port = port
+        self.slaveaddress = slaveaddress
+        self.baudrate = baudrate
+        self.timeout = 0.300
+        self.bus = get_bus(port, baudrate=baudrate)
+        self.debug_ring = None  # raw frames เก็บเฉพาะตอน debug (enable_debug)
+
+    def enable_debug(self, size=32):
+        """
+        Keep the last `size` raw response frames in a bounded ring (0 disables)
+
+        Frames are the received bytes objects themselves, no copies are made.
+        """
+        self.debug_ring = deque(maxlen=size) if size else None
+
+    def debug_frames(self):
+        """
+        Raw frames kept by enable_debug()
+
+        Returns:
+            list: [(timestamp, slave address, "hex bytes"), ...] oldest first
+        """
+        if self.debug_ring is None:
+            return []
+        return [(ts, addr, res.hex(" ").upper()) for ts, addr, res in self.debug_ring]
 
     def calculate_crc(self,input):
         input=input+" "
-        data = bytearray.fromhex(input)
-        crc = 0xFFFF
-        polynomial = 0xA001
-
-        for byte in data:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x0001:
-                    crc >>= 1
-                    crc ^= polynomial
-                else:
-                    crc >>= 1
-        
+        crc = crc16(bytearray.fromhex(input))
         return input+"{:02X} {:02X}".format(crc & 0xFF, (crc >> 8) & 0xFF)
 
     def hex_to_float(self,hex_str):
@@ -55,16 +75,120 @@ class Modbus_Film69():
         return float_value
 
     def encode(self,hex):
-        return bytes(bytearray.fromhex(self.calculate_crc(hex)))
+        # คำสั่งเดิมถูกส่งซ้ำทุกรอบ จึง cache frame ที่สร้างแล้วไว้
+        return _encode_frame(hex)
     
     def decode(self,Bytes):
         return " ".join([f"{x:02X}" for x in Bytes]) , " ({} bytes)".format(len(Bytes))
     def send(self,hex,resopne_len=20,ID=1):
-        self.instrument.address = ID
-        res = self.instrument._communicate(self.encode(hex),resopne_len)
-        return self.decode(res)
+        """String API (compatibility shim): "01 03 00 00 00 02" -> ("01 03 04 ...", " (9 bytes)")"""
+        return self.decode(self.transact(self.encode(hex), resopne_len, ID))
+
+    def transact(self, frame, response_len=None, ID=None, cached=False):
+        """
+        Send a binary request frame and return the raw response bytes
+
+        Args:
+            frame (bytes): Complete request frame including CRC
+            response_len (int, optional): Fixed response length in bytes;
+                None lets the bus detect it from the response header
+            ID (int, optional): Slave address (kept for bookkeeping)
+            cached (bool): Reads may be answered from the register cache
+
+        Returns:
+            bytes: Response frame
+        """
+        if ID is not None:
+            self.slaveaddress = ID
+        res = self.bus.transaction(frame, response_len, baudrate=self.baudrate, timeout=self.timeout, cached=cached)
+        if not res:
+            raise ModbusTimeoutError("No communication with the instrument (no answer)")
+        return res
+
+    def read_response(self, addr, function, start, count, cached=False):
+        """
+        Read `count` registers and return the CRC-checked response frame
+
+        Response: [addr, func, byte_count, data(2*count), crc_L, crc_H]
+
+        cached=True accepts a frame rebuilt from the register cache
+        (see register_cache.py) when the device's TTL allows it.
+
+        Raises:
+            ModbusExceptionResponse: Slave answered with an exception frame
+            ModbusTimeoutError: No answer
+            ModbusFrameError / ModbusCRCError: Short or corrupt frame
+        """
+        data_len = 2 * count
+        res = self.transact(request_frame(addr, function, start, count), ID=addr, cached=cached)
+        if self.debug_ring is not None:
+            self.debug_ring.append((time.time(), addr, res))
+        check_response(res, data_len + 5)
+        if res[0] != addr or res[1] != function or res[2] != data_len:
+            raise ModbusFrameError(f"Unexpected response header: {res[0]:02X} {res[1]:02X} {res[2]:02X}")
+        return res
+
+    def read_holding(self, addr, start, count):
+        """
+        Read holding registers (FC03)
+
+        Args:
+            addr (int): Slave address
+            start (int): First register
+            count (int): Number of registers
+
+        Returns:
+            tuple: uint16 register values
+        """
+        res = self.read_response(addr, 0x03, start, count)
+        return _register_struct(">H", count).unpack_from(res, 3)
+
+    def read_input(self, addr, start, count):
+        """Read input registers (FC04), returns tuple of uint16"""
+        res = self.read_response(addr, 0x04, start, count)
+        return _register_struct(">H", count).unpack_from(res, 3)
+
+    def read_int16(self, addr, start, count=1, function=0x03):
+        """Read registers as signed int16, returns tuple"""
+        res = self.read_response(addr, function, start, count)
+        return _register_struct(">h", count).unpack_from(res, 3)
+
+    def read_float32(self, addr, start, count=1, byteorder=">", function=0x03):
+        """
+        Read `count` IEEE-754 floats (2 registers each)
+
+        Args:
+            byteorder (str): ">" for ABCD (RIKA RK500 series), "<" for DCBA
+
+        Returns:
+            tuple: float values
+        """
+        res = self.read_response(addr, function, start, 2 * count)
+        return _register_struct(byteorder + "f", count).unpack_from(res, 3)
+
+    def read_block(self, addr, spec):
+        """
+        Read a sensor's register block declared as READ = (method, start, count)
+
+        The same spec drives modbus_async.AsyncModbusRTU.read_block, so one
+        sensor class decodes the values on either transport.
+        """
+        method, start, count = spec
+        return getattr(self, method)(addr, start, count)
+
+    def write_single(self, addr, register, value):
+        """
+        Write single register (FC06), the slave echoes the request
+
+        Returns:
+            bool: True if the echo matches the request
+        """
+        frame = request_frame(addr, 0x06, register, value)
+        res = check_response(self.transact(frame, ID=addr), 8)
+        return res == frame
     def close(self):
-        self.instrument.serial.close()
+        # port ใช้ร่วมกับ sensor ตัวอื่นบน bus จึงไม่ปิดที่นี่ (ปิดด้วย close_all_buses)
+        pass
 
 if __name__ == "__main__":
     ser=Modbus_Film69("/dev/ttyS2")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Automatic baud-rate detection per device
+
+Sensors ship at different default rates (rain / ultrasonic 4800, the rest
+9600), and a wrong rate in sensor_config looks exactly like a dead sensor.
+detect_baudrate() tries the common rates with the model's cheap signature
+read (see modbus_discovery.MODELS; rain / ultrasonic use the 0x0100 address
+register so the rain counter is never cleared) and returns the rate the
+device answers at. Any clean frame counts, including a Modbus exception:
+the framing is right at that speed.
+
+Winners are persisted per (port, address) in BAUD_CACHE_FILE so the next
+start uses them directly; the main loop re-probes only after sustained
+failure (the port's circuit breaker opened).
+
+Usage:
+    baudrate = detect_baudrate(get_bus("/dev/ttyS2"), 0x32, "rainfall", first=9600)
+    if baudrate:
+        remember_baudrate("/dev/ttyS2", 0x32, baudrate)
+    cached_baudrate("/dev/ttyS2", 0x32)    # -> 4800
+"""
+
+import json
+import os
+import threading
+import time
+
+from modbus_crc import request_frame
+from modbus_errors import classify_response
+from modbus_discovery import PROBES, MODELS
+
+COMMON_BAUDRATES = (9600, 4800, 19200, 2400, 38400)
+
+# Time for a slave to start answering a probe
+PROBE_WINDOW = 0.15
+
+# Idle gap between probes (garbage at a wrong rate must not inflate
+# the learned turnaround of the device)
+PROBE_GAP = 0.05
+
+BAUD_CACHE_FILE = "/root/sensor_baudrates.json"
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _key(port, address):
+    return f"{port}|{address}"
+
+
+def _load():
+    global _cache
+    if _cache is None:
+        try:
+            with open(BAUD_CACHE_FILE) as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def cached_baudrate(port, address):
+    """
+    Last detected baud rate of a device
+
+    Returns:
+        int or None: Baud rate, None if never detected
+    """
+    with _cache_lock:
+        entry = _load().get(_key(port, address))
+    return entry["baudrate"] if entry else None
+
+
+def remember_baudrate(port, address, baudrate):
+    """Persist the detected baud rate of a device (atomic file replace)"""
+    with _cache_lock:
+        cache = _load()
+        cache[_key(port, address)] = {"baudrate": baudrate, "detected": int(time.time())}
+        try:
+            tmp = BAUD_CACHE_FILE + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(cache, f, indent=2)
+            os.replace(tmp, BAUD_CACHE_FILE)
+        except OSError as e:
+            print(f"⚠️ Could not save baud rate cache: {e}")
+
+
+def detect_baudrate(bus, address, model=None, rates=COMMON_BAUDRATES, first=None, attempts=1):
+    """
+    Find the baud rate a device answers at
+
+    Args:
+        bus (RS485Bus): Bus the device is on
+        address (int): Slave address
+        model (str, optional): Key in modbus_discovery.MODELS (sensor type)
+        rates (iterable): Rates to try
+        first (int, optional): Rate to try before the others (configured / cached)
+        attempts (int): Probes per rate
+
+    Returns:
+        int or None: Baud rate, None if the device answers at none of them
+    """
+    probe = MODELS[model][1] if model in MODELS else "block2"
+    register, count = PROBES[probe]
+    request = request_frame(address, 0x03, register, count)
+
+    order = [first] if first else []
+    order += [rate for rate in rates if rate != first]
+
+    with bus:
+        for baudrate in order:
+            timeout = PROBE_WINDOW + (5 + 2 * count) * 11.0 / baudrate
+            for _ in range(attempts):
+                try:
+                    reply = bus.transaction(request, baudrate=baudrate, timeout=timeout, turnaround=PROBE_GAP)
+                except Exception as e:
+                    print(f"❌ Baud probe 0x{address:02X} @ {baudrate} failed: {e}")
+                    return None
+                if reply and reply[0] == address and classify_response(reply) in ("ok", "exception"):
+                    print(f"🔎 0x{address:02X} answers at {baudrate} baud")
+                    bus.turnaround.pop(address, None)  # relearn at the right speed
+                    return baudrate
+    print(f"🔎 0x{address:02X}: no answer at {', '.join(str(rate) for rate in order)} baud")
+    return None
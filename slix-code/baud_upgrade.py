@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Baud-rate upgrade tool
+
+Moves a sensor that has a baud-rate register onto a faster line speed:
+
+  1. check the device answers at its current rate
+  2. write the new rate code (FC06) at the current rate
+  3. verify with a normal read at the new rate
+  4. on failure, write the old code back (at either rate, whichever the
+     device now listens at) and verify at the old rate
+  5. on success, persist the new rate in the auto-baud cache
+     (auto_baud.BAUD_CACHE_FILE, atomic replace), which test_main04 uses
+     instead of the sensor_config value at start-up
+
+The tool writes to the tty directly, so it refuses to run while another
+process (the polling service) has the port open: stop the service first,
+or the upgrade frames collide with the poller's reads.
+
+Only models whose manual documents a baud-rate register are listed in
+BAUD_REGISTERS. The RK-series sensors (wind, soil, solar, RK500-22/23,
+RKL-01) and the rain / ultrasonic firmware have no documented register,
+so they stay at their shipped rate.
+
+Usage:
+    python baud_upgrade.py /dev/ttyS2 0x0E air_temp 19200
+    python baud_upgrade.py /dev/ttyS2 0x0E air_temp 19200 --from 9600
+"""
+
+import os
+import sys
+import time
+
+from rs485_bus import get_bus
+from modbus_crc import request_frame
+from modbus_errors import classify_response
+from modbus_discovery import PROBES, MODELS
+from auto_baud import detect_baudrate, cached_baudrate, remember_baudrate
+
+# Sensor type: baud-rate register and value codes from the manual
+BAUD_REGISTERS = {
+    # MW485 / SN-3000-WS-N01 temperature & humidity
+    "air_temp": {
+        "register": 0x07D1,
+        "codes": {2400: 0, 4800: 1, 9600: 2, 19200: 3, 38400: 4, 57600: 5, 115200: 6}
+    },
+}
+
+# Time the device needs to apply a new line speed
+SWITCH_DELAY = 0.5
+VERIFY_ATTEMPTS = 3
+TIMEOUT = 0.5
+
+
+def port_users(port):
+    """
+    Other processes that have a serial port open (Linux /proc scan)
+
+    Returns:
+        list: PIDs, empty if nobody else uses the port
+    """
+    target = os.path.realpath(port)
+    users = []
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            fds = os.listdir(f"/proc/{pid}/fd")
+            if any(os.path.realpath(f"/proc/{pid}/fd/{fd}") == target for fd in fds):
+                users.append(int(pid))
+        except OSError:
+            continue  # process ended or not ours to inspect
+    return users
+
+
+def _write_code(bus, address, register, code, baudrate):
+    """FC06 write of a rate code, True if the device echoed it"""
+    frame = request_frame(address, 0x06, register, code)
+    reply = bus.transaction(frame, baudrate=baudrate, timeout=TIMEOUT)
+    return reply == frame
+
+
+def _verify(bus, address, model, baudrate):
+    """Normal signature read at a rate, True on a clean answer"""
+    register, count = PROBES[MODELS[model][1]]
+    request = request_frame(address, 0x03, register, count)
+    for _ in range(VERIFY_ATTEMPTS):
+        try:
+            reply = bus.transaction(request, baudrate=baudrate, timeout=TIMEOUT)
+        except Exception as e:
+            print(f"❌ Verify read @ {baudrate} failed: {e}")
+            reply = b""
+        if classify_response(reply) == "ok" and reply[0] == address:
+            return True
+        time.sleep(SWITCH_DELAY)
+    return False
+
+
+def upgrade_baudrate(port, address, model, new_baudrate, current=None):
+    """
+    Move one sensor to a new baud rate
+
+    Args:
+        port (str): Serial port path
+        address (int): Slave address
+        model (str): Sensor type (key in BAUD_REGISTERS)
+        new_baudrate (int): Target rate
+        current (int, optional): Current rate (default: cached / detected)
+
+    Returns:
+        dict: {"success": bool, "baudrate": rate the device is at, "message": str}
+    """
+    spec = BAUD_REGISTERS.get(model)
+    if spec is None:
+        return {"success": False, "baudrate": current, "message": f"{model} has no documented baud-rate register"}
+    if new_baudrate not in spec["codes"]:
+        return {"success": False, "baudrate": current, "message": f"{new_baudrate} not supported by {model}"}
+
+    users = port_users(port)
+    if users:
+        return {"success": False, "baudrate": current,
+                "message": f"{port} is open by PID {', '.join(map(str, users))}, stop the polling service first"}
+
+    bus = get_bus(port)
+    with bus:
+        current = current or cached_baudrate(port, address) or detect_baudrate(bus, address, model)
+        if current is None or not _verify(bus, address, model, current):
+            return {"success": False, "baudrate": current, "message": "device does not answer at its current rate"}
+        if current == new_baudrate:
+            remember_baudrate(port, address, current)
+            return {"success": True, "baudrate": current, "message": "already at target rate"}
+        if current not in spec["codes"]:
+            return {"success": False, "baudrate": current, "message": f"cannot roll back to {current}"}
+
+        print(f"🔧 0x{address:02X} ({model}): {current} -> {new_baudrate} baud")
+        try:
+            written = _write_code(bus, address, spec["register"], spec["codes"][new_baudrate], current)
+        except Exception as e:
+            # The frame may have reached the device: roll back like a failed verify
+            print(f"❌ Rate write @ {current} failed: {e}")
+            written = False
+        time.sleep(SWITCH_DELAY)
+        if written and _verify(bus, address, model, new_baudrate):
+            remember_baudrate(port, address, new_baudrate)
+            bus.turnaround.pop(address, None)
+            print(f"✅ 0x{address:02X} verified at {new_baudrate} baud")
+            return {"success": True, "baudrate": new_baudrate, "message": "upgraded"}
+
+        # Roll back: the device may or may not have switched already
+        print(f"⚠️ 0x{address:02X} not verified at {new_baudrate}, rolling back to {current}")
+        old_code = spec["codes"][current]
+        for rate in (new_baudrate, current):
+            try:
+                _write_code(bus, address, spec["register"], old_code, rate)
+            except Exception as e:
+                print(f"❌ Rollback write @ {rate} failed: {e}")
+        time.sleep(SWITCH_DELAY)
+        if _verify(bus, address, model, current):
+            remember_baudrate(port, address, current)
+            return {"success": False, "baudrate": current, "message": "verification failed, rolled back"}
+
+        # Lost track of the device: find it again so the cache stays true
+        found = detect_baudrate(bus, address, model)
+        if found:
+            remember_baudrate(port, address, found)
+        return {"success": False, "baudrate": found, "message": "verification and rollback failed"}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5:
+        print("Usage: baud_upgrade.py <port> <address> <model> <baudrate> [--from <baudrate>]")
+        sys.exit(1)
+    port, address, model, target = sys.argv[1], int(sys.argv[2], 0), sys.argv[3], int(sys.argv[4])
+    current = int(sys.argv[sys.argv.index("--from") + 1]) if "--from" in sys.argv else None
+    result = upgrade_baudrate(port, address, model, target, current)
+    print(result)
+    sys.exit(0 if result["success"] else 1)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bit-by-bit CRC16 (old driver code) vs table-driven modbus_crc
+
+Frame sizes cover what the sensors actually exchange:
+  8 bytes  - every request / FC06 echo
+  7 bytes  - 1-register reply (rain, ultrasonic, solar, RKL-01)
+  9 bytes  - 2-register reply (wind, soil, air temp)
+  17 bytes - RK500-22 pH reply
+  25 bytes - RK500-23 EC reply
+
+Usage:
+    python3 bench_modbus_crc.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+from modbus_crc import crc16, request_frame
+
+FRAME_SIZES = [7, 8, 9, 17, 25]
+
+
+def crc16_bitwise(buf):
+    """The loop that was copy-pasted into every driver"""
+    crc = 0xFFFF
+    for b in buf:
+        crc ^= b
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{'bytes':>5} {'bitwise us':>11} {'table us':>9} {'speed-up':>9}")
+
+    for size in FRAME_SIZES:
+        frame = os.urandom(size)
+        assert crc16_bitwise(frame) == crc16(frame) == crc16(memoryview(frame))
+
+        old = timeit.timeit(lambda: crc16_bitwise(frame), number=iterations) / iterations * 1e6
+        new = timeit.timeit(lambda: crc16(frame), number=iterations) / iterations * 1e6
+        print(f"{size:>5} {old:>11.2f} {new:>9.2f} {old / new:>8.1f}x")
+
+    # Request frames are now built once and cached
+    def build_old():
+        cmd = [0x58, 0x03, 0x00, 0x00, 0x00, 0x0A]
+        crc = crc16_bitwise(cmd)
+        return bytes(cmd + [crc & 0xFF, (crc >> 8) & 0xFF])
+
+    old = timeit.timeit(build_old, number=iterations) / iterations * 1e6
+    new = timeit.timeit(lambda: request_frame(0x58, 0x03, 0x0000, 10), number=iterations) / iterations * 1e6
+    print(f"\nrequest frame build: {old:.2f} us -> cached {new:.2f} us ({old / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
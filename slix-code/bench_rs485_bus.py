@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: open/close serial per transaction vs shared RS485Bus
+
+Runs against a simulated Modbus slave on a pseudo-terminal, so no hardware
+is needed. One "cycle" reads the same sensor set as test_main04.py
+(6 enabled sensors, one FC03 read each).
+
+Usage:
+    python3 bench_rs485_bus.py [cycles]
+"""
+
+import os
+import pty
+import sys
+import threading
+import time
+import tty
+
+import serial
+from rs485_bus import RS485Bus
+from modbus_crc import append_crc, request_frame
+
+SENSOR_ADDRESSES = [0x1A, 0x02, 0x03, 0x0E, 0x4E, 0x32]
+
+
+def read_frame(address):
+    return request_frame(address, 0x03, 0x0000, 1)
+
+
+def start_slave():
+    """Start a minimal FC03 slave on a pty, return the slave tty path"""
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+
+    def serve():
+        buf = b""
+        while True:
+            try:
+                buf += os.read(master, 64)
+            except OSError:
+                return
+            while len(buf) >= 8:
+                req, buf = buf[:8], buf[8:]
+                os.write(master, append_crc(bytes((req[0], 0x03, 0x02, 0x01, 0x2C))))
+
+    threading.Thread(target=serve, daemon=True).start()
+    return path, slave
+
+
+def cycle_open_per_read(path):
+    for address in SENSOR_ADDRESSES:
+        ser = serial.Serial(path, baudrate=9600, bytesize=8, parity="N", stopbits=1, timeout=1.0)
+        ser.reset_input_buffer()
+        ser.write(read_frame(address))
+        ser.flush()
+        ser.read(7)
+        ser.close()
+
+
+def cycle_shared_bus(bus):
+    # turnaround=0: measure the bus, not the learned idle gap (the open/close
+    # variant does not keep one either)
+    for address in SENSOR_ADDRESSES:
+        bus.transaction(read_frame(address), 7, baudrate=9600, timeout=1.0, turnaround=0)
+
+
+def measure(label, fn, cycles):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(cycles):
+        fn()
+    per_cycle = (time.perf_counter() - start) / cycles * 1000.0
+    print(f"{label:<28} {per_cycle:8.3f} ms/cycle")
+    return per_cycle
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    path, _keep_open = start_slave()
+    print(f"Simulated bus on {path}, {len(SENSOR_ADDRESSES)} sensors, {cycles} cycles")
+
+    before = measure("open/close per transaction", lambda: cycle_open_per_read(path), cycles)
+
+    bus = RS485Bus(path)
+    after = measure("shared RS485Bus", lambda: cycle_shared_bus(bus), cycles)
+    print(f"Port opens: {bus.stats['opens']}, transactions: {bus.stats['transactions']}")
+    bus.close()
+
+    print(f"Speed-up: {before / after:.2f}x ({before - after:.3f} ms saved per cycle)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Per-device transaction histograms for the RS485 bus
+
+Every RS485Bus keeps a BusMetrics (bus.metrics). Each device (slave
+address) gets fixed-size, log2-bucketed arrays, so memory does not grow
+with uptime:
+
+  - round-trip latency (request written -> response complete) of every
+    answered transaction, buckets <1, <2, <4 ... <2048 ms, >=2048 ms
+  - attempts per successful read, buckets 1, 2, 3-4, 5-8, 9+
+  - outcome counters: ok, exception, crc, timeout (partial frame),
+    no-device (nothing received)
+
+RS485Bus.transaction() records latency and outcome; the reader that
+knows what "one read" is (read_sensor_with_timeout) records attempts.
+
+Usage:
+    bus.metrics.device(0x02).summary()
+    # {"tx": 120, "ok": 117, "crc": 2, ..., "rtt_p50": 32, "rtt_p95": 64, "rtt_max": 41.7,
+    #  "reads": 40, "attempts_p95": 2}
+    bus.metrics.summary()       # {address: summary}
+"""
+
+import threading
+from array import array
+
+LATENCY_BUCKETS = 13    # < 2**i ms for i = 0..11, then overflow
+ATTEMPT_BUCKETS = 5     # 1, 2, 3-4, 5-8, 9+
+OUTCOMES = ("ok", "exception", "crc", "timeout", "no-device")
+
+
+def latency_bucket(ms):
+    """Bucket index of a round trip: 0 for < 1 ms, i for < 2**i ms"""
+    return min(int(ms).bit_length(), LATENCY_BUCKETS - 1)
+
+
+def attempts_bucket(attempts):
+    """Bucket index of an attempt count: 1 -> 0, 2 -> 1, 3-4 -> 2, 5-8 -> 3, 9+ -> 4"""
+    return min((max(1, attempts) - 1).bit_length(), ATTEMPT_BUCKETS - 1)
+
+
+def _percentile(counts, q, upper):
+    """Upper bound of the bucket holding the q-quantile (None when empty)"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        seen += count
+        if seen >= rank:
+            return upper(i)
+    return upper(len(counts) - 1)
+
+
+class DeviceMetrics:
+    def __init__(self):
+        self.latency = array("I", [0] * LATENCY_BUCKETS)
+        self.attempts = array("I", [0] * ATTEMPT_BUCKETS)
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.latency_max = 0.0
+        self.failed_reads = 0
+
+    def record_transaction(self, seconds, outcome):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if outcome != "no-device":
+            ms = seconds * 1000.0
+            self.latency[latency_bucket(ms)] += 1
+            self.latency_max = max(self.latency_max, ms)
+
+    def record_read(self, attempts, success):
+        if success:
+            self.attempts[attempts_bucket(attempts)] += 1
+        else:
+            self.failed_reads += 1
+
+    def latency_percentile(self, q):
+        """Round trip (ms, bucket upper bound, capped at the maximum seen) for a fraction q of answers"""
+        return _percentile(self.latency, q, lambda i: min(2 ** i, round(self.latency_max, 1)))
+
+    def attempts_percentile(self, q):
+        """Attempts (bucket upper bound, 9 for 9+) needed by a fraction q of successful reads"""
+        return _percentile(self.attempts, q, lambda i: 2 ** i if i < ATTEMPT_BUCKETS - 1 else 2 ** (i - 1) + 1)
+
+    def summary(self):
+        """
+        Returns:
+            dict: Outcome counters, tx, rtt_p50 / rtt_p95 / rtt_max (ms),
+                  reads, failed_reads, attempts_p95
+        """
+        result = dict(self.outcomes)
+        result["tx"] = sum(self.outcomes.values())
+        result["rtt_p50"] = self.latency_percentile(0.5)
+        result["rtt_p95"] = self.latency_percentile(0.95)
+        result["rtt_max"] = round(self.latency_max, 1)
+        result["reads"] = sum(self.attempts)
+        result["failed_reads"] = self.failed_reads
+        result["attempts_p95"] = self.attempts_percentile(0.95)
+        return result
+
+
+class BusMetrics:
+    def __init__(self):
+        self.devices = {}  # address -> DeviceMetrics
+        self.lock = threading.Lock()
+
+    def device(self, address):
+        """DeviceMetrics of an address (created on first use)"""
+        with self.lock:
+            metrics = self.devices.get(address)
+            if metrics is None:
+                metrics = self.devices[address] = DeviceMetrics()
+            return metrics
+
+    def record_transaction(self, address, seconds, outcome):
+        """One wire transaction: round trip in seconds and its outcome"""
+        metrics = self.device(address)
+        with self.lock:
+            metrics.record_transaction(seconds, outcome)
+
+    def record_read(self, address, attempts, success):
+        """One driver-level read: transactions spent and whether it returned data"""
+        metrics = self.device(address)
+        with self.lock:
+            metrics.record_read(attempts, success)
+
+    def summary(self):
+        """
+        Returns:
+            dict: {address: DeviceMetrics.summary()}
+        """
+        with self.lock:
+            return {address: metrics.summary() for address, metrics in sorted(self.devices.items())}
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Priority scheduler for RS485 bus work
+
+One worker thread per bus runs every job that touches the line, one at a
+time, in priority order:
+
+  INTERACTIVE  - RPC reads / calibration from an operator
+  ALARM        - alarm follow-up reads
+  PERIODIC     - the 60 s polling cycle
+  DISCOVERY    - background address scans
+
+A job is one sensor read (bounded by its deadline window), so a higher
+priority job waits at most for the read currently on the line. The
+polling cycle submits its reads one by one; when an RPC jumps in, the cycle
+simply continues with the next port afterwards.
+
+Usage:
+    scheduler = BusScheduler("ttyS2")
+    scheduler.start()
+    data = scheduler.call(PERIODIC, system.read_sensor_with_timeout, 3)
+    print(scheduler.metrics())
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+INTERACTIVE = 0
+ALARM = 1
+PERIODIC = 2
+DISCOVERY = 3
+
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    ALARM: "alarm",
+    PERIODIC: "periodic",
+    DISCOVERY: "discovery"
+}
+
+
+class BusJob:
+    def __init__(self, priority, fn, args, kwargs):
+        """
+        One unit of bus work and its result (future-like)
+
+        Args:
+            priority (int): INTERACTIVE .. DISCOVERY
+            fn (callable): Function to run on the worker thread
+            args (tuple): Positional arguments for fn
+            kwargs (dict): Keyword arguments for fn
+        """
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.submitted = time.monotonic()
+        self.started = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the job and return its result
+
+        Raises:
+            TimeoutError: The job did not finish in time
+            Exception: Whatever the job raised
+        """
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Bus job not finished within {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class BusScheduler:
+    def __init__(self, name="rs485"):
+        """
+        Initialize scheduler (call start() to run the worker)
+
+        Args:
+            name (str): Name used for the worker thread
+        """
+        self.name = name
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.stats = {
+            cls: {"submitted": 0, "completed": 0, "wait_total": 0.0, "wait_max": 0.0}
+            for cls in PRIORITY_NAMES.values()
+        }
+
+    def start(self):
+        """Start the worker thread"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._worker, name=f"bus-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the worker after the job on the line finishes"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def submit(self, priority, fn, *args, **kwargs):
+        """
+        Queue a job (runs it inline if the worker is not started)
+
+        Returns:
+            BusJob: Handle to wait on
+        """
+        job = BusJob(priority, fn, args, kwargs)
+        if not self._running:
+            job.started = time.monotonic()
+            try:
+                job.result = fn(*args, **kwargs)
+            except Exception as e:
+                job.error = e
+            job.done.set()
+            return job
+        with self._cond:
+            heapq.heappush(self._queue, (priority, next(self._seq), job))
+            self.stats[PRIORITY_NAMES[priority]]["submitted"] += 1
+            self._cond.notify()
+        return job
+
+    def call(self, priority, fn, *args, timeout=None, **kwargs):
+        """
+        Queue a job and wait for its result
+
+        Runs inline if called from the worker thread itself (no deadlock).
+        """
+        if threading.current_thread() is self._thread or not self._running:
+            return fn(*args, **kwargs)
+        return self.submit(priority, fn, *args, **kwargs).wait(timeout)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    pending = [job for _, _, job in self._queue]
+                    self._queue = []
+                    break
+                _, _, job = heapq.heappop(self._queue)
+
+            job.started = time.monotonic()
+            try:
+                job.result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                job.error = e
+            self._account(job)
+            job.done.set()
+
+        for job in pending:
+            job.error = RuntimeError("Bus scheduler stopped")
+            job.done.set()
+
+    def _account(self, job):
+        wait = job.started - job.submitted
+        stats = self.stats[PRIORITY_NAMES[job.priority]]
+        with self._cond:
+            stats["completed"] += 1
+            stats["wait_total"] += wait
+            stats["wait_max"] = max(stats["wait_max"], wait)
+
+    def metrics(self):
+        """
+        Queue depth and wait times per priority class
+
+        Returns:
+            dict: {"queue_depth": int, "<class>": {submitted, completed, wait_avg, wait_max}}
+        """
+        with self._cond:
+            result = {"queue_depth": len(self._queue)}
+            for cls, stats in self.stats.items():
+                completed = stats["completed"]
+                result[cls] = {
+                    "submitted": stats["submitted"],
+                    "completed": completed,
+                    "wait_avg": round(stats["wait_total"] / completed, 3) if completed else 0.0,
+                    "wait_max": round(stats["wait_max"], 3)
+                }
+            return result
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Per-port circuit breaker for dead or unplugged sensors
+
+States:
+  closed     - normal, the port is read every cycle
+  open       - quarantined after FAILURE_THRESHOLD consecutive failures,
+               no bus traffic until the next probe time
+  half_open  - one probe read is allowed; success closes the breaker,
+               failure re-opens it with twice the probe interval
+
+Probe intervals grow exponentially (PROBE_BASE .. PROBE_MAX). probe_now()
+schedules an immediate probe, e.g. when the MCP sensor_check pin shows a
+sensor was just plugged in.
+
+Usage:
+    breaker = CircuitBreaker()
+    if breaker.allow_request():
+        data = read_sensor()
+        breaker.record(data is not None)
+"""
+
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FAILURE_THRESHOLD = 3
+PROBE_BASE = 60.0       # 1 read cycle
+PROBE_MAX = 3600.0
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, probe_base=PROBE_BASE, probe_max=PROBE_MAX):
+        """
+        Initialize a closed breaker
+
+        Args:
+            failure_threshold (int): Consecutive failures before opening
+            probe_base (float): First probe interval in seconds
+            probe_max (float): Longest probe interval in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.probe_base = probe_base
+        self.probe_max = probe_max
+
+        self.state = CLOSED
+        self.failures = 0
+        self.probe_interval = probe_base
+        self.next_probe = 0.0
+        self.opened_at = None
+        self.skipped = 0
+
+    def allow_request(self, now=None):
+        """
+        Check whether the port may be read now
+
+        Returns:
+            bool: True if closed, or open and the probe time has come
+                  (the breaker moves to half_open for that probe)
+        """
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN and now >= self.next_probe:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return True
+        self.skipped += 1
+        return False
+
+    def record(self, success, now=None):
+        """
+        Record the result of a read that allow_request() let through
+
+        Args:
+            success (bool): The read returned valid data
+        """
+        now = time.monotonic() if now is None else now
+        if success:
+            self.state = CLOSED
+            self.failures = 0
+            self.probe_interval = self.probe_base
+            self.opened_at = None
+            return
+
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            # Probe failed: wait twice as long before the next one
+            self.probe_interval = min(self.probe_max, self.probe_interval * 2)
+            self._open(now)
+        elif self.failures >= self.failure_threshold:
+            self._open(now)
+
+    def probe_now(self):
+        """Schedule an immediate probe (e.g. fresh MCP connection)"""
+        if self.state == OPEN:
+            self.next_probe = 0.0
+            self.probe_interval = self.probe_base
+
+    def _open(self, now):
+        if self.opened_at is None:
+            self.opened_at = now
+        self.state = OPEN
+        self.next_probe = now + self.probe_interval
+
+    def status(self, now=None):
+        """Breaker state for status reporting"""
+        now = time.monotonic() if now is None else now
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "next_probe_in": round(max(0.0, self.next_probe - now), 1) if self.state == OPEN else 0.0
+        }
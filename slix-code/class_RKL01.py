@@ -18,8 +18,12 @@ Communication Examples:
 """
 
 from Modbus_485 import Modbus_Film69
+from modbus_discovery import find_addresses
 
 class SensorWaterLevelRKL01:
+    # Register block read by read_level(): (Modbus_Film69 method, start, count)
+    READ = ("read_holding", 0x0004, 1)
+
     def __init__(self, port="/dev/ttyS4", slave_address=1, baudrate=9600):
         """
         Initialize RKL-01 Water Level Sensor
@@ -56,41 +60,11 @@ class SensorWaterLevelRKL01:
             address = addr if addr is not None else self.slave_address
             
             # Modbus command: Read Holding Register at 0x0004, count 1
-            cmd = f"{address:02X} 03 00 04 00 01"
-            
-            # Expected response length: Address(1) + Function(1) + Byte Count(1) + Data(2) + CRC(2) = 7 bytes
-            response, _ = self.modbus.send(cmd, resopne_len=7, ID=address)
-            
-            parts = response.split()
-            if len(parts) < 7:
-                raise ValueError(f"Invalid response length: {len(parts)}, expected 7")
-            
-            # Check function code
-            if parts[1] != "03":
-                raise ValueError(f"Invalid function code: {parts[1]}, expected 03")
+            # Response: Address(1) + Function(1) + Byte Count(1) + Data(2) + CRC(2) = 7 bytes
+            # (length, function code and CRC are checked by read_holding)
+            result = self.decode(self.modbus.read_block(address, self.READ))
             
-            # Extract water level data (2 bytes)
-            level_high = parts[3]
-            level_low = parts[4]
-            
-            # Combine high and low bytes to get raw value
-            raw_value = int(level_high + level_low, 16)
-            
-            # Convert to water level in meters (divide by 100 as per manual)
-            # water_level = raw_value / 100.0
-
-            sensor_plant_height = 73  # Offset in cm (50 + 23 :50 คือโคนต้นถึงผิวน้ำ 23 คือระยะที่ sensor อยู่)
-            sensor_reading = (raw_value / 10.0)
-            water_level = (sensor_plant_height - sensor_reading) #ค่าที่ได้ออกมาจะเหมือนกับการเอา ultrasonic ไปวัดผิวน้ำถ้าน้ำขึ้นค่าลดถ้าน้ำลดค่าขึ้น
-            
-            result = {
-                "water_level": water_level,
-                "raw_value": raw_value,
-                "success": True,
-                "response_parts": parts
-            }
-            
-            print(f"Water level read: {water_level:.2f}m (raw: {raw_value})")
+            print(f"Water level read: {result['water_level']:.2f}m (raw: {result['raw_value']})")
             return result
             
         except Exception as e:
@@ -102,6 +76,32 @@ class SensorWaterLevelRKL01:
                 "error": str(e)
             }
 
+    def decode(self, registers):
+        """
+        Convert the level register to a result dict
+        
+        Args:
+            registers (tuple): (raw_value,) from register 0x0004
+            
+        Returns:
+            dict: {"water_level": float, "raw_value": int, "success": True, "response_parts": tuple}
+        """
+        raw_value = registers[0]
+        
+        # Convert to water level in meters (divide by 100 as per manual)
+        # water_level = raw_value / 100.0
+
+        sensor_plant_height = 73  # Offset in cm (50 + 23 :50 คือโคนต้นถึงผิวน้ำ 23 คือระยะที่ sensor อยู่)
+        sensor_reading = (raw_value / 10.0)
+        water_level = (sensor_plant_height - sensor_reading) #ค่าที่ได้ออกมาจะเหมือนกับการเอา ultrasonic ไปวัดผิวน้ำถ้าน้ำขึ้นค่าลดถ้าน้ำลดค่าขึ้น
+        
+        return {
+            "water_level": water_level,
+            "raw_value": raw_value,
+            "success": True,
+            "response_parts": registers
+        }
+
     def set_address(self, new_address):
         """
         Set new slave address for RKL-01 sensor
@@ -203,31 +203,8 @@ class SensorWaterLevelRKL01:
         Returns:
             list: List of found device addresses
         """
-        found_devices = []
-        modbus = Modbus_Film69(port=port, slaveaddress=1, baudrate=baudrate)
-        
-        print("Scanning for RKL-01 Water Level Sensors (0x01 to 0xF7)...")
-        
-        for addr in range(1, 248):
-            try:
-                # Try to read water level from each address
-                cmd = f"{addr:02X} 03 00 04 00 01"
-                response, _ = modbus.send(cmd, resopne_len=7, ID=addr)
-                
-                parts = response.split()
-                if len(parts) >= 7 and parts[1] == "03":
-                    # Extract water level
-                    raw_value = int(parts[3] + parts[4], 16)
-                    water_level = raw_value / 100.0
-                    
-                    print(f"  ✅ Found RKL-01 at address 0x{addr:02X} | Water Level: {water_level:.2f}m")
-                    found_devices.append(addr)
-                    
-            except Exception:
-                # No response or invalid response - continue scanning
-                pass
-        
-        modbus.close()
+        print("Scanning for RKL-01 Water Level Sensors (documented range first, then 0x01 to 0xF7)...")
+        found_devices = find_addresses("liquid_level", port, baudrate)
         
         if found_devices:
             print(f"Found {len(found_devices)} RKL-01 sensor(s)")
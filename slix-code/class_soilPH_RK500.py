@@ -18,11 +18,15 @@ Communication Examples:
 - Change Address: 03 06 00 14 00 01 09EC
 """
 
-import struct
 from Modbus_485 import Modbus_Film69
+from modbus_discovery import find_addresses
+from read_planner import read_planned
 
 class SensorSoilPHRK500_22:
-    def __init__(self, port="/dev/ttyS2", slave_address=3, baudrate=9600):
+    # Register block read by read_data(): (Modbus_Film69 method, start, float count)
+    READ = ("read_float32", 0x0000, 3)
+
+    def __init__(self, port="/dev/ttyS2", slave_address=3, baudrate=9600, debug_frames=0):
         """
         Initialize RK500-22 Soil pH Sensor
         
@@ -30,6 +34,8 @@ class SensorSoilPHRK500_22:
             port (str): Serial port path
             slave_address (int): Modbus slave address (1-247, default: 3)
             baudrate (int): Communication baud rate (default: 9600)
+            debug_frames (int): Keep this many raw response frames for
+                get_debug_frames() (default: 0, none kept)
         """
         self.slave_address = slave_address
         self.port = port
@@ -37,6 +43,7 @@ class SensorSoilPHRK500_22:
         
         # Initialize Modbus communication
         self.modbus = Modbus_Film69(port=port, slaveaddress=slave_address, baudrate=baudrate)
+        self.modbus.enable_debug(debug_frames)
         
         print(f"RK500-22 Soil pH Sensor initialized on {port} with address 0x{slave_address:02X}")
 
@@ -56,59 +63,18 @@ class SensorSoilPHRK500_22:
             addr (int, optional): Override slave address for this read
             
         Returns:
-            dict: {"ph_value": float, "temperature": float, "success": bool, "raw_data": dict} or None
+            dict: {"ph_value": float, "temperature": float, "parameter": float, "success": bool}
         """
         try:
             address = addr if addr is not None else self.slave_address
             
             # Modbus command: Read Holding Register starting at 0x0000, count 6
-            cmd = f"{address:02X} 03 00 00 00 06"
-            
-            # Expected response length: Address(1) + Function(1) + Byte Count(1) + Data(12) + CRC(2) = 17 bytes
-            response, _ = self.modbus.send(cmd, resopne_len=17, ID=address)
-            
-            parts = response.split()
-            if len(parts) < 17:
-                raise ValueError(f"Invalid response length: {len(parts)}, expected 17")
-            
-            # Check function code
-            if parts[1] != "03":
-                raise ValueError(f"Invalid function code: {parts[1]}, expected 03")
-            
-            # Check data byte count
-            data_count = int(parts[2], 16)
-            if data_count != 12:  # 0x0C = 12 bytes
-                raise ValueError(f"Invalid data count: {data_count}, expected 12")
-            
-            # Extract floating point data (IEEE 754 format)
-            # Each float is 4 bytes (32-bit)
-            
-            # pH Value (bytes 3-6): 40 E0 51 EC = 7.01
-            ph_bytes = bytes.fromhex("".join(parts[3:7]))
-            ph_value = struct.unpack(">f", ph_bytes)[0]  # Big-endian float
-            
-            # Parameter (bytes 7-10) - Unknown parameter
-            param_bytes = bytes.fromhex("".join(parts[7:11]))
-            param = struct.unpack(">f", param_bytes)[0]
-            
-            # Temperature (bytes 11-14): 41 C9 47 AE = 25.16°C
-            temp_bytes = bytes.fromhex("".join(parts[11:15]))
-            temperature = struct.unpack(">f", temp_bytes)[0]
-            
-            result = {
-                "ph_value": ph_value,            # pH (0-14)
-                "temperature": temperature,      # Temperature in °C
-                "parameter": param,              # Unknown parameter
-                "success": True,
-                "raw_data": {
-                    "ph_bytes": parts[3:7],
-                    "param_bytes": parts[7:11],
-                    "temp_bytes": parts[11:15],
-                    "response_parts": parts
-                }
-            }
+            # Response: Address(1) + Function(1) + Byte Count(1) + Data(12) + CRC(2) = 17 bytes
+            # Data = 3 big-endian IEEE 754 floats (length, header and CRC are checked by read_float32)
+            # pH (40 E0 51 EC = 7.01), parameter, Temperature (41 C9 47 AE = 25.16°C)
+            result = self.decode(self.modbus.read_block(address, self.READ))
             
-            print(f"Soil pH: {ph_value:.2f}, Temperature: {temperature:.1f}°C")
+            print(f"Soil pH: {result['ph_value']:.2f}, Temperature: {result['temperature']:.1f}°C")
             return result
             
         except Exception as e:
@@ -121,6 +87,48 @@ class SensorSoilPHRK500_22:
                 "error": str(e)
             }
 
+    def decode(self, values):
+        """
+        Convert the 3 floats of the READ block to a result dict
+        
+        Args:
+            values (tuple): (ph, parameter, temperature)
+            
+        Returns:
+            dict: {"ph_value", "temperature", "parameter", "success"}
+        """
+        ph_value, param, temperature = values
+        return {
+            "ph_value": ph_value,            # pH (0-14)
+            "temperature": temperature,      # Temperature in °C
+            "parameter": param,              # Unknown parameter
+            "success": True
+        }
+
+    def read_values(self, quantities, addr=None):
+        """
+        Read only the requested quantities (planned by read_planner, so
+        registers that are not needed are skipped when that saves time)
+        
+        Args:
+            quantities (iterable): Any of "ph_value", "parameter", "temperature"
+            addr (int, optional): Override slave address for this read
+            
+        Returns:
+            dict: {quantity: float, "success": bool} (+ "error" on failure)
+        """
+        try:
+            address = addr if addr is not None else self.slave_address
+            result = read_planned(self.modbus, address, "soil_ph", quantities, self.baudrate)
+            result["success"] = True
+            return result
+        except Exception as e:
+            print(f"Read sensor values failed: {e}")
+            result = dict.fromkeys(quantities)
+            result["success"] = False
+            result["error"] = str(e)
+            return result
+
     def read_ph_only(self, addr=None):
         """
         Read only pH value (simplified method)
@@ -128,8 +136,8 @@ class SensorSoilPHRK500_22:
         Returns:
             float: pH value (0-14), or None if failed
         """
-        result = self.read_data(addr)
-        if result and result["success"]:
+        result = self.read_values(("ph_value",), addr)
+        if result["success"]:
             return result["ph_value"]
         return None
 
@@ -140,8 +148,8 @@ class SensorSoilPHRK500_22:
         Returns:
             float: Temperature in °C, or None if failed
         """
-        result = self.read_data(addr)
-        if result and result["success"]:
+        result = self.read_values(("temperature",), addr)
+        if result["success"]:
             return result["temperature"]
         return None
 
@@ -224,6 +232,15 @@ class SensorSoilPHRK500_22:
             "operating_temperature": "0-+80°C"
         }
 
+    def get_debug_frames(self):
+        """
+        Last raw response frames (only kept when created with debug_frames > 0)
+        
+        Returns:
+            list: [(timestamp, slave address, "hex bytes"), ...]
+        """
+        return self.modbus.debug_frames()
+
     def close(self):
         """Close Modbus connection"""
         if hasattr(self.modbus, 'close'):
@@ -242,35 +259,8 @@ class SensorSoilPHRK500_22:
         Returns:
             list: List of found device addresses
         """
-        found_devices = []
-        modbus = Modbus_Film69(port=port, slaveaddress=1, baudrate=baudrate)
-        
-        print("Scanning for RK500-22 Soil pH Sensors (0x01 to 0xF7)...")
-        
-        for addr in range(1, 248):
-            try:
-                # Try to read pH data from each address
-                cmd = f"{addr:02X} 03 00 00 00 06"
-                response, _ = modbus.send(cmd, resopne_len=17, ID=addr)
-                
-                parts = response.split()
-                if len(parts) >= 17 and parts[1] == "03" and parts[2] == "0C":
-                    # Extract pH value
-                    ph_bytes = bytes.fromhex("".join(parts[3:7]))
-                    ph_value = struct.unpack(">f", ph_bytes)[0]
-                    
-                    # Extract Temperature value
-                    temp_bytes = bytes.fromhex("".join(parts[11:15]))
-                    temperature = struct.unpack(">f", temp_bytes)[0]
-                    
-                    print(f"  ✅ Found RK500-22 at address 0x{addr:02X} | pH: {ph_value:.2f}, Temp: {temperature:.1f}°C")
-                    found_devices.append(addr)
-                    
-            except Exception:
-                # No response or invalid response - continue scanning
-                pass
-        
-        modbus.close()
+        print("Scanning for RK500-22 Soil pH Sensors (documented range first, then 0x01 to 0xF7)...")
+        found_devices = find_addresses("soil_ph", port, baudrate)
         
         if found_devices:
             print(f"Found {len(found_devices)} RK500-22 sensor(s)")
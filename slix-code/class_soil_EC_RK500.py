@@ -18,11 +18,15 @@ Communication Examples:
 - Change Address: 0C 06 00 14 00 01 0913
 """
 
-import struct
 from Modbus_485 import Modbus_Film69
+from modbus_discovery import find_addresses
+from read_planner import read_planned
 
 class SensorSoilECRK500_23:
-    def __init__(self, port="/dev/ttyS2", slave_address=4, baudrate=9600):
+    # Register block read by read_data(): (Modbus_Film69 method, start, float count)
+    READ = ("read_float32", 0x0000, 5)
+
+    def __init__(self, port="/dev/ttyS2", slave_address=4, baudrate=9600, debug_frames=0):
         """
         Initialize RK500-23 Soil EC & Salinity Sensor
         
@@ -30,6 +34,8 @@ class SensorSoilECRK500_23:
             port (str): Serial port path
             slave_address (int): Modbus slave address (1-247, default: 4)
             baudrate (int): Communication baud rate (default: 9600)
+            debug_frames (int): Keep this many raw response frames for
+                get_debug_frames() (default: 0, none kept)
         """
         self.slave_address = slave_address
         self.port = port
@@ -37,6 +43,7 @@ class SensorSoilECRK500_23:
         
         # Initialize Modbus communication
         self.modbus = Modbus_Film69(port=port, slaveaddress=slave_address, baudrate=baudrate)
+        self.modbus.enable_debug(debug_frames)
         
         print(f"RK500-23 Soil EC Sensor initialized on {port} with address 0x{slave_address:02X}")
 
@@ -58,71 +65,18 @@ class SensorSoilECRK500_23:
             addr (int, optional): Override slave address for this read
             
         Returns:
-            dict: {"ec_value": float, "salinity": float, "success": bool, "raw_data": dict} or None
+            dict: {"ec_value": float, "salinity": float, "parameter_1".."parameter_3", "success": bool}
         """
         try:
             address = addr if addr is not None else self.slave_address
             
             # Modbus command: Read Holding Register starting at 0x0000, count 10 (0x0A)
-            cmd = f"{address:02X} 03 00 00 00 0A"
-            
-            # Expected response length: Address(1) + Function(1) + Byte Count(1) + Data(20) + CRC(2) = 25 bytes
-            response, _ = self.modbus.send(cmd, resopne_len=25, ID=address)
-            
-            parts = response.split()
-            if len(parts) < 25:
-                raise ValueError(f"Invalid response length: {len(parts)}, expected 25")
-            
-            # Check function code
-            if parts[1] != "03":
-                raise ValueError(f"Invalid function code: {parts[1]}, expected 03")
-            
-            # Check data byte count
-            data_count = int(parts[2], 16)
-            if data_count != 20:  # 0x14 = 20 bytes
-                raise ValueError(f"Invalid data count: {data_count}, expected 20")
-            
-            # Extract floating point data (IEEE 754 format)
-            # Each float is 4 bytes (32-bit)
-            
-            # EC Value (bytes 3-6): 3F 82 DC 81 = 1.022 mS/cm
-            ec_bytes = bytes.fromhex("".join(parts[3:7]))
-            ec_value = struct.unpack(">f", ec_bytes)[0]  # Big-endian float
-            
-            # Parameter 1 (bytes 7-10)
-            param1_bytes = bytes.fromhex("".join(parts[7:11]))
-            param1 = struct.unpack(">f", param1_bytes)[0]
-            
-            # Parameter 2 (bytes 11-14)
-            param2_bytes = bytes.fromhex("".join(parts[11:15]))
-            param2 = struct.unpack(">f", param2_bytes)[0]
-            
-            # Parameter 3 (bytes 15-18)
-            param3_bytes = bytes.fromhex("".join(parts[15:19]))
-            param3 = struct.unpack(">f", param3_bytes)[0]
-            
-            # Salinity (bytes 19-22): 44 0C 92 DF = 562 PPM
-            salinity_bytes = bytes.fromhex("".join(parts[19:23]))
-            salinity = struct.unpack(">f", salinity_bytes)[0]
+            # Response: Address(1) + Function(1) + Byte Count(1) + Data(20) + CRC(2) = 25 bytes
+            # Data = 5 big-endian IEEE 754 floats (length, header and CRC are checked by read_float32)
+            # EC (3F 82 DC 81 = 1.022 mS/cm), param 1-3, Salinity (44 0C 92 DF = 562 PPM)
+            result = self.decode(self.modbus.read_block(address, self.READ))
             
-            result = {
-                "ec_value": ec_value,        # mS/cm (milliSiemens per centimeter)
-                "salinity": salinity,        # PPM (Parts Per Million)
-                "parameter_1": param1,       # Unknown parameter
-                "parameter_2": param2,       # Unknown parameter
-                "parameter_3": param3,       # Unknown parameter
-                "success": True,
-                "raw_data": {
-                    "ec_bytes": parts[3:7],
-                    "param1_bytes": parts[7:11],
-                    "param2_bytes": parts[11:15],
-                    "param3_bytes": parts[15:19],
-                    "salinity_bytes": parts[19:23],
-                    "response_parts": parts
-                }
-            }
-            
-            print(f"Soil EC: {ec_value:.3f} mS/cm, Salinity: {salinity:.1f} PPM")
+            print(f"Soil EC: {result['ec_value']:.3f} mS/cm, Salinity: {result['salinity']:.1f} PPM")
             return result
             
         except Exception as e:
@@ -137,6 +91,50 @@ class SensorSoilECRK500_23:
                 "error": str(e)
             }
 
+    def decode(self, values):
+        """
+        Convert the 5 floats of the READ block to a result dict
+        
+        Args:
+            values (tuple): (ec, param1, param2, param3, salinity)
+            
+        Returns:
+            dict: {"ec_value", "salinity", "parameter_1".."parameter_3", "success"}
+        """
+        ec_value, param1, param2, param3, salinity = values
+        return {
+            "ec_value": ec_value,        # mS/cm (milliSiemens per centimeter)
+            "salinity": salinity,        # PPM (Parts Per Million)
+            "parameter_1": param1,       # Unknown parameter
+            "parameter_2": param2,       # Unknown parameter
+            "parameter_3": param3,       # Unknown parameter
+            "success": True
+        }
+
+    def read_values(self, quantities, addr=None):
+        """
+        Read only the requested quantities (planned by read_planner, so
+        registers that are not needed are skipped when that saves time)
+        
+        Args:
+            quantities (iterable): Any of "ec_value", "salinity", "parameter_1".."parameter_3"
+            addr (int, optional): Override slave address for this read
+            
+        Returns:
+            dict: {quantity: float, "success": bool} (+ "error" on failure)
+        """
+        try:
+            address = addr if addr is not None else self.slave_address
+            result = read_planned(self.modbus, address, "soil_ec", quantities, self.baudrate)
+            result["success"] = True
+            return result
+        except Exception as e:
+            print(f"Read sensor values failed: {e}")
+            result = dict.fromkeys(quantities)
+            result["success"] = False
+            result["error"] = str(e)
+            return result
+
     def read_ec_only(self, addr=None):
         """
         Read only EC value (simplified method)
@@ -144,8 +142,8 @@ class SensorSoilECRK500_23:
         Returns:
             float: EC value in mS/cm, or None if failed
         """
-        result = self.read_data(addr)
-        if result and result["success"]:
+        result = self.read_values(("ec_value",), addr)
+        if result["success"]:
             return result["ec_value"]
         return None
 
@@ -156,8 +154,8 @@ class SensorSoilECRK500_23:
         Returns:
             float: Salinity in PPM, or None if failed
         """
-        result = self.read_data(addr)
-        if result and result["success"]:
+        result = self.read_values(("salinity",), addr)
+        if result["success"]:
             return result["salinity"]
         return None
 
@@ -241,6 +239,15 @@ class SensorSoilECRK500_23:
             "operating_temperature": "0-50°C"
         }
 
+    def get_debug_frames(self):
+        """
+        Last raw response frames (only kept when created with debug_frames > 0)
+        
+        Returns:
+            list: [(timestamp, slave address, "hex bytes"), ...]
+        """
+        return self.modbus.debug_frames()
+
     def close(self):
         """Close Modbus connection"""
         if hasattr(self.modbus, 'close'):
@@ -259,35 +266,8 @@ class SensorSoilECRK500_23:
         Returns:
             list: List of found device addresses
         """
-        found_devices = []
-        modbus = Modbus_Film69(port=port, slaveaddress=1, baudrate=baudrate)
-        
-        print("Scanning for RK500-23 Soil EC Sensors (0x01 to 0xF7)...")
-        
-        for addr in range(1, 248):
-            try:
-                # Try to read EC data from each address
-                cmd = f"{addr:02X} 03 00 00 00 0A"
-                response, _ = modbus.send(cmd, resopne_len=25, ID=addr)
-                
-                parts = response.split()
-                if len(parts) >= 25 and parts[1] == "03" and parts[2] == "14":
-                    # Extract EC value
-                    ec_bytes = bytes.fromhex("".join(parts[3:7]))
-                    ec_value = struct.unpack(">f", ec_bytes)[0]
-                    
-                    # Extract Salinity value
-                    salinity_bytes = bytes.fromhex("".join(parts[19:23]))
-                    salinity = struct.unpack(">f", salinity_bytes)[0]
-                    
-                    print(f"  ✅ Found RK500-23 at address 0x{addr:02X} | EC: {ec_value:.3f} mS/cm, Salinity: {salinity:.1f} PPM")
-                    found_devices.append(addr)
-                    
-            except Exception:
-                # No response or invalid response - continue scanning
-                pass
-        
-        modbus.close()
+        print("Scanning for RK500-23 Soil EC Sensors (documented range first, then 0x01 to 0xF7)...")
+        found_devices = find_addresses("soil_ec", port, baudrate)
         
         if found_devices:
             print(f"Found {len(found_devices)} RK500-23 sensor(s)")
@@ -19,8 +19,12 @@
 
 # Second Class
 from Modbus_485 import Modbus_Film69
+from modbus_discovery import find_addresses
 
 class SensorSoilMoistureTemp:
+    # Register block read by read_data(): (Modbus_Film69 method, start, count)
+    READ = ("read_holding", 0x0000, 2)
+
     def __init__(self, port="/dev/ttyS2", slave_address=1, baudrate=9600):
         self.slave_address = slave_address
         self.modbus = Modbus_Film69()
@@ -35,26 +39,24 @@ class SensorSoilMoistureTemp:
         try:
             # response, _ = self.modbus.send("01 03 00 00 00 02", resopne_len=9, ID=self.slave_address)
             address = addr if addr is not None else self.slave_address
-            cmd = f"{address:02X} 03 00 00 00 02"
-            response, _ = self.modbus.send(cmd, resopne_len=9, ID=address)
-            parts = response.split()
-            if len(parts) < 9:
-                raise ValueError("Invalid response length")
-
-            # แปลงอุณหภูมิ
-            temp_raw = int(parts[3] + parts[4], 16)
-            temp = self._parse_signed(temp_raw) / 10.0
-
-            # แปลงความชื้น
-            moist_raw = int(parts[5] + parts[6], 16)
-            moisture = moist_raw / 10.0
-
-            return {"soil_temperature": temp, "soil_moisture": moisture, "Bit":parts}
+            return self.decode(self.modbus.read_block(address, self.READ))
             
         except Exception as e:
             print(f"Read failed: {e}")
             return None
 
+    def decode(self, registers):
+        """แปลงค่า register (temp, moisture) เป็น dict"""
+        temp_raw, moist_raw = registers
+
+        # แปลงอุณหภูมิ
+        temp = self._parse_signed(temp_raw) / 10.0
+
+        # แปลงความชื้น
+        moisture = moist_raw / 10.0
+
+        return {"soil_temperature": temp, "soil_moisture": moisture, "Bit":registers}
+
     def set_address(self, new_address):
         """
         ตั้งค่า slave address ใหม่ (ต้องรีสตาร์ท sensor จึงจะมีผล)
@@ -82,33 +84,8 @@ class SensorSoilMoistureTemp:
 
     @staticmethod
     def scan_addresses(port="/dev/ttyS2", baudrate=9600):
-        found_devices = []
-        modbus = Modbus_Film69(port=port, slaveaddress=1, baudrate=baudrate)
-
-        print("Scanning Modbus addresses from 0x01 to 0xF7...")
-        for addr in range(1, 248):
-            try:
-                cmd = f"{addr:02X} 03 00 00 00 02" 
-                response, _ = modbus.send(cmd, resopne_len=9, ID=addr)
-                parts = response.split()
-                if len(parts) < 9:
-                    continue
-
-              
-                temp_raw = int(parts[3] + parts[4], 16)
-                temp = temp_raw if temp_raw < 0x8000 else temp_raw - 0x10000
-                temp = temp / 100.0
-
-                moist_raw = int(parts[5] + parts[6], 16)
-                moisture = moist_raw / 100.0
-
-                print(f" Found device at address: 0x{addr:02X} | Temp: {temp:.2f} °C, Moisture: {moisture:.2f} %")
-                found_devices.append(addr)
-
-            except Exception:
-                pass
-
-        modbus.close()
+        print("Scanning for soil sensors (documented range first, then 0x01 to 0xF7)...")
+        found_devices = find_addresses("soil", port, baudrate)
         return found_devices
 
 
@@ -1,6 +1,9 @@
 from Modbus_485 import Modbus_Film69
 
 class SensorPyranometer:
+    # Register block read by read_radiation(): (Modbus_Film69 method, start, count)
+    READ = ("read_holding", 0x0000, 1)
+
     def __init__(self, port="/dev/ttyS2", slave_address=1, baudrate=9600):
         self.slave_address = slave_address
         self.modbus = Modbus_Film69(port=port, slaveaddress=slave_address, baudrate=baudrate)
@@ -8,19 +11,16 @@ class SensorPyranometer:
     def read_radiation(self, addr=None):
         try:
             address = addr if addr is not None else self.slave_address
-            command = f"{address:02X} 03 00 00 00 01"
-            response, _ = self.modbus.send(command, resopne_len=7, ID=address)
-            parts = response.split()
-            if len(parts) < 7:
-                raise ValueError("Invalid response length")
-
-            radiation_raw = int(parts[3] + parts[4], 16)
-            return {"radiation": radiation_raw}  # หน่วย: W/m²
+            return self.decode(self.modbus.read_block(address, self.READ))
 
         except Exception as e:
             print(f"Read failed: {e}")
             return None
 
+    def decode(self, registers):
+        radiation_raw, = registers
+        return {"radiation": radiation_raw}  # หน่วย: W/m²
+
     def set_address(self, new_address):
         """
         เปลี่ยน slave address ใหม่ (ใช้ Function Code 0x10)
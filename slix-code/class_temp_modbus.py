@@ -1,17 +1,22 @@
-import serial
-import time
 import struct
+from rs485_bus import get_bus
+from modbus_crc import crc16, verify_crc, request_frame
+from modbus_errors import exception_from_response
 
 class SensorAirTempHumidityRS30:
     """
     Class สำหรับ Sensor ATO Waterproof Temp & Humidity (SN-3000-WS-N01)
     Reference: ATO-Waterproof-Temperature-Humidity-Sensor-Probe-Manual
     """
+    # Register block read by read_temp(): (method, start, count) for modbus_async
+    READ = ("read_holding", 0x0000, 2)
+
     def __init__(self, port="/dev/ttyS2", slave_address=1, baudrate=9600, timeout=1.0):
         self.port = port
         self.slave_address = slave_address
         self.baudrate = baudrate
         self.timeout = timeout
+        self.bus = get_bus(port, baudrate=baudrate, timeout=timeout)
         
         # Mapping ค่า Baudrate ตามคู่มือ 
         self.BAUD_MAP = {
@@ -24,61 +29,40 @@ class SensorAirTempHumidityRS30:
     @staticmethod
     def modbus_crc(data):
         """คำนวณ CRC16 ตามมาตรฐาน Modbus"""
-        crc = 0xFFFF
-        for pos in data:
-            crc ^= pos
-            for _ in range(8):
-                if (crc & 1) != 0:
-                    crc = (crc >> 1) ^ 0xA001
-                else:
-                    crc >>= 1
-        return crc
+        return crc16(data)
 
     def _send_command(self, address, function_code, start_reg, data_val):
         """ส่งคำสั่ง Modbus พื้นฐาน"""
         try:
-            ser = serial.Serial(
-                port=self.port, 
-                baudrate=self.baudrate, 
-                bytesize=8, 
-                parity='N', 
-                stopbits=1, 
-                timeout=self.timeout
-            )
-            
             # สร้าง Command Frame [Addr, Func, RegH, RegL, DataH, DataL, CRCL, CRCH]
-            cmd = [address, function_code, (start_reg >> 8) & 0xFF, start_reg & 0xFF, (data_val >> 8) & 0xFF, data_val & 0xFF]
-            crc = self.modbus_crc(cmd)
-            cmd.append(crc & 0xFF)
-            cmd.append((crc >> 8) & 0xFF)
+            cmd = request_frame(address, function_code, start_reg, data_val)
             
-            # ส่งข้อมูล
+            # ส่งข้อมูลผ่าน bus ที่เปิดค้างไว้ (ไม่เปิด/ปิด port ทุกครั้ง)
             # print(f"TX: {[hex(x) for x in cmd]}") # Debug
-            ser.reset_input_buffer()
-            ser.write(bytearray(cmd))
             
-            # รอรับข้อมูล (Response ความยาวขึ้นอยู่กับ Function)
+            # รอรับข้อมูล (Response ความยาวขึ้นอยู่กับ Function, bus คำนวณจาก header)
             # F03 (Read) = Addr(1) + Func(1) + Len(1) + Data(N) + CRC(2)
             # F06 (Write) = Addr(1) + Func(1) + Reg(2) + Val(2) + CRC(2) = 8 Bytes
-            
-            time.sleep(0.1) # รอ Processing time ของ Sensor [cite: 23]
-            response = ser.read(128) # อ่านเข้ามาก่อน
-            ser.close()
+            # คืนค่าทันทีที่ได้ครบ frame ไม่ต้องรอ timeout
+            response = self.bus.transaction(cmd, baudrate=self.baudrate, timeout=self.timeout)
             
             if len(response) < 5:
                 return None, "No response or incomplete"
+
+            # Exception frame (func | 0x80) เช่น Illegal data address
+            exc = exception_from_response(response)
+            if exc is not None:
+                return None, str(exc)
                 
             # ตรวจสอบ CRC ตอบกลับ
-            resp_list = list(response)
-            # print(f"RX: {[hex(x) for x in resp_list]}") # Debug
-            
-            msg_crc = (resp_list[-1] << 8) | resp_list[-2]
-            calc_crc = self.modbus_crc(resp_list[:-2])
+            # print(f"RX: {[hex(x) for x in response]}") # Debug
             
-            if msg_crc != calc_crc:
+            if not verify_crc(response):
+                msg_crc = (response[-1] << 8) | response[-2]
+                calc_crc = crc16(response[:-2])
                 return None, f"CRC Error (Exp: {hex(calc_crc)}, Got: {hex(msg_crc)})"
                 
-            return resp_list, None
+            return list(response), None
             
         except Exception as e:
             return None, f"Serial Error: {e}"
@@ -99,24 +83,28 @@ class SensorAirTempHumidityRS30:
             # Response: [Addr, 03, Bytes, HumH, HumL, TempH, TempL, CRCL, CRCH]
             if len(resp) < 9: return None
             
-            # Humidity (0x0000)
-            hum_raw = (resp[3] << 8) | resp[4]
-            humidity = hum_raw / 10.0
-            
-            # Temperature (0x0001) - Signed Value! [cite: 198]
-            temp_raw = (resp[5] << 8) | resp[6]
-            if temp_raw >= 0x8000:
-                temp_raw -= 0x10000 # แปลง Two's complement
-            temperature = temp_raw / 10.0
-            
-            return {
-                "temperature": round(temperature, 1),
-                "humidity": round(humidity, 1)
-            }
+            return self.decode(((resp[3] << 8) | resp[4], (resp[5] << 8) | resp[6]))
         except Exception as e:
             print(f"Parse Error: {e}")
             return None
 
+    def decode(self, registers):
+        """แปลง register (Hum, Temp) เป็น dict"""
+        hum_raw, temp_raw = registers
+
+        # Humidity (0x0000)
+        humidity = hum_raw / 10.0
+        
+        # Temperature (0x0001) - Signed Value! [cite: 198]
+        if temp_raw >= 0x8000:
+            temp_raw -= 0x10000 # แปลง Two's complement
+        temperature = temp_raw / 10.0
+        
+        return {
+            "temperature": round(temperature, 1),
+            "humidity": round(humidity, 1)
+        }
+
     # --- 1. เช็ค Address ของ Sensor (Check Address) ---
     def check_address(self):
         """
@@ -1,31 +1,32 @@
-import serial
 import time
 import json
+from rs485_bus import get_bus
+from modbus_crc import crc16, verify_crc, request_frame
+from modbus_errors import exception_from_response, BusDeadlineExceeded
+from retry_policy import get_policy
 
 class UltrasonicModbus:
+    # Register block read by read_distance(): (method, start, count) for modbus_async
+    READ = ("read_holding", 0x0000, 1)
+
     def __init__(self, port="/dev/ttyS2", slave_address=0x32, baudrate=4800, timeout=1.0):
         self.port = port
         self.slave_address = slave_address
         self.baudrate = baudrate
         self.timeout = timeout
+        self.bus = get_bus(port, baudrate=baudrate, timeout=timeout)
 
     @staticmethod
     def modbus_crc(buf):
-        crc = 0xFFFF
-        for b in buf:
-            crc ^= b
-            for _ in range(8):
-                if crc & 1:
-                    crc = (crc >> 1) ^ 0xA001
-                else:
-                    crc >>= 1
-        return crc
-
-    def read_distance(self, max_attempts=5, delay_between=0.001):
-        cmd = [self.slave_address, 0x03, 0x00, 0x00, 0x00, 0x01]
-        crc = self.modbus_crc(cmd)
-        cmd.append(crc & 0xFF)          # CRC Low
-        cmd.append((crc >> 8) & 0xFF)   # CRC High
+        return crc16(buf)
+
+    def read_distance(self, max_attempts=None, delay_between=None):
+        # max_attempts=None: ใช้ retry budget ตามประวัติของ device (retry_policy,
+        # บันทึกผลโดย main loop ทุกรอบ)
+        if max_attempts is None:
+            max_attempts = get_policy(self.port, self.slave_address).attempts(5)
+
+        cmd = request_frame(self.slave_address, 0x03, 0x0000, 1)
 
         result = {
             "port": self.port,
@@ -40,37 +41,45 @@ class UltrasonicModbus:
         }
 
         try:
-            ser = serial.Serial(self.port, baudrate=self.baudrate, bytesize=8, parity="N", stopbits=1, timeout=self.timeout)
+            self.bus.open()
         except Exception as e:
             result["error"] = f"Serial error: {e}"
             return result
 
         value = None
         for attempt in range(1, max_attempts + 1):
-            ser.reset_input_buffer()
-            ser.write(bytearray(cmd))
-            ser.flush()
-            resp = ser.read(7)
+            try:
+                # timeout ถูกตัดตามเวลาที่เหลือของ deadline (แบ่งให้ทุก attempt ที่เหลือ)
+                timeout = self.bus.budget(self.timeout, max_attempts - attempt + 1)
+                resp = self.bus.transaction(cmd, baudrate=self.baudrate, timeout=timeout)
+            except BusDeadlineExceeded as e:
+                result["error"] = str(e)
+                break
             print(f"[Attempt {attempt}] Raw response bytes: {list(resp)}")
             result["raw"] = list(resp)
             result["attempts"] = attempt
 
-            if len(resp) != 7:
-                time.sleep(delay_between)
+            # Exception frame (func | 0x80): ไม่ต้องรอ/ลองซ้ำถ้า slave ปฏิเสธคำสั่ง
+            exc = exception_from_response(resp)
+            if exc is not None:
+                result["error"] = str(exc)
+                result["exception_code"] = exc.code
+                if not exc.retryable:
+                    break
+                self.bus.sleep(delay_between)
                 continue
 
-            addr, func, bytecount, hi, lo, crc_l, crc_h = resp
-            resp_frame = [addr, func, bytecount, hi, lo]
-            crc_calc = self.modbus_crc(resp_frame)
+            if len(resp) != 7:
+                self.bus.sleep(delay_between)
+                continue
 
-            if (crc_l != (crc_calc & 0xFF)) or (crc_h != ((crc_calc >> 8) & 0xFF)):
+            if not verify_crc(resp):
                 result["crc_error"] = True
-                time.sleep(delay_between)
+                self.bus.sleep(delay_between)
                 continue
 
-            value = (hi << 8) | lo
-            result["distance_cm"] = value
-            result["distance_formula"] = 147 - value  # ตัวอย่างสูตรแปลงเป็นระยะทางจริง (ปรับตามการสอบเทียบ)
+            value = (resp[3] << 8) | resp[4]
+            result.update(self.decode((value,)))
             result["crc_error"] = False
             result["success"] = True
             result["timestamp"] = int(time.time())
@@ -78,23 +87,27 @@ class UltrasonicModbus:
         else:
             result["success"] = False
 
-        ser.close()
         return result
 
+    def decode(self, registers):
+        """ระยะทาง (cm) จาก register 0x0000"""
+        value, = registers
+        return {
+            "distance_cm": value,
+            "distance_formula": 147 - value  # ตัวอย่างสูตรแปลงเป็นระยะทางจริง (ปรับตามการสอบเทียบ)
+        }
+
     def read_json(self):
         """Return result as JSON string"""
         return json.dumps(self.read_tip(), ensure_ascii=False)
 
     # ========== ฟังก์ชันใหม่: เช็ค Address ปัจจุบัน ==========
-    def check_address(self, max_attempts=3, delay_between=0.5):
+    def check_address(self, max_attempts=3, delay_between=None):
         """
         อ่าน address ปัจจุบันของ slave device
         ใช้ Function 0x03 อ่าน Register 0x0100
         """
-        cmd = [self.slave_address, 0x03, 0x01, 0x00, 0x00, 0x01]
-        crc = self.modbus_crc(cmd)
-        cmd.append(crc & 0xFF)
-        cmd.append((crc >> 8) & 0xFF)
+        cmd = request_frame(self.slave_address, 0x03, 0x0100, 1)
 
         result = {
             "port": self.port,
@@ -108,33 +121,42 @@ class UltrasonicModbus:
         }
 
         try:
-            ser = serial.Serial(self.port, baudrate=self.baudrate, bytesize=8, parity="N", stopbits=1, timeout=self.timeout)
+            self.bus.open()
         except Exception as e:
             result["error"] = f"Serial error: {e}"
             return result
 
         for attempt in range(1, max_attempts + 1):
-            ser.reset_input_buffer()
-            ser.write(bytearray(cmd))
-            ser.flush()
-            resp = ser.read(7)
+            try:
+                # timeout ถูกตัดตามเวลาที่เหลือของ deadline (แบ่งให้ทุก attempt ที่เหลือ)
+                timeout = self.bus.budget(self.timeout, max_attempts - attempt + 1)
+                resp = self.bus.transaction(cmd, baudrate=self.baudrate, timeout=timeout)
+            except BusDeadlineExceeded as e:
+                result["error"] = str(e)
+                break
             result["raw"] = list(resp)
             result["attempts"] = attempt
 
-            if len(resp) != 7:
-                time.sleep(delay_between)
+            # Exception frame (func | 0x80): ไม่ต้องรอ/ลองซ้ำถ้า slave ปฏิเสธคำสั่ง
+            exc = exception_from_response(resp)
+            if exc is not None:
+                result["error"] = str(exc)
+                result["exception_code"] = exc.code
+                if not exc.retryable:
+                    break
+                self.bus.sleep(delay_between)
                 continue
 
-            addr, func, bytecount, hi, lo, crc_l, crc_h = resp
-            resp_frame = [addr, func, bytecount, hi, lo]
-            crc_calc = self.modbus_crc(resp_frame)
+            if len(resp) != 7:
+                self.bus.sleep(delay_between)
+                continue
 
-            if (crc_l != (crc_calc & 0xFF)) or (crc_h != ((crc_calc >> 8) & 0xFF)):
+            if not verify_crc(resp):
                 result["crc_error"] = True
-                time.sleep(delay_between)
+                self.bus.sleep(delay_between)
                 continue
 
-            current_addr = lo  # Address อยู่ใน byte ต่ำ
+            current_addr = resp[4]  # Address อยู่ใน byte ต่ำ
             result["current_address"] = f"0x{current_addr:02X}"
             result["current_address_decimal"] = current_addr
             result["crc_error"] = False
@@ -144,11 +166,10 @@ class UltrasonicModbus:
         else:
             result["success"] = False
 
-        ser.close()
         return result
 
     # ========== ฟังก์ชันใหม่: เปลี่ยน Address ==========
-    def change_address(self, new_address, max_attempts=3, delay_between=0.5):
+    def change_address(self, new_address, max_attempts=3, delay_between=None):
         """
         เปลี่ยน address ของ slave device
         ใช้ Function 0x06 เขียน Register 0x0100
@@ -160,10 +181,7 @@ class UltrasonicModbus:
                 "success": False
             }
 
-        cmd = [self.slave_address, 0x06, 0x01, 0x00, 0x00, new_address]
-        crc = self.modbus_crc(cmd)
-        cmd.append(crc & 0xFF)
-        cmd.append((crc >> 8) & 0xFF)
+        cmd = request_frame(self.slave_address, 0x06, 0x0100, new_address)
 
         result = {
             "port": self.port,
@@ -177,31 +195,40 @@ class UltrasonicModbus:
         }
 
         try:
-            ser = serial.Serial(self.port, baudrate=self.baudrate, bytesize=8, parity="N", stopbits=1, timeout=self.timeout)
+            self.bus.open()
         except Exception as e:
             result["error"] = f"Serial error: {e}"
             return result
 
         for attempt in range(1, max_attempts + 1):
-            ser.reset_input_buffer()
-            ser.write(bytearray(cmd))
-            ser.flush()
-            resp = ser.read(8)
+            try:
+                # timeout ถูกตัดตามเวลาที่เหลือของ deadline (แบ่งให้ทุก attempt ที่เหลือ)
+                timeout = self.bus.budget(self.timeout, max_attempts - attempt + 1)
+                resp = self.bus.transaction(cmd, baudrate=self.baudrate, timeout=timeout)
+            except BusDeadlineExceeded as e:
+                result["error"] = str(e)
+                break
             result["raw"] = list(resp)
             result["attempts"] = attempt
 
+            # Exception frame (func | 0x80): ไม่ต้องรอ/ลองซ้ำถ้า slave ปฏิเสธคำสั่ง
+            exc = exception_from_response(resp)
+            if exc is not None:
+                result["error"] = str(exc)
+                result["exception_code"] = exc.code
+                if not exc.retryable:
+                    break
+                self.bus.sleep(delay_between)
+                continue
+
             if len(resp) != 8:
-                time.sleep(delay_between)
+                self.bus.sleep(delay_between)
                 continue
 
             # ตรวจสอบว่า response เป็น echo ของคำสั่งที่ส่งไป
-            resp_frame = list(resp[:6])
-            crc_calc = self.modbus_crc(resp_frame)
-            crc_l, crc_h = resp[6], resp[7]
-
-            if (crc_l != (crc_calc & 0xFF)) or (crc_h != ((crc_calc >> 8) & 0xFF)):
+            if not verify_crc(resp):
                 result["crc_error"] = True
-                time.sleep(delay_between)
+                self.bus.sleep(delay_between)
                 continue
 
             result["crc_error"] = False
@@ -215,20 +242,16 @@ class UltrasonicModbus:
         else:
             result["success"] = False
 
-        ser.close()
         return result
 
     # ========== ฟังก์ชันใหม่: Reset Address ==========
-    def reset_address(self, default_address=0x32, max_attempts=3, delay_between=0.5):
+    def reset_address(self, default_address=0x32, max_attempts=3, delay_between=None):
         """
         Reset address กลับไปเป็นค่าเริ่มต้น
         ใช้ Function 0x06 เขียน Register 0x0200
         default_address: address เริ่มต้น (ปกติคือ 0x32)
         """
-        cmd = [self.slave_address, 0x06, 0x02, 0x00, 0x00, 0x00]
-        crc = self.modbus_crc(cmd)
-        cmd.append(crc & 0xFF)
-        cmd.append((crc >> 8) & 0xFF)
+        cmd = request_frame(self.slave_address, 0x06, 0x0200, 0)
 
         result = {
             "port": self.port,
@@ -242,31 +265,40 @@ class UltrasonicModbus:
         }
 
         try:
-            ser = serial.Serial(self.port, baudrate=self.baudrate, bytesize=8, parity="N", stopbits=1, timeout=self.timeout)
+            self.bus.open()
         except Exception as e:
             result["error"] = f"Serial error: {e}"
             return result
 
         for attempt in range(1, max_attempts + 1):
-            ser.reset_input_buffer()
-            ser.write(bytearray(cmd))
-            ser.flush()
-            resp = ser.read(8)
+            try:
+                # timeout ถูกตัดตามเวลาที่เหลือของ deadline (แบ่งให้ทุก attempt ที่เหลือ)
+                timeout = self.bus.budget(self.timeout, max_attempts - attempt + 1)
+                resp = self.bus.transaction(cmd, baudrate=self.baudrate, timeout=timeout)
+            except BusDeadlineExceeded as e:
+                result["error"] = str(e)
+                break
             result["raw"] = list(resp)
             result["attempts"] = attempt
 
+            # Exception frame (func | 0x80): ไม่ต้องรอ/ลองซ้ำถ้า slave ปฏิเสธคำสั่ง
+            exc = exception_from_response(resp)
+            if exc is not None:
+                result["error"] = str(exc)
+                result["exception_code"] = exc.code
+                if not exc.retryable:
+                    break
+                self.bus.sleep(delay_between)
+                continue
+
             if len(resp) != 8:
-                time.sleep(delay_between)
+                self.bus.sleep(delay_between)
                 continue
 
             # ตรวจสอบ CRC
-            resp_frame = list(resp[:6])
-            crc_calc = self.modbus_crc(resp_frame)
-            crc_l, crc_h = resp[6], resp[7]
-
-            if (crc_l != (crc_calc & 0xFF)) or (crc_h != ((crc_calc >> 8) & 0xFF)):
+            if not verify_crc(resp):
                 result["crc_error"] = True
-                time.sleep(delay_between)
+                self.bus.sleep(delay_between)
                 continue
 
             result["crc_error"] = False
@@ -280,7 +312,6 @@ class UltrasonicModbus:
         else:
             result["success"] = False
 
-        ser.close()
         return result
 
 
@@ -1,6 +1,9 @@
 from Modbus_485 import Modbus_Film69
 
 class SensorWindSpeedDirection:
+    # Register block read by read_wind(): (Modbus_Film69 method, start, count)
+    READ = ("read_holding", 0x0000, 2)
+
     def __init__(self, port="/dev/ttyS2", slave_address=1, baudrate=9600):
         self.slave_address = slave_address
         self.modbus = Modbus_Film69(port=port, slaveaddress=slave_address, baudrate=baudrate)
@@ -15,24 +18,20 @@ class SensorWindSpeedDirection:
         """
         try:
             address = addr if addr is not None else self.slave_address
-            cmd = f"{address:02X} 03 00 00 00 02"
-            response, _ = self.modbus.send(cmd, resopne_len=9, ID=address)
-            parts = response.split()
-            if len(parts) < 9:
-                raise ValueError("Invalid response")
-
-            speed_raw = int(parts[3] + parts[4], 16)
-            direction_raw = int(parts[5] + parts[6], 16)
-
-            return {
-                "wind_speed": round(speed_raw / 10.0, 1),   # m/s
-                "wind_direction": direction_raw,             # degree
-                "Respond": parts
-            }
+            return self.decode(self.modbus.read_block(address, self.READ))
         except Exception as e:
             print(f"Read failed: {e}")
             return None
 
+    def decode(self, registers):
+        """แปลงค่า register (speed, direction) เป็น dict"""
+        speed_raw, direction_raw = registers
+        return {
+            "wind_speed": round(speed_raw / 10.0, 1),   # m/s
+            "wind_direction": direction_raw,             # degree
+            "Respond": registers
+        }
+
     def set_address(self, new_address):
         """
         เปลี่ยน slave address (ใช้ Function 06, address register: 0x0020)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Raw RS485 frame recorder
+
+Capture mode of the bus layer (RS485Bus.start_recording()): every request
+written and every response read is appended to a compact binary log with
+its monotonic timestamp, so a misbehaving field box can be examined and
+replayed (frame_replay.py) instead of guessed at from the print log.
+
+File layout:
+    header  "SLXF", version (1 byte), wall-clock time (double),
+            monotonic time in µs (uint64) at the moment the file was opened
+    record  kind (1 byte), monotonic µs (uint64), length (uint16), payload
+            kind: TX request, RX response (empty on timeout),
+                  LINE baud rate (uint32) when the line speed changes
+
+Files rotate at max_bytes: bus.bin -> bus.bin.1 -> ... -> bus.bin.<backups>
+(oldest dropped), like logging's RotatingFileHandler.
+
+Usage:
+    bus.start_recording("/root/rs485_capture/ttyS2.bin")
+    ...
+    for kind, t, payload in read_log("/root/rs485_capture/ttyS2.bin"):
+        print(kind, t, payload.hex(" "))
+"""
+
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"SLXF"
+VERSION = 1
+HEADER = struct.Struct(">4sBdQ")
+RECORD = struct.Struct(">BQH")
+
+TX = 0
+RX = 1
+LINE = 2
+KIND_NAMES = {TX: "tx", RX: "rx", LINE: "line"}
+
+MAX_BYTES = 4 * 1024 * 1024
+BACKUPS = 20
+FLUSH_INTERVAL = 1.0  # s: a crash loses at most this much capture
+
+
+def _now_us():
+    return int(time.monotonic() * 1e6)
+
+
+class FrameRecorder:
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS):
+        """
+        Open (append to) a capture log
+
+        Args:
+            path (str): Log file path (directory is created)
+            max_bytes (int): Rotate when the file grows beyond this size
+            backups (int): Rotated files kept
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock = threading.Lock()
+        self.file = None
+        self.baudrate = None
+        self.last_flush = 0.0
+        self.records = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION, time.time(), _now_us()))
+        self.baudrate = None  # every file starts with its own LINE record
+
+    def _rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _write(self, kind, payload, timestamp=None):
+        with self.lock:
+            if self.file is None:
+                return
+            if self.file.tell() >= self.max_bytes:
+                self._rotate()
+            self.file.write(RECORD.pack(kind, timestamp or _now_us(), len(payload)) + payload)
+            self.records += 1
+            now = time.monotonic()
+            if now - self.last_flush >= FLUSH_INTERVAL:
+                self.file.flush()
+                self.last_flush = now
+
+    def tx(self, frame, baudrate):
+        """Record a request as it is written (and the line speed if it changed)"""
+        if baudrate != self.baudrate:
+            self._write(LINE, struct.pack(">I", baudrate))
+            self.baudrate = baudrate
+        self._write(TX, bytes(frame))
+
+    def rx(self, frame):
+        """Record a response (empty: nothing arrived before the timeout)"""
+        self._write(RX, bytes(frame))
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def log_files(path):
+    """Capture files of one log, oldest first"""
+    rotated = []
+    directory = os.path.dirname(path) or "."
+    prefix = os.path.basename(path) + "."
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            rotated.append((int(name[len(prefix):]), os.path.join(directory, name)))
+    files = [name for _, name in sorted(rotated, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_log(path, rotated=True):
+    """
+    Iterate over the records of a capture log
+
+    Args:
+        path (str): Log file path
+        rotated (bool): Include the rotated files (oldest first)
+
+    Yields:
+        tuple: (kind, monotonic seconds, payload bytes); LINE payload is the baud rate (int)
+    """
+    for name in (log_files(path) if rotated else [path]):
+        with open(name, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or header[:4] != MAGIC:
+                print(f"⚠️ {name}: not a frame capture")
+                continue
+            while True:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    break
+                kind, timestamp, length = RECORD.unpack(head)
+                payload = f.read(length)
+                if len(payload) < length:
+                    break  # truncated by power loss
+                if kind == LINE:
+                    payload = struct.unpack(">I", payload)[0]
+                yield kind, timestamp / 1e6, payload
+
+
+def exchanges(path, rotated=True):
+    """
+    Pair requests with their responses
+
+    Yields:
+        tuple: (monotonic seconds, baudrate, request, response, round trip seconds)
+    """
+    baudrate = None
+    pending = None
+    for kind, timestamp, payload in read_log(path, rotated):
+        if kind == LINE:
+            baudrate = payload
+        elif kind == TX:
+            pending = (timestamp, payload)
+        elif kind == RX and pending is not None:
+            yield pending[0], baudrate, pending[1], payload, timestamp - pending[0]
+            pending = None
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Deterministic replay of a recorded RS485 session
+
+ReplayBus stands in for the RS485Bus of a port and answers each request
+with the response recorded for it (frame_recorder.py capture), so the
+unchanged drivers (ModelSensor, the class_*.py sensors, read_planner)
+decode real field traffic without hardware. install_replay() puts it
+where get_bus() looks, so every Modbus_Film69 on that port uses it.
+
+Each request is matched against the next recorded request; requests the
+drivers no longer send are skipped (counted in stats["skipped"]), and a
+request that never comes up again gets an empty response (timeout).
+realtime=True reproduces the original timing: the recorded idle gap
+before each request (less the time the caller already spent since the
+previous one) and the recorded round trip of every transaction; the
+default runs as fast as possible. Reads are always
+taken from the log, never from the register cache, so a replay does not
+depend on the wall clock.
+
+Usage:
+    bus = install_replay("/dev/ttyS2", "/root/rs485_capture/ttyS2.bin")
+    sensor = ModelSensor("soil", port="/dev/ttyS2", slave_address=0x02)
+    while not bus.finished:
+        print(sensor.read())
+
+    python frame_replay.py /root/rs485_capture/ttyS2.bin     # dump the log
+"""
+
+import sys
+import time
+
+import rs485_bus
+from rs485_bus import RS485Bus
+from frame_recorder import exchanges
+from modbus_errors import BusDeadlineExceeded, classify_response
+
+# Recorded requests searched for a match before giving up
+LOOKAHEAD = 64
+
+
+class ReplayBus(RS485Bus):
+    def __init__(self, log_path, port="/dev/ttyS2", realtime=False, rotated=True):
+        """
+        Load a capture log
+
+        Args:
+            log_path (str): Capture file (frame_recorder format)
+            port (str): Port name the drivers use
+            realtime (bool): Sleep the recorded round trip of each transaction
+            rotated (bool): Include the rotated files of the log
+        """
+        super().__init__(port)
+        self.realtime = realtime
+        self.records = list(exchanges(log_path, rotated))
+        self.position = 0
+        self._recorded_end = None   # recorded time the previous replayed transaction ended
+        self._replayed_end = None   # when it ended here (monotonic)
+        self.stats.update({"replayed": 0, "skipped": 0, "missing": 0})
+
+    @property
+    def finished(self):
+        return self.position >= len(self.records)
+
+    def rewind(self):
+        self.position = 0
+        self._recorded_end = None
+
+    @property
+    def is_open(self):
+        return True
+
+    def configure(self, baudrate=None, timeout=None):
+        changed = baudrate is not None and baudrate != self.baudrate
+        if changed:
+            self.baudrate = baudrate
+            self.stats["line_changes"] += 1
+        return changed
+
+    def sleep(self, seconds):
+        if self.realtime:
+            super().sleep(seconds)
+
+    def transaction(self, request, response_len=None, baudrate=None, timeout=None, turnaround=None,
+                    cached=False):
+        """Answer with the recorded response of the next matching request"""
+        with self.lock:
+            window = self.window
+            if window is not None and window.remaining() <= 0:
+                window.expired = True
+                window.outcome = "timeout"
+                raise BusDeadlineExceeded("Read deadline exceeded")
+            request = bytes(request)
+            response = b""
+            round_trip = 0.0
+            end = min(len(self.records), self.position + LOOKAHEAD)
+            for index in range(self.position, end):
+                started, recorded_baud, recorded_request, recorded_response, round_trip = self.records[index]
+                if recorded_request == request:
+                    self.stats["skipped"] += index - self.position
+                    self.stats["replayed"] += 1
+                    self.position = index + 1
+                    response = recorded_response
+                    if recorded_baud:
+                        self.configure(recorded_baud)
+                    if self.realtime:
+                        self._replay_gap(started, window)
+                        time.sleep(round_trip)
+                        self._recorded_end = started + round_trip
+                        self._replayed_end = time.monotonic()
+                    break
+            else:
+                self.stats["missing"] += 1
+            if response_len is not None:
+                response = response[:response_len]
+            self.stats["transactions"] += 1
+            outcome = classify_response(response)
+            self.metrics.record_transaction(request[0], round_trip, outcome)
+            if window is not None:
+                window.record(outcome)
+            return response
+
+    def _replay_gap(self, started, window):
+        """Keep the line idle for the recorded gap before a request"""
+        if self._recorded_end is None:
+            return
+        wait = (started - self._recorded_end) - (time.monotonic() - self._replayed_end)
+        if window is not None:
+            wait = min(wait, window.remaining())
+        if wait > 0:
+            time.sleep(wait)
+
+    def close(self):
+        pass
+
+
+def install_replay(port, log_path, realtime=False, rotated=True):
+    """
+    Make get_bus(port) return a ReplayBus for the given capture
+
+    Returns:
+        ReplayBus: The installed bus
+    """
+    bus = ReplayBus(log_path, port, realtime, rotated)
+    with rs485_bus._buses_lock:
+        rs485_bus._buses[port] = bus
+    return bus
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: frame_replay.py <capture file>")
+        sys.exit(1)
+    count = 0
+    for timestamp, baudrate, request, response, round_trip in exchanges(sys.argv[1]):
+        count += 1
+        print(f"{timestamp:12.3f} {baudrate or '-':>6} {request.hex(' ').upper():<26} -> "
+              f"{response.hex(' ').upper() or '(no answer)'} [{classify_response(response)}, "
+              f"{round_trip * 1000:.1f} ms]")
+    print(f"{count} transaction(s)")
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+asyncio Modbus RTU client
+
+Non-blocking alternative to RS485Bus for running the sensor subsystem on
+one event loop (polling, MQTT publishing, internet monitor) instead of
+several threads. The tty is opened non-blocking and received bytes are
+collected by a loop.add_reader() callback; a transaction completes as
+soon as the frame length derived from its header is reached (t3.5
+silence for unknown function codes), and timeouts use asyncio.wait_for.
+
+Sensor classes run unchanged through read_sensor(): every driver
+declares its register block as READ = (method, start, count) and converts
+the values with decode(), which is exactly what its blocking read does.
+
+Usage:
+    client = AsyncModbusRTU("/dev/ttyS2")
+    await client.open()
+    wind = SensorWindSpeedDirection(port="/dev/ttyS2", slave_address=0x1A)
+    data = await read_sensor(client, wind, timeout=1.5)
+    regs = await client.read_holding(0x02, 0x0000, 2)
+"""
+
+import asyncio
+import os
+import struct
+import time
+from functools import lru_cache
+
+import serial
+from rs485_bus import frame_length, silence_time
+from modbus_crc import request_frame
+from modbus_errors import ModbusTimeoutError, ModbusFrameError, check_response
+
+
+@lru_cache(maxsize=64)
+def _register_struct(fmt, count):
+    # เช่น (">H", 2) -> Struct(">2H")
+    return struct.Struct(fmt[0] + str(count) + fmt[1:])
+
+
+class AsyncModbusRTU:
+    def __init__(self, port="/dev/ttyS2", baudrate=9600, timeout=1.0):
+        """
+        Initialize client (call open() inside the running event loop)
+
+        Args:
+            port (str): Serial port path
+            baudrate (int): Default baud rate
+            timeout (float): Default transaction timeout in seconds
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.serial = None
+        self.loop = None
+
+        self._lock = None
+        self._rx = bytearray()
+        self._waiter = None
+        self._silence_timer = None
+        self._idle_since = 0.0
+
+        self.stats = {"transactions": 0, "timeouts": 0}
+
+    async def open(self):
+        """Open the tty non-blocking and register the reader callback"""
+        if self.serial is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self.serial = serial.Serial(
+            port=self.port,
+            baudrate=self.baudrate,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            timeout=0  # non-blocking fd
+        )
+        self.loop.add_reader(self.serial.fileno(), self._on_readable)
+
+    def close(self):
+        """Unregister the reader and close the tty"""
+        if self.serial is None:
+            return
+        try:
+            self.loop.remove_reader(self.serial.fileno())
+            self.serial.close()
+        except Exception:
+            pass
+        self.serial = None
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.serial.fileno(), 256)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            return
+        self._rx += data
+
+        waiter = self._waiter
+        if waiter is None or waiter.done() or len(self._rx) < 3:
+            return
+        length = frame_length(self._rx)
+        if length is not None:
+            if len(self._rx) >= length:
+                waiter.set_result(bytes(self._rx[:length]))
+            return
+
+        # Unknown frame layout: complete after t3.5 of silence
+        if self._silence_timer is not None:
+            self._silence_timer.cancel()
+        self._silence_timer = self.loop.call_later(
+            silence_time(self.serial.baudrate), self._on_silence, waiter)
+
+    def _on_silence(self, waiter):
+        if not waiter.done():
+            waiter.set_result(bytes(self._rx))
+
+    async def transaction(self, request, baudrate=None, timeout=None):
+        """
+        Send one request frame and await the response
+
+        Args:
+            request (bytes): Complete request frame including CRC
+            baudrate (int, optional): Line speed for this transaction
+            timeout (float, optional): Timeout (default: self.timeout)
+
+        Returns:
+            bytes: Response frame (short or empty on timeout)
+        """
+        await self.open()
+        timeout = self.timeout if timeout is None else timeout
+        async with self._lock:
+            ser = self.serial
+            if baudrate is not None and ser.baudrate != baudrate:
+                ser.baudrate = baudrate  # termios on the same fd
+
+            # Keep the t3.5 inter-frame silence before the next request
+            gap = self._idle_since + silence_time(ser.baudrate) - time.monotonic()
+            if gap > 0:
+                await asyncio.sleep(gap)
+
+            ser.reset_input_buffer()
+            self._rx = bytearray()
+            self._waiter = self.loop.create_future()
+            try:
+                ser.write(bytes(request))
+                return await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                return bytes(self._rx)
+            finally:
+                if self._silence_timer is not None:
+                    self._silence_timer.cancel()
+                    self._silence_timer = None
+                self._waiter = None
+                self._idle_since = time.monotonic()
+                self.stats["transactions"] += 1
+
+    async def read_response(self, addr, function, start, count, baudrate=None, timeout=None):
+        """
+        Read `count` registers and return the CRC-checked response frame
+
+        Raises:
+            ModbusExceptionResponse / ModbusTimeoutError / ModbusFrameError
+        """
+        data_len = 2 * count
+        res = await self.transaction(request_frame(addr, function, start, count), baudrate, timeout)
+        if not res:
+            raise ModbusTimeoutError("No communication with the instrument (no answer)")
+        check_response(res, data_len + 5)
+        if res[0] != addr or res[1] != function or res[2] != data_len:
+            raise ModbusFrameError(f"Unexpected response header: {res[0]:02X} {res[1]:02X} {res[2]:02X}")
+        return res
+
+    async def read_holding(self, addr, start, count, baudrate=None, timeout=None):
+        """Read holding registers (FC03), returns tuple of uint16"""
+        res = await self.read_response(addr, 0x03, start, count, baudrate, timeout)
+        return _register_struct(">H", count).unpack_from(res, 3)
+
+    async def read_input(self, addr, start, count, baudrate=None, timeout=None):
+        """Read input registers (FC04), returns tuple of uint16"""
+        res = await self.read_response(addr, 0x04, start, count, baudrate, timeout)
+        return _register_struct(">H", count).unpack_from(res, 3)
+
+    async def read_int16(self, addr, start, count=1, baudrate=None, timeout=None):
+        """Read holding registers as signed int16, returns tuple"""
+        res = await self.read_response(addr, 0x03, start, count, baudrate, timeout)
+        return _register_struct(">h", count).unpack_from(res, 3)
+
+    async def read_float32(self, addr, start, count=1, byteorder=">", baudrate=None, timeout=None):
+        """Read `count` IEEE-754 floats (2 registers each), returns tuple"""
+        res = await self.read_response(addr, 0x03, start, 2 * count, baudrate, timeout)
+        return _register_struct(byteorder + "f", count).unpack_from(res, 3)
+
+    async def read_block(self, addr, spec, baudrate=None, timeout=None):
+        """Read a sensor's READ = (method, start, count) block"""
+        method, start, count = spec
+        return await getattr(self, method)(addr, start, count, baudrate=baudrate, timeout=timeout)
+
+    async def write_single(self, addr, register, value, baudrate=None, timeout=None):
+        """
+        Write single register (FC06), the slave echoes the request
+
+        Returns:
+            bool: True if the echo matches the request
+        """
+        frame = request_frame(addr, 0x06, register, value)
+        res = await self.transaction(frame, baudrate, timeout)
+        if not res:
+            raise ModbusTimeoutError("No communication with the instrument (no answer)")
+        return check_response(res, 8) == frame
+
+
+def _sensor_baudrate(sensor):
+    baudrate = getattr(sensor, "baudrate", None)
+    if baudrate is None and hasattr(sensor, "modbus"):
+        baudrate = sensor.modbus.baudrate
+    return baudrate
+
+
+async def read_sensor(client, sensor, timeout=None):
+    """
+    Read any sensor class (wind, soil, solar, MW485, rain, ultrasonic,
+    RK500-22/23, RKL-01) on the async client
+
+    Args:
+        client (AsyncModbusRTU): Client for the sensor's tty
+        sensor: Driver instance with READ and decode()
+        timeout (float, optional): Transaction timeout
+
+    Returns:
+        dict: Same result as the driver's blocking read
+    """
+    values = await client.read_block(sensor.slave_address, sensor.READ,
+                                     baudrate=_sensor_baudrate(sensor), timeout=timeout)
+    return sensor.decode(values)
+
+
+async def poll_sensors(client, sensors, interval=60, on_data=None, timeout=1.5):
+    """
+    Poll sensors forever on the event loop
+
+    Args:
+        client (AsyncModbusRTU): Client for the tty
+        sensors (dict): {name: sensor instance}
+        interval (float): Seconds between cycles
+        on_data (callable, optional): on_data(name, data_or_None), may be async
+        timeout (float): Per-sensor deadline
+    """
+    while True:
+        started = time.monotonic()
+        for name, sensor in sensors.items():
+            try:
+                data = await asyncio.wait_for(read_sensor(client, sensor), timeout)
+            except Exception as e:
+                print(f"❌ {name}: {e}")
+                data = None
+            if on_data is not None:
+                result = on_data(name, data)
+                if asyncio.iscoroutine(result):
+                    await result
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    from class_wind_modbus import SensorWindSpeedDirection
+    from class_soil_modbus import SensorSoilMoistureTemp
+
+    async def main():
+        client = AsyncModbusRTU("/dev/ttyS2")
+        await client.open()
+        sensors = {
+            "wind": SensorWindSpeedDirection(port="/dev/ttyS2", slave_address=0x1A),
+            "soil": SensorSoilMoistureTemp(port="/dev/ttyS2", slave_address=0x02),
+        }
+        await poll_sensors(client, sensors, interval=10, on_data=lambda name, data: print(name, data))
+
+    asyncio.run(main())
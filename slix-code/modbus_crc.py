@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Modbus RTU CRC16 (table driven) and request frame cache
+
+CRC16/Modbus: poly 0xA001 (reflected 0x8005), init 0xFFFF, sent low byte first.
+The 256-entry table replaces the bit-by-bit loop that every driver used to
+carry, so each byte costs one lookup instead of eight shift/xor steps.
+
+Works on bytes, bytearray, memoryview and lists of ints.
+"""
+
+from functools import lru_cache
+
+
+def _build_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _build_table()
+
+
+def crc16(data):
+    """
+    Calculate Modbus CRC16
+
+    Args:
+        data: bytes, bytearray, memoryview or list of ints
+
+    Returns:
+        int: CRC value (low byte is transmitted first)
+    """
+    crc = 0xFFFF
+    table = CRC_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+def append_crc(frame):
+    """Return frame + CRC (low, high) as bytes"""
+    crc = crc16(frame)
+    return bytes(frame) + bytes((crc & 0xFF, crc >> 8))
+
+
+def verify_crc(frame):
+    """
+    Check the trailing CRC of a received frame
+
+    Args:
+        frame: Complete frame including the 2 CRC bytes
+
+    Returns:
+        bool: True if the CRC matches
+    """
+    if isinstance(frame, list):
+        frame = bytes(frame)
+    n = len(frame)
+    if n < 4:
+        return False
+    view = memoryview(frame)
+    return crc16(view[:n - 2]) == (view[n - 2] | (view[n - 1] << 8))
+
+
+@lru_cache(maxsize=512)
+def request_frame(address, function, register, count):
+    """
+    Build (once) and cache an 8-byte request frame
+
+    [addr, func, reg_H, reg_L, count_H, count_L, crc_L, crc_H]
+    For FC06 (write single register) `count` is the value to write.
+
+    Args:
+        address (int): Slave address
+        function (int): Function code (0x03, 0x04, 0x06)
+        register (int): Start register
+        count (int): Register count (or value for FC06)
+
+    Returns:
+        bytes: Complete request frame including CRC
+    """
+    return append_crc(bytes((
+        address & 0xFF, function & 0xFF,
+        (register >> 8) & 0xFF, register & 0xFF,
+        (count >> 8) & 0xFF, count & 0xFF
+    )))
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Modbus address discovery
+
+Replaces the per-driver 1..247 sweeps (each address waiting the full
+0.3 s minimalmodbus timeout) with one engine on the shared RS485Bus:
+
+  1. The documented address range of each model (sensor_config comments)
+     is probed first with that model's own signature read.
+  2. Optionally the rest of 1..247 is swept once; each answering address
+     is identified from the shape of its replies (byte count, address
+     echo), so one pass finds every model on the line.
+
+A probe listens only for the first-byte window plus the frame time at
+the line speed; the frame-length aware receive returns as soon as the
+reply is complete. Silent (address, probe) pairs are remembered in a
+negative cache (persisted to NEGATIVE_CACHE_FILE) so a second background
+scan of the same box skips them. Explicit scans (find_addresses(), the
+drivers' scan_addresses()) probe every address again, so a sensor plugged
+in since the last scan is found; their silent results still refresh the
+cache.
+
+Rain gauges clear their tip counter when register 0 is read: the rain /
+ultrasonic firmware is always checked first with its address register
+(0x0100, which echoes the slave address), and register 0 single reads are
+never sent to an address that answered that probe.
+
+Usage:
+    devices = discover("/dev/ttyS2", models=("soil", "wind"))
+    # [{"address": 2, "model": "soil", "candidates": ["soil"]}, ...]
+    devices = discover("/dev/ttyS2", full_sweep=True)
+"""
+
+import json
+import os
+import time
+
+from rs485_bus import get_bus
+from modbus_crc import request_frame
+from modbus_errors import classify_response
+
+# Probe name: (register, count), all FC03
+PROBES = {
+    "address": (0x0100, 1),     # rain / ultrasonic firmware: own slave address
+    "block2": (0x0000, 2),      # wind, soil, MW485
+    "ec": (0x0000, 10),         # RK500-23: 5 x float32
+    "ph": (0x0000, 6),          # RK500-22: 3 x float32
+    "level": (0x0004, 1),       # RKL-01
+    "block1": (0x0000, 1),      # solar (rain-unsafe, see module docstring)
+}
+
+# Sweep order: rain-safe probe first, then the most specific shapes
+SWEEP_ORDER = ("address", "block2", "ec", "ph", "level", "block1")
+
+# Model: (documented address range, signature probe), see sensor_config
+MODELS = {
+    "soil": (range(1, 14), "block2"),
+    "air_temp": (range(14, 26), "block2"),
+    "wind": (range(26, 38), "block2"),
+    "solar": (range(38, 50), "block1"),
+    "rainfall": (range(50, 62), "address"),
+    "ultrasonic": (range(76, 88), "address"),
+    "soil_ec": (range(88, 100), "ec"),
+    "soil_ph": (range(100, 112), "ph"),
+    "liquid_level": (range(112, 124), "level"),
+}
+
+# Time for a slave to start answering (the old scans waited 0.3 s)
+FIRST_BYTE_WINDOW = 0.1
+
+# Idle gap before probing an address that has just answered
+REPLY_GAP = 0.05
+
+NEGATIVE_CACHE_FILE = "/root/modbus_discovery_cache.json"
+NEGATIVE_TTL = 3600.0
+
+_negative = None
+
+
+def _cache_key(port, baudrate, address, probe):
+    return f"{port}|{baudrate}|{address}|{probe}"
+
+
+def _load_negative():
+    global _negative
+    if _negative is None:
+        try:
+            with open(NEGATIVE_CACHE_FILE) as f:
+                _negative = json.load(f)
+        except (OSError, ValueError):
+            _negative = {}
+    return _negative
+
+
+def _save_negative():
+    try:
+        now = time.time()
+        live = {key: expires for key, expires in _negative.items() if expires > now}
+        tmp = NEGATIVE_CACHE_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(live, f)
+        os.replace(tmp, NEGATIVE_CACHE_FILE)
+    except (OSError, TypeError):
+        pass
+
+
+def clear_negative_cache(port=None):
+    """Forget silent addresses (all ports, or one port)"""
+    cache = _load_negative()
+    for key in list(cache):
+        if port is None or key.startswith(port + "|"):
+            del cache[key]
+    _save_negative()
+
+
+def _matches(model, address, reply):
+    """Check a reply against the shape the model answers its probe with"""
+    if reply is None or classify_response(reply) != "ok":
+        return False
+    register, count = PROBES[MODELS[model][1]]
+    if len(reply) != 5 + 2 * count or reply[0] != address or reply[1] != 0x03 or reply[2] != 2 * count:
+        return False
+    if MODELS[model][1] == "address":
+        # Firmware answers its own address from register 0x0100
+        return reply[4] == address
+    return True
+
+
+class Discovery:
+    def __init__(self, port="/dev/ttyS2", baudrate=9600, window=FIRST_BYTE_WINDOW,
+                 use_cache=True, negative_ttl=NEGATIVE_TTL):
+        """
+        Initialize a scan on one tty
+
+        Args:
+            port (str): Serial port path
+            baudrate (int): Line speed of the sensors to find
+            window (float): Seconds to wait for the first reply byte
+            use_cache (bool): Skip (address, probe) pairs known to be silent
+            negative_ttl (float): Seconds a silent result stays cached
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.window = window
+        self.use_cache = use_cache
+        self.negative_ttl = negative_ttl
+        self.bus = get_bus(port, baudrate=baudrate)
+        self.negative = _load_negative()
+        self.answered = set()
+        self.silent = set()
+        self.stats = {"probes": 0, "cached": 0, "replies": 0}
+
+    def probe(self, address, name):
+        """
+        Send one probe read
+
+        Returns:
+            bytes or None: Reply (b"" if silent), None if skipped by the cache
+        """
+        key = _cache_key(self.port, self.baudrate, address, name)
+        if key in self.silent or (self.use_cache and self.negative.get(key, 0) > time.time()):
+            self.stats["cached"] += 1
+            return None
+
+        register, count = PROBES[name]
+        frame_time = (5 + 2 * count) * 11.0 / self.baudrate
+        gap = REPLY_GAP if address in self.answered else 0.0
+        try:
+            reply = self.bus.transaction(request_frame(address, 0x03, register, count),
+                                         baudrate=self.baudrate,
+                                         timeout=self.window + frame_time,
+                                         turnaround=gap)
+        except Exception as e:
+            print(f"❌ Probe 0x{address:02X} failed: {e}")
+            return None
+        self.stats["probes"] += 1
+
+        if reply:
+            self.stats["replies"] += 1
+            self.answered.add(address)
+            self.negative.pop(key, None)
+        else:
+            self.silent.add(key)
+            self.negative[key] = time.time() + self.negative_ttl
+        return reply
+
+    def _probe_shape(self, address, name, replies):
+        """Probe one shape into replies, guarding reg 0 single reads against rain gauges"""
+        if name == "block1":
+            if "address" not in replies:
+                self._probe_shape(address, "address", replies)
+            if _matches("rainfall", address, replies["address"]):
+                return False
+        replies[name] = self.probe(address, name)
+        return bool(replies[name])
+
+    def identify(self, address, models):
+        """
+        Identify the device at one address from its reply shapes
+
+        Args:
+            address (int): Slave address
+            models (iterable): Candidate model names
+
+        Returns:
+            dict or None: {"address", "model", "candidates"}, None if nothing answered
+            (model may be outside `models` when the shapes say otherwise)
+        """
+        needed = {MODELS[m][1] for m in models}
+
+        replies = {}
+        for name in SWEEP_ORDER:
+            if name not in needed:
+                continue
+            if not self._probe_shape(address, name, replies):
+                # Standard slaves answer any FC03 (data or exception):
+                # two silent probes mean nothing lives here
+                if len(replies) >= 2 and not any(replies.values()):
+                    break
+
+        if not any(replies.values()):
+            return None
+
+        # Something answers. Inside the documented range of a model whose
+        # shape matched, the range decides (ranges do not overlap). Else
+        # widen only to the shapes that can tell the candidates apart: the
+        # range owner's and reads at least as long as the requested ones,
+        # so e.g. an RK500-23 is not taken for a 2-register soil sensor
+        owner = next((m for m in MODELS if address in MODELS[m][0]), None)
+        if owner not in models or not _matches(owner, address, replies.get(MODELS[owner][1])):
+            shortest = min(PROBES[MODELS[m][1]][1] for m in models)
+            for name in SWEEP_ORDER:
+                if name in replies:
+                    continue
+                if PROBES[name][1] >= shortest or (owner is not None and name == MODELS[owner][1]):
+                    self._probe_shape(address, name, replies)
+
+        # Most specific shape first (longest matching read)
+        candidates = sorted((m for m in MODELS if _matches(m, address, replies.get(MODELS[m][1]))),
+                            key=lambda m: -PROBES[MODELS[m][1]][1])
+        hinted = [m for m in candidates if address in MODELS[m][0]]
+        longest = [m for m in candidates if PROBES[MODELS[m][1]][1] == PROBES[MODELS[candidates[0]][1]][1]]
+        if len(hinted) == 1:
+            model = hinted[0]       # documented range for this model
+        elif len(longest) == 1:
+            model = longest[0]
+        else:
+            model = None            # answers, but the shape is ambiguous or unknown
+        return {"address": address, "model": model, "candidates": candidates}
+
+    def run(self, models=None, full_sweep=False):
+        """
+        Scan documented ranges first, then (optionally) the rest of 1..247
+
+        Args:
+            models (iterable, optional): Model names to look for (default: all)
+            full_sweep (bool): Also probe addresses outside the documented ranges
+
+        Returns:
+            list: Found devices sorted by address
+        """
+        models = list(models or MODELS)
+        found = {}
+        started = time.monotonic()
+
+        with self.bus:
+            for model in models:
+                for address in MODELS[model][0]:
+                    if address in found:
+                        continue
+                    device = self.identify(address, [model])
+                    if device is not None:
+                        found[address] = device
+                        print(f"🔍 0x{address:02X}: {device['model'] or 'unknown device'}")
+
+            if full_sweep:
+                for address in range(1, 248):
+                    if address in found and found[address]["model"] is not None:
+                        continue
+                    device = self.identify(address, models)
+                    if device is not None:
+                        found[address] = device
+                        print(f"🔍 0x{address:02X}: {device['model'] or 'unknown device'} {device['candidates']}")
+
+        _save_negative()
+        print(f"Discovery on {self.port} @ {self.baudrate}: {len(found)} device(s), "
+              f"{self.stats['probes']} probes ({self.stats['cached']} cached) "
+              f"in {time.monotonic() - started:.1f}s")
+        return [found[address] for address in sorted(found)]
+
+
+def discover(port="/dev/ttyS2", baudrate=9600, models=None, full_sweep=False, **kwargs):
+    """
+    Find sensors on a tty
+
+    Args:
+        port (str): Serial port path
+        baudrate (int): Line speed
+        models (iterable, optional): Model names in MODELS (default: all)
+        full_sweep (bool): Also probe addresses outside the documented ranges
+        **kwargs: window, use_cache, negative_ttl (see Discovery)
+
+    Returns:
+        list: [{"address": int, "model": str or None, "candidates": [str]}]
+    """
+    return Discovery(port, baudrate, **kwargs).run(models, full_sweep)
+
+
+def find_addresses(model, port="/dev/ttyS2", baudrate=9600, full_sweep=True, use_cache=False):
+    """
+    Addresses of one model (what the drivers' scan_addresses() return)
+
+    Args:
+        use_cache (bool): Skip addresses cached as silent (default False:
+            an explicit scan must see newly plugged sensors)
+
+    Returns:
+        list: Slave addresses
+    """
+    devices = discover(port, baudrate, models=(model,), full_sweep=full_sweep, use_cache=use_cache)
+    return [device["address"] for device in devices if device["model"] == model]
+
+
+if __name__ == "__main__":
+    import sys
+    port = sys.argv[1] if len(sys.argv) > 1 else "/dev/ttyS2"
+    for device in discover(port, full_sweep="--full" in sys.argv):
+        print(device)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Typed Modbus RTU errors
+
+A slave that rejects a request answers with a 5-byte exception frame
+[addr, func | 0x80, code, crc_L, crc_H]. These are turned into typed
+exceptions so callers can stop retrying requests that can never succeed
+(illegal function/address/value) and keep retrying transient ones
+(device busy, no answer, CRC noise).
+
+Usage:
+    resp = bus.transaction(frame, baudrate=9600, timeout=1.0)
+    check_response(resp)            # raises IllegalDataAddress, SlaveDeviceBusy, ...
+"""
+
+from modbus_crc import verify_crc
+
+
+class ModbusError(Exception):
+    """Base class for every Modbus communication error"""
+    retryable = True
+
+
+class ModbusTimeoutError(ModbusError, IOError):
+    """No answer (or nothing at all) before the read timeout"""
+    retryable = True
+
+
+class BusDeadlineExceeded(ModbusTimeoutError):
+    """The read budget of the current deadline window is used up"""
+    retryable = False
+
+
+class ModbusFrameError(ModbusError, ValueError):
+    """Short frame or unexpected header"""
+    retryable = True
+
+
+class ModbusCRCError(ModbusFrameError):
+    """Frame received but the CRC does not match (line noise)"""
+    retryable = True
+
+
+class ModbusExceptionResponse(ModbusError):
+    """Slave answered with an exception frame (function | 0x80)"""
+    code = None
+    description = "Unknown exception"
+    retryable = False
+
+    def __init__(self, address, function, code=None):
+        self.address = address
+        self.function = function
+        if code is not None:
+            self.code = code
+        super().__init__(
+            f"Modbus exception 0x{self.code:02X} ({self.description}) "
+            f"from slave 0x{address:02X}, function 0x{function:02X}"
+        )
+
+
+class IllegalFunction(ModbusExceptionResponse):
+    code = 0x01
+    description = "Illegal function"
+
+
+class IllegalDataAddress(ModbusExceptionResponse):
+    code = 0x02
+    description = "Illegal data address"
+
+
+class IllegalDataValue(ModbusExceptionResponse):
+    code = 0x03
+    description = "Illegal data value"
+
+
+class SlaveDeviceFailure(ModbusExceptionResponse):
+    code = 0x04
+    description = "Slave device failure"
+
+
+class Acknowledge(ModbusExceptionResponse):
+    code = 0x05
+    description = "Acknowledge (request accepted, still processing)"
+    retryable = True
+
+
+class SlaveDeviceBusy(ModbusExceptionResponse):
+    code = 0x06
+    description = "Slave device busy"
+    retryable = True
+
+
+class GatewayPathUnavailable(ModbusExceptionResponse):
+    code = 0x0A
+    description = "Gateway path unavailable"
+
+
+class GatewayTargetNoResponse(ModbusExceptionResponse):
+    code = 0x0B
+    description = "Gateway target device failed to respond"
+    retryable = True
+
+
+EXCEPTION_CLASSES = {
+    cls.code: cls for cls in (
+        IllegalFunction, IllegalDataAddress, IllegalDataValue, SlaveDeviceFailure,
+        Acknowledge, SlaveDeviceBusy, GatewayPathUnavailable, GatewayTargetNoResponse
+    )
+}
+
+
+def exception_from_response(response):
+    """
+    Decode an exception frame
+
+    Args:
+        response (bytes): Received frame
+
+    Returns:
+        ModbusExceptionResponse or None: The typed error if the frame is a
+        valid (CRC-checked) exception frame, otherwise None
+    """
+    if len(response) != 5 or not response[1] & 0x80 or not verify_crc(response):
+        return None
+    cls = EXCEPTION_CLASSES.get(response[2], ModbusExceptionResponse)
+    return cls(response[0], response[1] & 0x7F, response[2])
+
+
+def classify_response(response):
+    """
+    Classify a received frame for outcome reporting
+
+    Returns:
+        str: "ok", "exception", "crc", "timeout" (partial frame)
+             or "no-device" (nothing received)
+    """
+    if not response:
+        return "no-device"
+    if len(response) < 5:
+        return "timeout"
+    if not verify_crc(response):
+        return "crc"
+    if response[1] & 0x80:
+        return "exception"
+    return "ok"
+
+
+def check_response(response, expected_len=None):
+    """
+    Raise a typed error if a response is empty, an exception frame,
+    short or corrupt
+
+    Args:
+        response (bytes): Received frame
+        expected_len (int, optional): Exact frame length expected
+
+    Returns:
+        bytes: The response, unchanged, if it is valid
+    """
+    if not response:
+        raise ModbusTimeoutError("No communication with the instrument (no answer)")
+    exc = exception_from_response(response)
+    if exc is not None:
+        raise exc
+    if expected_len is not None and len(response) != expected_len:
+        raise ModbusFrameError(f"Invalid response length: {len(response)}, expected {expected_len}")
+    if not verify_crc(response):
+        raise ModbusCRCError("CRC error in response")
+    return response
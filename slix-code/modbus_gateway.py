@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Local Modbus TCP gateway for a polled RS485 bus
+
+Commissioning scripts, RPC tools and debugging sessions used to open
+/dev/ttyS2 themselves and corrupt the frames of the production poller.
+The gateway lets them share the bus instead: a Modbus TCP server bound
+to localhost turns each request into one RTU transaction and runs it on
+the bus's BusScheduler (INTERACTIVE priority), between the poller's reads.
+
+  - FC03 / FC04 reads are answered from the bus's register cache
+    (register_cache.py) while the unit's TTL holds, without waiting for
+    the bus worker, so several tools watching one sensor do not multiply
+    bus traffic
+  - FC06 / FC16 writes are forwarded; the bus drops the unit's cached
+    registers
+  - other function codes get exception 01 (illegal function)
+  - no answer / corrupt answer from the sensor gives exception 0B
+  - register 0 of protected units (rain gauges: reading it clears the tip
+    counter) is never forwarded; the poller owns that register and the
+    gateway only serves the poller's last read from the cache (exception
+    06 once it is older than the TTL)
+
+Usage:
+    gateway = ModbusTCPGateway(get_bus("/dev/ttyS2"), scheduler,
+                               baudrates={0x32: 9600}, protected={0x32})
+    gateway.start()                 # 127.0.0.1:5020
+    ...
+    mbpoll -m tcp -p 5020 -a 2 -r 1 -c 2 127.0.0.1
+"""
+
+import socketserver
+import struct
+import threading
+
+from bus_scheduler import INTERACTIVE
+from modbus_crc import append_crc, verify_crc
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5020     # 502 ต้องใช้สิทธิ์ root และอาจชนกับ service อื่น
+
+TIMEOUT = 1.0           # RTU transaction timeout
+QUEUE_TIMEOUT = 10.0    # wait for the bus worker (a poll read may be on the line)
+
+# Modbus exception codes used by the gateway
+ILLEGAL_FUNCTION = 0x01
+SLAVE_DEVICE_BUSY = 0x06
+GATEWAY_TARGET_NO_RESPONSE = 0x0B
+
+MBAP = struct.Struct(">HHHB")  # transaction id, protocol id, length, unit id
+
+
+class _GatewayHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        gateway = self.server.gateway
+        sock = self.request
+        while gateway.running:
+            header = _recv_exact(sock, MBAP.size)
+            if header is None:
+                return
+            transaction_id, protocol_id, length, unit = MBAP.unpack(header)
+            pdu = _recv_exact(sock, length - 1) if length > 1 else None
+            if pdu is None or protocol_id != 0:
+                return
+            reply = gateway.handle_pdu(unit, pdu)
+            sock.sendall(MBAP.pack(transaction_id, 0, len(reply) + 1, unit) + reply)
+
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ModbusTCPGateway:
+    def __init__(self, bus, scheduler, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 baudrates=None, protected=()):
+        """
+        Initialize gateway (call start() to listen)
+
+        Args:
+            bus (RS485Bus): Bus the requests are forwarded to
+            scheduler (BusScheduler): Worker that owns the bus
+            host (str): Listen address (keep it on localhost)
+            port (int): TCP port
+            baudrates (dict, optional): {unit: baudrate}, default bus.baudrate
+            protected (iterable): Units whose register 0 must not be read
+        """
+        self.bus = bus
+        self.scheduler = scheduler
+        self.host = host
+        self.port = port
+        self.baudrates = dict(baudrates or {})
+        self.protected = set(protected)
+
+        self.server = None
+        self.thread = None
+        self.running = False
+
+        self.stats = {"requests": 0, "cache_hits": 0, "forwarded": 0, "errors": 0}
+
+    def start(self):
+        """Listen on host:port in a background thread"""
+        if self.running:
+            return
+        self.server = _Server((self.host, self.port), _GatewayHandler)
+        self.server.gateway = self
+        self.running = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f"mbtcp-{self.port}", daemon=True)
+        self.thread.start()
+        print(f"🔌 Modbus TCP gateway for {self.bus.port} on {self.host}:{self.port}")
+
+    def stop(self):
+        """Stop listening"""
+        self.running = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def handle_pdu(self, unit, pdu):
+        """
+        Answer one Modbus PDU
+
+        Args:
+            unit (int): Unit id (RS485 slave address)
+            pdu (bytes): Function code + data
+
+        Returns:
+            bytes: Response PDU (data or exception)
+        """
+        self.stats["requests"] += 1
+        function = pdu[0]
+
+        if function in (0x03, 0x04) and len(pdu) == 5:
+            start = struct.unpack_from(">H", pdu, 1)[0]
+            response = self.bus.cache.lookup(self.bus.port, bytes((unit,)) + pdu)
+            if response is not None:
+                self.stats["cache_hits"] += 1
+                return response[1:-2]
+            if unit in self.protected and start == 0:
+                print(f"🚫 Gateway: register 0 of 0x{unit:02X} is read by the poller only")
+                return bytes((function | 0x80, SLAVE_DEVICE_BUSY))
+            return self.forward(unit, pdu)
+
+        if function in (0x06, 0x10):
+            return self.forward(unit, pdu)
+
+        return bytes((function | 0x80, ILLEGAL_FUNCTION))
+
+    def forward(self, unit, pdu):
+        """Run one RTU transaction on the bus worker and return the response PDU"""
+        self.stats["forwarded"] += 1
+        frame = append_crc(bytes((unit,)) + pdu)
+        baudrate = self.baudrates.get(unit, self.bus.baudrate)
+        try:
+            response = self.scheduler.call(INTERACTIVE, self._transaction, frame, baudrate, timeout=QUEUE_TIMEOUT)
+        except Exception as e:
+            print(f"❌ Gateway 0x{unit:02X}: {e}")
+            response = b""
+        if len(response) < 5 or response[0] != unit or not verify_crc(response):
+            self.stats["errors"] += 1
+            return bytes((pdu[0] | 0x80, GATEWAY_TARGET_NO_RESPONSE))
+        return response[1:-2]
+
+    def _transaction(self, frame, baudrate):
+        # the poller may have refreshed the block while this request queued
+        return self.bus.transaction(frame, baudrate=baudrate, timeout=TIMEOUT, cached=True)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Modbus RTU slave simulator on a pseudo-terminal
+
+Emulates the sensors of a field box on one pty so the poller, the bus
+layer and the benchmarks run without hardware:
+
+  RK120 wind, RK520 soil, MW485 air temp / humidity, RK200 solar,
+  RK400 rain (rain_485_004_PICO.ino), RCWL ultrasonic
+  (ultra_485_003_STM32.ino), RK500-23 EC, RK500-22 pH, RKL-01 level
+
+Register layouts come from sensor_models.MODELS, so a decoded simulated
+reading equals the configured value. Each device has its own address
+and baud rate: it only answers when the line speed the client set on the
+pty matches (read back from the pty's termios), like a real device that
+sees garbage at the wrong speed.
+
+RK-series devices answer FC03/FC04 on their register block and address
+register, exception 02 outside it, exception 01 for unknown functions,
+and change address through their "set_address" procedure (RK200:
+broadcast raw frame). The MW485 also switches baud rate via 0x07D1.
+Rain / ultrasonic follow their firmware: only qty == 1 reads of 0x0000
+and 0x0100, FC06 0x0100 (change address) and 0x0200 (reset to default),
+anything else is ignored; reading the rain count clears it. Like the
+firmware they also answer broadcast frames, with their own id.
+
+Fault injection per device: response latency + jitter, CRC-error rate,
+drop rate and exception rate (exception 04, RK-series only). Line time
+(11 bits per byte at the device's baud rate) is added to every answer.
+
+Usage:
+    sim = ModbusSimulator(seed=1)
+    sim.add("soil", 0x02)
+    rain = sim.add("rainfall", 0x32, drop_rate=0.05)
+    path = sim.start()              # e.g. /dev/pts/5
+    rain.add_tips(3)
+
+    python modbus_simulator.py                       # the test_main04 sensor set
+    python modbus_simulator.py wind@0x1A rainfall@0x32:4800 --crc 0.02 --link /tmp/ttySIM
+"""
+
+import os
+import pty
+import random
+import select
+import struct
+import sys
+import termios
+import threading
+import time
+import tty
+
+from modbus_crc import append_crc, verify_crc
+from sensor_models import MODELS, TYPES
+from baud_upgrade import BAUD_REGISTERS
+from modbus_discovery import MODELS as ADDRESS_RANGES
+
+# Defaults per device
+LATENCY = 0.02          # s from end of request to start of answer
+JITTER = 0.005          # s, uniform +/-
+NOISE = 0.0             # relative std dev added to each reading
+
+# Inter-frame silence the simulator uses to split requests
+FRAME_GAP = 0.005
+
+# Typical readings (engineering units) per model
+DEFAULT_VALUES = {
+    "wind": {"wind_speed": 3.2, "wind_direction": 135},
+    "soil": {"soil_temperature": 24.1, "soil_moisture": 31.5},
+    "air_temp": {"humidity": 65.0, "temperature": 29.4},
+    "solar": {"solar_radiation": 540},
+    "rainfall": {"rain_tip_count": 0},
+    "ultrasonic": {"distance_cm": 85},
+    "soil_ec": {"ec_value": 1.25, "salinity": 640.0},
+    "soil_ph": {"ph_value": 6.5, "temperature": 25.3},
+    "liquid_level": {"raw_value": 420},
+}
+
+# Custom firmware (rain / ultrasonic): default device id
+FIRMWARE_DEFAULT_ID = {"rainfall": 0x32, "ultrasonic": 0x4C}
+FIRMWARE_ADDRESS_REGISTER = 0x0100
+FIRMWARE_RESET_REGISTER = 0x0200
+
+# The sensor set of test_main04.py
+DEFAULT_BUS = (
+    ("wind", 0x1A), ("soil", 0x02), ("soil", 0x03), ("air_temp", 0x0E), ("ultrasonic", 0x4E),
+    ("rainfall", 0x32), ("solar", 0x26), ("soil_ec", 0x58), ("soil_ph", 0x64), ("liquid_level", 0x70),
+)
+
+_SPEEDS = {getattr(termios, f"B{rate}"): rate
+           for rate in (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200)}
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+SLAVE_DEVICE_FAILURE = 0x04
+
+
+def _encode(model, values):
+    """Engineering values -> {register: uint16} using the model's field table"""
+    spec = MODELS[model]
+    order = spec.get("byteorder", ">")
+    registers = {}
+    for field, value in values.items():
+        reg, kind, scale, offset, _, _ = spec["fields"][field]
+        code, size = TYPES[kind]
+        raw = (value - offset) / scale
+        if code != "f":
+            raw = int(round(raw))
+        data = struct.pack(order + code, raw)
+        for i in range(size):
+            registers[reg + i] = struct.unpack_from(">H", data, 2 * i)[0]
+    return registers
+
+
+class SimDevice:
+    def __init__(self, model, address=None, baudrate=9600, values=None, latency=LATENCY, jitter=JITTER,
+                 crc_error_rate=0.0, drop_rate=0.0, exception_rate=0.0, noise=NOISE):
+        """
+        One simulated sensor
+
+        Args:
+            model (str): Key in sensor_models.MODELS
+            address (int, optional): Slave address (default: the model's default)
+            baudrate (int): Line speed the device listens at
+            values (dict, optional): Readings in engineering units (DEFAULT_VALUES)
+            latency (float): Seconds before the answer starts
+            jitter (float): Uniform +/- seconds added to the latency
+            crc_error_rate (float): Fraction of answers sent with a bad CRC
+            drop_rate (float): Fraction of requests left unanswered
+            exception_rate (float): Fraction answered with exception 04
+            noise (float): Relative std dev applied to every reading
+        """
+        if model not in MODELS:
+            raise ValueError(f"Unknown model: {model}")
+        self.model = model
+        self.spec = MODELS[model]
+        self.firmware = model in FIRMWARE_DEFAULT_ID
+        self.default_address = FIRMWARE_DEFAULT_ID.get(model, ADDRESS_RANGES[model][0][0])
+        self.address = address or self.default_address
+        self.baudrate = baudrate
+        self.values = dict(DEFAULT_VALUES[model])
+        self.values.update(values or {})
+        self.latency = latency
+        self.jitter = jitter
+        self.crc_error_rate = crc_error_rate
+        self.drop_rate = drop_rate
+        self.exception_rate = exception_rate
+        self.noise = noise
+
+        # Writable registers: address change steps, baud rate, save flags
+        self.holding = {}
+        for target, function, register, value in self.spec["set_address"]:
+            if register is not None:
+                self.holding[register] = self.address if value == "new" else 0
+        self.baud_register = BAUD_REGISTERS.get(model)
+        if self.baud_register:
+            codes = self.baud_register["codes"]
+            self.holding[self.baud_register["register"]] = codes.get(baudrate, 0)
+        self.address_register = next(
+            (register for target, function, register, value in self.spec["set_address"]
+             if target == "old" and value == "new" and register is not None), None)
+        if self.address_register is not None:
+            self.holding[self.address_register] = self.address
+
+    def add_tips(self, count=1):
+        """Rain gauge: register bucket tips"""
+        self.values["rain_tip_count"] = self.values.get("rain_tip_count", 0) + count
+
+    def registers(self, rng=random):
+        """Current register map (block registers + writable ones)"""
+        values = self.values
+        if self.noise:
+            values = {key: value * (1 + rng.gauss(0, self.noise)) for key, value in values.items()}
+        function, start, count = self.spec["read"]
+        registers = dict.fromkeys(range(start, start + count), 0)
+        registers.update(_encode(self.model, values))
+        registers.update(self.holding)
+        return registers
+
+    def handle(self, frame, rng):
+        """
+        Answer one CRC-checked request addressed to this device
+
+        Returns:
+            bytes or None: Response frame, None for no answer
+        """
+        if self.firmware:
+            return self._handle_firmware(frame, rng)
+
+        address, function = frame[0], frame[1]
+        if address == 0x00:
+            # RK200: [0x00, 0x10, new address] broadcast, no answer
+            for target, step_function, register, value in self.spec["set_address"]:
+                if target == "broadcast" and register is None and function == step_function and len(frame) == 5:
+                    self.address = frame[2]
+            return None
+        if rng.random() < self.exception_rate:
+            return append_crc(bytes((address, function | 0x80, SLAVE_DEVICE_FAILURE)))
+        if len(frame) == 8 and function in (0x03, 0x04):
+            start, count = struct.unpack_from(">HH", frame, 2)
+            registers = self.registers(rng)
+            if not 1 <= count <= 125 or any(reg not in registers for reg in range(start, start + count)):
+                return append_crc(bytes((address, function | 0x80, ILLEGAL_DATA_ADDRESS)))
+            data = struct.pack(f">{count}H", *(registers[reg] for reg in range(start, start + count)))
+            return append_crc(bytes((address, function, 2 * count)) + data)
+        if len(frame) == 8 and function == 0x06:
+            register, value = struct.unpack_from(">HH", frame, 2)
+            if register not in self.holding:
+                return append_crc(bytes((address, function | 0x80, ILLEGAL_DATA_ADDRESS)))
+            self.holding[register] = value
+            # ตอบด้วย address / baud เดิมก่อน แล้วค่อยเปลี่ยน (เหมือนตัวจริง)
+            if register == self.address_register and 1 <= value <= 247:
+                self.address = value
+            if self.baud_register and register == self.baud_register["register"]:
+                rates = {code: rate for rate, code in self.baud_register["codes"].items()}
+                self.baudrate = rates.get(value, self.baudrate)
+            return bytes(frame)
+        return append_crc(bytes((address, function | 0x80, ILLEGAL_FUNCTION)))
+
+    def _handle_firmware(self, frame, rng):
+        """rain_485_004_PICO / ultra_485_003_STM32 request handling"""
+        if len(frame) != 8:
+            return None
+        function = frame[1]
+        register, value = struct.unpack_from(">HH", frame, 2)
+        if function == 0x03 and value == 1:
+            if register == 0x0000:
+                if self.model == "rainfall":
+                    data = self.values.get("rain_tip_count", 0)
+                    self.values["rain_tip_count"] = 0  # อ่านแล้วล้างตัวนับ
+                else:
+                    data = self.registers(rng)[0x0000]
+            elif register == FIRMWARE_ADDRESS_REGISTER:
+                data = self.address
+            else:
+                return None
+            return append_crc(struct.pack(">BBBH", self.address, 0x03, 2, data & 0xFFFF))
+        if function == 0x06:
+            if register == FIRMWARE_ADDRESS_REGISTER and 0x01 <= (value & 0xFF) <= 0xF7:
+                self.address = value & 0xFF
+                return bytes(frame)
+            if register == FIRMWARE_RESET_REGISTER:
+                self.address = self.default_address
+                return append_crc(bytes(frame[:4]) + struct.pack(">H", self.default_address))
+        return None
+
+
+class ModbusSimulator:
+    def __init__(self, devices=(), seed=None):
+        """
+        Simulated RS485 bus (call start() to create the pty)
+
+        Args:
+            devices (iterable): SimDevice objects
+            seed (int, optional): Seed for fault injection (reproducible runs)
+        """
+        self.devices = list(devices)
+        self.rng = random.Random(seed)
+        self.master = None
+        self.slave = None
+        self.path = None
+        self.running = False
+        self.thread = None
+        self.stats = {"requests": 0, "replies": 0, "dropped": 0, "crc_errors": 0,
+                      "exceptions": 0, "ignored": 0}
+
+    def add(self, model, address=None, baudrate=9600, **options):
+        """Add a device, returns the SimDevice"""
+        device = SimDevice(model, address, baudrate, **options)
+        self.devices.append(device)
+        return device
+
+    def start(self):
+        """
+        Create the pty and serve requests in a background thread
+
+        Returns:
+            str: Slave tty path to open as the RS485 port
+        """
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, name="modbus-sim", daemon=True)
+        self.thread.start()
+        return self.path
+
+    def stop(self):
+        self.running = False
+        # Let the serve thread leave select() before its descriptor goes away
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = self.slave = None
+
+    def line_baudrate(self):
+        """Baud rate the client configured on the pty (None if unknown)"""
+        try:
+            return _SPEEDS.get(termios.tcgetattr(self.master)[4])
+        except (termios.error, OSError, TypeError):
+            return None
+
+    def _read_frame(self):
+        """Bytes up to the next inter-frame silence"""
+        frame = b""
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], FRAME_GAP if frame else 0.5)
+            if not ready:
+                if frame:
+                    return frame
+                continue
+            try:
+                frame += os.read(self.master, 256)
+            except OSError:
+                return None
+        return None
+
+    def _serve(self):
+        while self.running:
+            frame = self._read_frame()
+            if frame is None:
+                return
+            self.stats["requests"] += 1
+            line = self.line_baudrate()
+            if len(frame) < 4 or not verify_crc(frame):
+                self.stats["ignored"] += 1
+                continue
+            for device in list(self.devices):
+                if frame[0] not in (device.address, 0x00) or (line and line != device.baudrate):
+                    continue
+                if self.rng.random() < device.drop_rate:
+                    self.stats["dropped"] += 1
+                    continue
+                response = device.handle(frame, self.rng)
+                # RK: broadcast ไม่ตอบ / firmware rain, ultrasonic ตอบด้วย id ตัวเองเสมอ
+                if response is None or (frame[0] == 0x00 and not device.firmware):
+                    continue
+                if response[1] & 0x80:
+                    self.stats["exceptions"] += 1
+                if self.rng.random() < device.crc_error_rate:
+                    response = response[:-1] + bytes((response[-1] ^ 0xFF,))
+                    self.stats["crc_errors"] += 1
+                delay = device.latency + self.rng.uniform(-device.jitter, device.jitter)
+                delay += (len(frame) + len(response)) * 11.0 / device.baudrate
+                time.sleep(max(0.0, delay))
+                try:
+                    os.write(self.master, response)
+                except OSError:
+                    return
+                self.stats["replies"] += 1
+                break
+
+
+def _parse_device(arg):
+    """model[@address][:baudrate] -> (model, address, baudrate)"""
+    model, _, baud = arg.partition(":")
+    model, _, address = model.partition("@")
+    return model, int(address, 0) if address else None, int(baud) if baud else 9600
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    flags = {"--latency": "latency", "--jitter": "jitter", "--crc": "crc_error_rate",
+             "--drop": "drop_rate", "--exception": "exception_rate", "--noise": "noise"}
+    seed = None
+    link = None
+    specs = []
+    i = 0
+    while i < len(args):
+        if args[i] in flags:
+            options[flags[args[i]]] = float(args[i + 1])
+            i += 2
+        elif args[i] == "--seed":
+            seed = int(args[i + 1])
+            i += 2
+        elif args[i] == "--link":
+            link = args[i + 1]
+            i += 2
+        else:
+            specs.append(_parse_device(args[i]))
+            i += 1
+    if not specs:
+        specs = [(model, address, 9600) for model, address in DEFAULT_BUS]
+
+    sim = ModbusSimulator(seed=seed)
+    for model, address, baudrate in specs:
+        sim.add(model, address, baudrate, **options)
+    path = sim.start()
+    if link:
+        if os.path.islink(link):
+            os.unlink(link)
+        os.symlink(path, link)
+        path = f"{link} -> {path}"
+    print(f"🧪 Simulated RS485 bus on {path}")
+    for device in sim.devices:
+        print(f"   0x{device.address:02X} {device.model} @ {device.baudrate}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"📊 {sim.stats}")
+    except KeyboardInterrupt:
+        sim.stop()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Register-coalescing read planner
+
+Each sensor type has a register map (quantity -> register, size, format)
+derived from its sensor_models.MODELS entry; the planner keeps no table of
+its own. ModelSensor and the EC / pH drivers' read_values() plan with it.
+The other class_*.py reads (read(), decode() for modbus_async) still
+hard-code their register blocks and scaling. Quantities are raw register
+values (sensor_models applies the scaling).
+
+Given the quantities the caller actually needs, plan() returns the smallest
+set of FC03/FC04 reads that covers them. Two blocks are merged into one
+read when transferring the registers in the gap is cheaper than another
+round trip (8-byte request + 5-byte response overhead + slave turnaround)
+at the line's baud rate. The turnaround is the idle gap the shared bus has
+learned for the device (RS485Bus.turnaround), so there is one estimate.
+
+Plans are cached per (model, quantity set, baud rate, turnaround bucket).
+
+Usage:
+    values = read_planned(modbus, 0x58, "soil_ec", {"ec_value", "salinity"}, baudrate=9600)
+    # {"ec_value": 1.022, "salinity": 562.0}
+"""
+
+import struct
+from functools import lru_cache
+
+
+# Modbus limit for FC03/FC04
+MAX_READ_REGISTERS = 125
+
+# Request (8 bytes) + response header/CRC (5 bytes)
+FRAME_OVERHEAD_BYTES = 13
+
+# Default slave turnaround when nothing has been measured yet
+DEFAULT_TURNAROUND = 0.020
+
+
+def char_time(baudrate):
+    """Seconds per character on the wire (11 bits: start + 8 data + parity/stop + stop)"""
+    return 11.0 / baudrate
+
+
+@lru_cache(maxsize=None)
+def register_map(model):
+    """
+    Register map of a sensor type
+
+    Args:
+        model (str): Key in sensor_models.MODELS
+
+    Returns:
+        dict: {"function": 0x03 / 0x04, "registers": {quantity: (register, count, struct format)}}
+    """
+    # import ที่นี่: sensor_models เองก็วางแผนการอ่านด้วย module นี้ (กัน import วน)
+    from sensor_models import MODELS, TYPES
+    spec = MODELS[model]
+    order = spec.get("byteorder", ">")
+    registers = {
+        name: (reg, TYPES[kind][1], order + TYPES[kind][0])
+        for name, (reg, kind, *_) in spec["fields"].items()
+    }
+    return {"function": spec["read"][0], "registers": registers}
+
+
+class ReadSpan:
+    def __init__(self, function, start, count, fields):
+        """
+        One planned read transaction
+
+        Args:
+            function (int): 0x03 or 0x04
+            start (int): First register
+            count (int): Number of registers
+            fields (tuple): (quantity, register offset, struct.Struct) per value
+        """
+        self.function = function
+        self.start = start
+        self.count = count
+        self.fields = fields
+
+        # All fields of the span in one Struct (gap registers as pad bytes),
+        # so a response is decoded with a single unpack_from. Quantities on
+        # the same register (e.g. rain tips and rainfall) share one slot.
+        slots = sorted({(offset, field.format) for _, offset, field in fields})
+        index = {slot: i for i, slot in enumerate(slots)}
+        self.names = tuple((name, index[(offset, field.format)]) for name, offset, field in fields)
+        fmt = slots[0][1][0] if slots[0][1][0] in "<>!=@" else ">"
+        position = 0
+        for offset, code in slots:
+            size = struct.calcsize(code)
+            fmt += "x" * (2 * (offset - position)) + code.lstrip("<>!=@")
+            position = offset + size // 2
+        self.struct = struct.Struct(fmt)
+
+    def decode(self, response):
+        """{quantity: raw value} from a CRC-checked response frame"""
+        raw = self.struct.unpack_from(response, 3)
+        return {name: raw[i] for name, i in self.names}
+
+    def __repr__(self):
+        names = ", ".join(name for name, _, _ in self.fields)
+        return f"ReadSpan(0x{self.function:02X}, start={self.start}, count={self.count}, [{names}])"
+
+
+def _turnaround_bucket(turnaround):
+    # 1 ms buckets: coarse enough that jitter does not defeat the cache, fine
+    # enough that a 1-2 ms turnaround at 19200+ baud still counts as a cost
+    return int(round(turnaround * 1000))
+
+
+def plan(model, quantities, baudrate=9600, turnaround=None):
+    """
+    Plan the reads needed for a set of quantities
+
+    Args:
+        model (str): Key in sensor_models.MODELS
+        quantities (iterable): Quantity names to read
+        baudrate (int): Line speed
+        turnaround (float, optional): Slave turnaround in seconds
+
+    Returns:
+        tuple: ReadSpan objects, in register order
+    """
+    if turnaround is None:
+        turnaround = DEFAULT_TURNAROUND
+    return _plan(model, frozenset(quantities), baudrate, _turnaround_bucket(turnaround))
+
+
+@lru_cache(maxsize=512)
+def _plan(model, quantities, baudrate, bucket):
+    device = register_map(model)
+    registers = device["registers"]
+    unknown = quantities - set(registers)
+    if unknown:
+        raise KeyError(f"Unknown quantities for {model}: {sorted(unknown)}")
+
+    wanted = sorted((registers[name][0], registers[name][1], name) for name in quantities)
+
+    # Cost of one extra round trip, expressed in register (2 byte) units
+    trip_cost = FRAME_OVERHEAD_BYTES * char_time(baudrate) + bucket / 1000.0
+    gap_limit = trip_cost / (2 * char_time(baudrate))
+
+    blocks = []  # [start, end (exclusive), [quantity, ...]]
+    for reg, size, name in wanted:
+        if blocks:
+            block = blocks[-1]
+            gap = reg - block[1]
+            if gap <= gap_limit and reg + size - block[0] <= MAX_READ_REGISTERS:
+                block[1] = max(block[1], reg + size)
+                block[2].append(name)
+                continue
+        blocks.append([reg, reg + size, [name]])
+
+    return tuple(
+        ReadSpan(
+            device["function"], start, end - start,
+            tuple((name, registers[name][0] - start, struct.Struct(registers[name][2])) for name in names)
+        )
+        for start, end, names in blocks
+    )
+
+
+def read_planned(modbus, address, model, quantities, baudrate=None, cached=False):
+    """
+    Read a set of quantities with the fewest transactions
+
+    Args:
+        modbus (Modbus_Film69): Transport for the device
+        address (int): Slave address
+        model (str): Key in sensor_models.MODELS
+        quantities (iterable): Quantity names to read
+        baudrate (int, optional): Line speed (default: modbus.baudrate)
+        cached (bool): Spans may be answered from the register cache
+
+    Returns:
+        dict: {quantity: raw value}
+    """
+    baudrate = baudrate or modbus.baudrate
+    turnaround = modbus.bus.turnaround.get(address)
+    values = {}
+    for span in plan(model, quantities, baudrate, turnaround):
+        res = modbus.read_response(address, span.function, span.start, span.count, cached)
+        values.update(span.decode(res))
+    return values
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Read-through register cache for the RS485 bus layer
+
+Every clean FC03/FC04 response that passes through RS485Bus.transaction()
+is stored register by register, keyed by (bus, address, function,
+register). A caller that can tolerate slightly stale data passes
+cached=True and gets a response frame rebuilt from the cache, without a
+wire transaction, when every register of the block is younger than the
+device's TTL.
+
+  - TTL per device, set from the model registry (sensor_models "cache_ttl",
+    e.g. rain counter 5 s, soil 60 s); devices without a TTL are never
+    served from the cache
+  - FC05/06/0F/10 writes invalidate the device's registers
+  - bounded memory: LRU eviction beyond max_entries registers
+  - hit / miss / eviction counters for status reporting
+
+Usage:
+    cache = get_cache()
+    cache.set_ttl("/dev/ttyS2", 0x02, 60)
+    resp = bus.transaction(frame, cached=True)     # may not touch the wire
+    print(cache.stats())
+"""
+
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from modbus_crc import append_crc
+from modbus_errors import classify_response
+
+MAX_ENTRIES = 2048  # registers
+
+_REQUEST = struct.Struct(">BBHH")  # address, function, register, count / value
+
+
+class RegisterCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        """
+        Initialize an empty cache
+
+        Args:
+            max_entries (int): Registers kept before the least recently
+                used ones are evicted
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (bus, address, function, register) -> (time, 2 bytes)
+        self.ttl = {}                 # (bus, address) -> seconds
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def set_ttl(self, bus, address, seconds):
+        """Serve a device's registers for `seconds` after they were read (0 disables)"""
+        with self.lock:
+            if seconds:
+                self.ttl[(bus, address)] = seconds
+            else:
+                self.ttl.pop((bus, address), None)
+
+    def lookup(self, bus, request):
+        """
+        Rebuild the response to a read request from fresh cached registers
+
+        Args:
+            bus (str): Bus (tty path)
+            request (bytes): FC03/FC04 request frame
+
+        Returns:
+            bytes or None: Response frame with CRC, None on a miss
+        """
+        address, function, start, count = _REQUEST.unpack_from(request)
+        with self.lock:
+            ttl = self.ttl.get((bus, address))
+            if not ttl:
+                return None
+            oldest = time.monotonic() - ttl
+            data = bytearray()
+            for register in range(start, start + count):
+                key = (bus, address, function, register)
+                entry = self.entries.get(key)
+                if entry is None or entry[0] < oldest:
+                    self.counters["misses"] += 1
+                    return None
+                self.entries.move_to_end(key)
+                data += entry[1]
+            self.counters["hits"] += 1
+        return append_crc(bytes((address, function, 2 * count)) + data)
+
+    def update(self, bus, request, response):
+        """
+        Learn from one transaction: store a clean read, forget on a write
+
+        Args:
+            bus (str): Bus (tty path)
+            request (bytes): Request frame sent
+            response (bytes): Response received (may be empty)
+        """
+        if len(request) < 8:
+            return
+        address, function, start, count = _REQUEST.unpack_from(request)
+        if function in (0x05, 0x06, 0x0F, 0x10):
+            self.invalidate(bus, address)
+            return
+        if function not in (0x03, 0x04):
+            return
+        if (len(response) != 5 + 2 * count or response[0] != address or response[1] != function
+                or classify_response(response) != "ok"):
+            return
+        now = time.monotonic()
+        with self.lock:
+            for i in range(count):
+                key = (bus, address, function, start + i)
+                self.entries[key] = (now, bytes(response[3 + 2 * i:5 + 2 * i]))
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, bus, address=None):
+        """Drop the cached registers of a device (or the whole bus)"""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == bus and address in (None, key[1])]:
+                del self.entries[key]
+            self.counters["invalidations"] += 1
+
+    def stats(self):
+        """
+        Returns:
+            dict: {"entries", "hits", "misses", "evictions", "invalidations", "hit_rate"}
+        """
+        with self.lock:
+            result = dict(self.counters)
+            result["entries"] = len(self.entries)
+        lookups = result["hits"] + result["misses"]
+        result["hit_rate"] = round(result["hits"] / lookups, 3) if lookups else None
+        return result
+
+
+_cache = RegisterCache()
+
+
+def get_cache():
+    """The process-wide cache shared by every RS485Bus"""
+    return _cache
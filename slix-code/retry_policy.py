@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Per-device adaptive retry budget
+
+Each device (tty, slave address) keeps a rolling window of its recent
+reads: whether the read succeeded and how many attempts it took. The
+retry budget follows that history:
+
+  - healthy  (first attempt almost always works): 1 retry, whatever the default
+  - failing  (rarely answers at all):             1 probe, no retries
+  - degraded (answers, but often needs retries):  the driver's default
+
+so a sensor that has been dead for a week costs one probe per cycle
+instead of its full retry budget.
+
+Usage:
+    policy = get_policy("/dev/ttyS2", 0x32)
+    attempts = policy.attempts(default=5)
+    ...
+    policy.record(success, attempts_used)
+"""
+
+import threading
+from collections import deque
+
+# Rolling window (reads) and thresholds
+HISTORY_SIZE = 20
+MIN_SAMPLES = 5
+HEALTHY_FIRST_ATTEMPT_RATE = 0.9
+FAILING_SUCCESS_RATE = 0.2
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_policy(port, address):
+    """
+    Return the shared RetryPolicy for a device, creating it on first use
+
+    Args:
+        port (str): Serial port path
+        address (int): Slave address
+
+    Returns:
+        RetryPolicy: Policy for this device
+    """
+    with _policies_lock:
+        policy = _policies.get((port, address))
+        if policy is None:
+            policy = RetryPolicy()
+            _policies[(port, address)] = policy
+        return policy
+
+
+class RetryPolicy:
+    def __init__(self, history_size=HISTORY_SIZE):
+        """
+        Initialize an empty history (full default budget until MIN_SAMPLES reads)
+
+        Args:
+            history_size (int): Number of recent reads kept
+        """
+        self.history = deque(maxlen=history_size)
+
+    def record(self, success, attempts):
+        """
+        Record the result of one read
+
+        Args:
+            success (bool): The read returned valid data
+            attempts (int): Attempts used (transactions sent)
+        """
+        self.history.append((bool(success), max(1, attempts)))
+
+    @property
+    def success_rate(self):
+        if not self.history:
+            return None
+        return sum(1 for success, _ in self.history if success) / len(self.history)
+
+    @property
+    def first_attempt_rate(self):
+        if not self.history:
+            return None
+        return sum(1 for success, attempts in self.history if success and attempts == 1) / len(self.history)
+
+    @property
+    def health(self):
+        """
+        Returns:
+            str: "unknown", "healthy", "degraded" or "failing"
+        """
+        if len(self.history) < MIN_SAMPLES:
+            return "unknown"
+        if self.success_rate <= FAILING_SUCCESS_RATE:
+            return "failing"
+        if self.first_attempt_rate >= HEALTHY_FIRST_ATTEMPT_RATE:
+            return "healthy"
+        return "degraded"
+
+    def attempts(self, default):
+        """
+        Attempts to spend on the next read
+
+        Args:
+            default (int): The driver's normal budget
+
+        Returns:
+            int: 2 for healthy (one retry), 1 for failing, otherwise default
+        """
+        health = self.health
+        if health == "healthy":
+            return 2
+        if health == "failing":
+            return 1
+        return default
+
+    def state(self, default=5):
+        """Policy state for status reporting (retry_budget for a driver default)"""
+        success_rate = self.success_rate
+        first_attempt_rate = self.first_attempt_rate
+        return {
+            "health": self.health,
+            "samples": len(self.history),
+            "success_rate": None if success_rate is None else round(success_rate, 2),
+            "first_attempt_rate": None if first_attempt_rate is None else round(first_attempt_rate, 2),
+            "retry_budget": self.attempts(default)
+        }
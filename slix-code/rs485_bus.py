@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Shared RS485 Bus Manager
+
+One RS485Bus object owns the single open file descriptor of a tty
+(e.g. /dev/ttyS2) and hands out Modbus RTU transactions to every sensor
+class on that line. The port is opened and configured (termios) once and
+then kept open; per-sensor line settings (baudrate, timeout) are applied
+in place on the same descriptor.
+
+Responses are received frame-length aware: the 3-byte header gives the
+function code (and byte count for reads), so the read returns as soon as
+the frame is complete instead of waiting for the timeout. Unknown function
+codes fall back to the Modbus 3.5-character silence rule.
+
+Before each request the bus waits only for the idle gap the addressed
+device has proven to need (its turnaround). A device not heard yet
+starts at a short gap (INITIAL_TURNAROUND, not the old fixed 0.2 s pad,
+which a cold start would pay once per device), shrinks towards the
+Modbus t3.5 minimum while it answers cleanly and backs off when CRC
+errors or partial frames show up.
+
+A deadline window bounds the total time a driver may spend on the bus
+(all retries included): every transaction's read timeout is clipped to
+the remaining budget and, once it is spent, transaction() raises
+BusDeadlineExceeded instead of touching the line.
+
+Every clean register read also feeds the shared register cache
+(register_cache.py) and every write invalidates the device in it; a
+caller that tolerates slightly stale data passes cached=True and is
+answered from the cache, without a wire transaction, while the device's
+TTL holds.
+
+Capture mode (start_recording()) appends every TX / RX frame with its
+monotonic timestamp to a rotating binary log (frame_recorder.py) that
+frame_replay.py can feed back to the drivers.
+
+bus.metrics (bus_metrics.py) keeps per-device log-bucketed histograms of
+round-trip latency and outcome counters of every transaction.
+
+Usage:
+    bus = get_bus("/dev/ttyS2")
+    with bus:                       # hold the bus for a multi-frame session
+        resp = bus.transaction(frame, baudrate=9600, timeout=1.0)
+
+    with bus.deadline(2.0) as window:
+        data = sensor.read_tip()
+    print(window.outcome)           # ok / timeout / crc / exception / no-device
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+import serial
+from modbus_errors import BusDeadlineExceeded, classify_response
+from register_cache import get_cache
+from frame_recorder import FrameRecorder
+from bus_metrics import BusMetrics
+
+# One bus per tty for the whole process
+_buses = {}
+_buses_lock = threading.Lock()
+
+# Learned turnaround (bus idle gap before a request), seconds
+INITIAL_TURNAROUND = 0.02   # device not heard yet (the main loop used to sleep 0.2 s)
+MAX_TURNAROUND = 1.0
+TURNAROUND_DECAY = 0.7      # on a clean answer
+TURNAROUND_BACKOFF = 2.0    # on CRC error / partial frame
+
+
+def get_bus(port="/dev/ttyS2", baudrate=9600, timeout=1.0):
+    """
+    Return the shared RS485Bus for a tty, creating it on first use
+
+    Args:
+        port (str): Serial port path
+        baudrate (int): Initial baud rate when the bus is created
+        timeout (float): Initial read timeout in seconds
+
+    Returns:
+        RS485Bus: The bus owner for this port
+    """
+    with _buses_lock:
+        bus = _buses.get(port)
+        if bus is None:
+            bus = RS485Bus(port, baudrate=baudrate, timeout=timeout)
+            _buses[port] = bus
+        return bus
+
+
+def close_all_buses():
+    """Close every bus opened through get_bus() (and flush its capture)"""
+    with _buses_lock:
+        for bus in _buses.values():
+            bus.stop_recording()
+            bus.close()
+
+
+def frame_length(header):
+    """
+    Expected length of a Modbus RTU response from its first 3 bytes
+
+    Args:
+        header (bytes): [addr, func, byte_count / exception_code / reg_H]
+
+    Returns:
+        int or None: Total frame length including CRC, None if unknown
+    """
+    function = header[1]
+    if function & 0x80:
+        # Exception: Addr(1) + Func|0x80(1) + Code(1) + CRC(2)
+        return 5
+    if function in (0x01, 0x02, 0x03, 0x04):
+        # Read: Addr(1) + Func(1) + Count(1) + Data(N) + CRC(2)
+        return 5 + header[2]
+    if function in (0x05, 0x06, 0x0F, 0x10):
+        # Write echo: Addr(1) + Func(1) + Reg(2) + Val/Qty(2) + CRC(2)
+        return 8
+    return None
+
+
+def silence_time(baudrate):
+    """
+    Modbus t3.5 inter-frame silence in seconds
+
+    1 character = 11 bits (start + 8 data + parity/stop + stop).
+    Above 19200 baud the spec fixes t3.5 at 1.75 ms.
+    """
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * 11.0 / baudrate
+
+
+class DeadlineWindow:
+    def __init__(self, expires):
+        """
+        Time budget for one sensor read, shared by all its transactions
+
+        Args:
+            expires (float): time.monotonic() value at which the budget ends
+        """
+        self.expires = expires
+        self.transactions = 0
+        self.cache_hits = 0
+        self.outcome = "no-device"
+        self.expired = False
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def record(self, outcome):
+        self.transactions += 1
+        self.outcome = outcome
+
+
+class RS485Bus:
+    def __init__(self, port="/dev/ttyS2", baudrate=9600, timeout=1.0):
+        """
+        Initialize bus owner (the port is opened lazily on first use)
+
+        Args:
+            port (str): Serial port path
+            baudrate (int): Default baud rate
+            timeout (float): Default read timeout in seconds
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.serial = None
+        self.window = None
+        self.cache = get_cache()
+        self.recorder = None
+        self.metrics = BusMetrics()
+
+        # Per slave address: learned idle gap before the next request
+        self.turnaround = {}
+        self._idle_since = 0.0
+
+        # RLock so a driver can hold the bus for a retry sequence
+        # and still call transaction() inside it
+        self.lock = threading.RLock()
+
+        self.stats = {
+            "opens": 0,
+            "transactions": 0,
+            "line_changes": 0,
+            "serial_errors": 0,
+            "turnaround_wait": 0.0
+        }
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.lock.release()
+        return False
+
+    @property
+    def is_open(self):
+        return self.serial is not None and self.serial.is_open
+
+    def open(self):
+        """Open the port if it is not open yet and return the serial object"""
+        with self.lock:
+            if not self.is_open:
+                self.serial = serial.Serial(
+                    port=self.port,
+                    baudrate=self.baudrate,
+                    bytesize=serial.EIGHTBITS,
+                    parity=serial.PARITY_NONE,
+                    stopbits=serial.STOPBITS_ONE,
+                    timeout=self.timeout
+                )
+                self.stats["opens"] += 1
+            return self.serial
+
+    def configure(self, baudrate=None, timeout=None):
+        """
+        Apply line settings on the open descriptor
+
+        pyserial pushes the new settings with tcsetattr() on the same fd,
+        so nothing is closed or reopened. Unchanged settings are skipped.
+
+        Returns:
+            bool: True if the baud rate was changed
+        """
+        with self.lock:
+            ser = self.open()
+            changed = False
+            if baudrate is not None and ser.baudrate != baudrate:
+                ser.baudrate = baudrate
+                self.baudrate = baudrate
+                self.stats["line_changes"] += 1
+                changed = True
+            if timeout is not None and ser.timeout != timeout:
+                ser.timeout = timeout
+            return changed
+
+    @contextmanager
+    def deadline(self, seconds):
+        """
+        Hold the bus and bound every transaction inside the block
+
+        Nested windows never extend the outer budget.
+
+        Args:
+            seconds (float): Total budget for the block
+
+        Yields:
+            DeadlineWindow: Collects the outcome of the last transaction
+        """
+        with self.lock:
+            outer = self.window
+            expires = time.monotonic() + seconds
+            if outer is not None:
+                expires = min(expires, outer.expires)
+            self.window = DeadlineWindow(expires)
+            try:
+                yield self.window
+            finally:
+                if outer is not None and self.window.cache_hits:
+                    outer.cache_hits += self.window.cache_hits
+                    outer.outcome = self.window.outcome
+                if outer is not None and self.window.transactions:
+                    outer.record(self.window.outcome)
+                    outer.expired = outer.expired or self.window.expired
+                self.window = outer
+
+    def budget(self, timeout, attempts_left=1):
+        """
+        Read timeout for the next attempt under the current deadline
+
+        The remaining budget is split evenly over the attempts still to
+        come so a driver's last retry is not starved by the first one.
+
+        Args:
+            timeout (float): Timeout the driver would use without a deadline
+            attempts_left (int): Attempts remaining, including this one
+
+        Returns:
+            float: Timeout to pass to transaction()
+        """
+        window = self.window
+        if window is None:
+            return timeout
+        share = window.remaining() / max(1, attempts_left)
+        return share if timeout is None else min(timeout, share)
+
+    def sleep(self, seconds):
+        """
+        Sleep between retries without running past the deadline
+
+        None means no extra pause: the learned turnaround is already
+        enforced before the next request.
+        """
+        if seconds is None:
+            return
+        window = self.window
+        if window is not None:
+            seconds = min(seconds, window.remaining())
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _wait_turnaround(self, address, baudrate, gap=None):
+        """
+        Keep the line idle for the gap the addressed device needs
+
+        An explicit gap is used as given (the caller owns the timing);
+        a learned one never goes below t3.5.
+        """
+        if gap is None:
+            gap = max(self.turnaround.get(address, INITIAL_TURNAROUND), silence_time(baudrate))
+        wait = self._idle_since + gap - time.monotonic()
+        if self.window is not None:
+            wait = min(wait, self.window.remaining())
+        if wait > 0:
+            time.sleep(wait)
+            self.stats["turnaround_wait"] += wait
+
+    def _learn_turnaround(self, address, baudrate, outcome):
+        """Shrink the gap after clean answers, back off on corrupt ones"""
+        gap = self.turnaround.get(address, INITIAL_TURNAROUND)
+        if outcome in ("ok", "exception"):
+            gap = max(silence_time(baudrate), gap * TURNAROUND_DECAY)
+        elif outcome in ("crc", "timeout"):
+            gap = min(MAX_TURNAROUND, gap * TURNAROUND_BACKOFF + silence_time(baudrate))
+        # "no-device": nothing learned
+        self.turnaround[address] = gap
+
+    def receive(self):
+        """
+        Read one response frame from the open port
+
+        Reads the 3-byte header, works out the frame length from the
+        function code / byte count and reads exactly the rest. If the
+        function code is unknown, keeps reading until the line has been
+        silent for 3.5 character times.
+
+        The port's read timeout bounds the whole frame, not each read:
+        pyserial applies it per read() call, so the body read only gets
+        what the header read left over.
+
+        Returns:
+            bytes: Received frame (may be short or empty on timeout)
+        """
+        ser = self.serial
+        timeout = ser.timeout
+        end = time.monotonic() + (timeout or 0)
+        header = ser.read(3)
+        if len(header) < 3:
+            return header
+
+        length = frame_length(header)
+        if length is not None:
+            if timeout is None:
+                return header + ser.read(length - 3)
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                # Whole frame already waiting: take it without blocking
+                return header + ser.read(min(ser.in_waiting, length - 3))
+            ser.timeout = remaining
+            try:
+                return header + ser.read(length - 3)
+            finally:
+                ser.timeout = timeout
+
+        # Unknown frame layout: read until t3.5 silence (or the frame deadline)
+        frame = bytearray(header)
+        silence = silence_time(ser.baudrate)
+        while time.monotonic() < end:
+            waiting = ser.in_waiting
+            if waiting:
+                frame += ser.read(waiting)
+                continue
+            time.sleep(silence)
+            if not ser.in_waiting:
+                break
+        return bytes(frame)
+
+    def transaction(self, request, response_len=None, baudrate=None, timeout=None, turnaround=None,
+                    cached=False):
+        """
+        Send one request frame and read the response
+
+        Args:
+            request (bytes): Complete request frame including CRC
+            response_len (int, optional): Fixed number of bytes to read back;
+                None detects the frame length from the response header
+            baudrate (int, optional): Line speed for this transaction
+            timeout (float, optional): Read timeout for this transaction
+            turnaround (float, optional): Idle gap before this request instead
+                of the learned one (address probes during discovery)
+            cached (bool): FC03/FC04 only: answer from the register cache
+                when every register is within the device's TTL
+
+        Returns:
+            bytes: Response bytes (may be short on timeout)
+
+        Raises:
+            BusDeadlineExceeded: The current deadline window is used up
+        """
+        if cached and request[1] in (0x03, 0x04):
+            response = self.cache.lookup(self.port, request)
+            if response is not None:
+                # ไม่รอ lock: window เป็นของเราก็ต่อเมื่อเราถือ bus อยู่แล้ว
+                if self.lock.acquire(blocking=False):
+                    try:
+                        if self.window is not None:
+                            self.window.cache_hits += 1
+                            self.window.outcome = "ok"
+                    finally:
+                        self.lock.release()
+                return response
+        with self.lock:
+            window = self.window
+            if window is not None:
+                remaining = window.remaining()
+                if remaining <= 0:
+                    window.expired = True
+                    window.outcome = "timeout"
+                    raise BusDeadlineExceeded("Read deadline exceeded")
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            address = request[0]
+            try:
+                self.configure(baudrate, timeout)
+                ser = self.serial
+                self._wait_turnaround(address, ser.baudrate, turnaround)
+                ser.reset_input_buffer()
+                ser.write(bytes(request))
+                ser.flush()
+                sent = time.monotonic()
+                if self.recorder is not None:
+                    self.recorder.tx(request, ser.baudrate)
+                if response_len is None:
+                    response = self.receive()
+                else:
+                    response = ser.read(response_len)
+                if self.recorder is not None:
+                    self.recorder.rx(response)
+            except (serial.SerialException, OSError):
+                # Drop the descriptor so the next call reopens it
+                self.stats["serial_errors"] += 1
+                self.close()
+                raise
+            finally:
+                self._idle_since = time.monotonic()
+            self.stats["transactions"] += 1
+            self.cache.update(self.port, request, response)
+            outcome = classify_response(response)
+            self.metrics.record_transaction(address, self._idle_since - sent, outcome)
+            self._learn_turnaround(address, ser.baudrate, outcome)
+            if window is not None:
+                window.record(outcome)
+            return response
+
+    def start_recording(self, path, **options):
+        """
+        Capture every frame on this bus to a rotating binary log
+
+        Args:
+            path (str): Log file path
+            **options: max_bytes, backups (see FrameRecorder)
+        """
+        with self.lock:
+            self.stop_recording()
+            self.recorder = FrameRecorder(path, **options)
+        print(f"⏺️ Recording {self.port} to {path}")
+
+    def stop_recording(self):
+        """Stop capture mode and close the log"""
+        with self.lock:
+            if self.recorder is not None:
+                self.recorder.close()
+                self.recorder = None
+
+    def close(self):
+        """Close the port (it is reopened on the next transaction)"""
+        with self.lock:
+            if self.serial is not None:
+                try:
+                    self.serial.close()
+                except Exception:
+                    pass
+                self.serial = None
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+Declarative sensor model registry
+
+Every sensor type is one table entry: the register block to read, the
+fields in it (data type, scaling, unit), the quantities published to
+ThingsBoard and the address-change procedure. compile_model() turns an
+entry into a CompiledModel with one precomputed struct.Struct for the
+whole block (unused registers become pad bytes), so decoding a response
+is a single unpack_from() plus the scaling. read_planner derives its
+register maps from this table, and ModelSensor reads the fields through
+read_planner.plan(). The class_*.py drivers' own read() / decode() still
+carry their register blocks and scaling.
+
+ModelSensor is the generic driver the main loop builds for every port:
+adding a sensor type is a new MODELS entry, not a new class and another
+branch in read_sensor_with_timeout(). The hand-written class_*.py drivers
+stay as bench / commissioning tools.
+
+Field: name -> (register, type, scale, offset, digits, unit)
+    value = raw * scale + offset, rounded to `digits` (None: no rounding)
+    types: u16, i16, u32, i32, f32 (2 registers, byte order of the model)
+
+Optional per entry: "attempts" (default 2), "timeout" (s per attempt,
+default 0.3), "byteorder" (default ">"), "derived" {name: (input fields, fn(values))},
+"burst" False for devices that must not be oversampled, "cache_ttl" (s a
+read stays servable from the register cache, default 0: never),
+"counter" True when reading clears the value (the poller then always
+reads the wire; the cache only serves other consumers).
+
+Burst mode (per device, e.g. sensor_config "burst": {"samples": 5,
+"reduce": "median"}): N back-to-back reads in one bus session, reduced
+per field to median / trimmed mean / mode. Only the aggregate is
+returned; the spread (min, max, stdev) is kept in sensor.last_burst.
+
+Address-change step: (target, function, register, value)
+    target: "old" / "new" slave address, or "broadcast" (0x00)
+    value:  int or "new" (the new address)
+    register None sends [target, function, value] as a raw frame
+
+Usage:
+    sensor = ModelSensor("soil", port="/dev/ttyS2", slave_address=0x02)
+    sensor.read()        # {"soil_temperature": 24.1, "soil_moisture": 31.5}
+    sensor.publish()     # only the quantities sent to ThingsBoard
+"""
+
+import statistics
+import struct
+from functools import lru_cache
+
+from Modbus_485 import Modbus_Film69
+from modbus_crc import append_crc, request_frame
+from modbus_errors import ModbusError, BusDeadlineExceeded, check_response
+from retry_policy import get_policy
+from read_planner import read_planned
+from class_soilPH_RK500 import SensorSoilPHRK500_22
+
+# Attempts per read when a model does not set "attempts" (one retry)
+DEFAULT_ATTEMPTS = 2
+
+# struct code and register count per data type
+TYPES = {
+    "u16": ("H", 1),
+    "i16": ("h", 1),
+    "u32": ("I", 2),
+    "i32": ("i", 2),
+    "f32": ("f", 2),
+}
+
+MODELS = {
+    # RK120 wind speed / direction
+    "wind": {
+        "model": "RK120",
+        "read": (0x03, 0x0000, 2),
+        "cache_ttl": 5,
+        "fields": {
+            "wind_speed": (0x0000, "u16", 0.1, 0, 1, "m/s"),
+            "wind_direction": (0x0001, "u16", 1, 0, None, "°"),
+        },
+        "publish": ("wind_speed", "wind_direction"),
+        "set_address": (("old", 0x06, 0x0020, "new"),),
+    },
+    # RK520 soil temperature / moisture (x10)
+    "soil": {
+        "model": "RK520",
+        "read": (0x03, 0x0000, 2),
+        "cache_ttl": 60,
+        "fields": {
+            "soil_temperature": (0x0000, "i16", 0.1, 0, 1, "°C"),
+            "soil_moisture": (0x0001, "u16", 0.1, 0, 1, "%"),
+        },
+        "publish": ("soil_moisture", "soil_temperature"),
+        "set_address": (("old", 0x06, 0x0200, "new"),),  # มีผลหลังรีสตาร์ท sensor
+    },
+    # MW485 / SN-3000-WS-N01 humidity / temperature (x10)
+    "air_temp": {
+        "model": "MW485",
+        "read": (0x03, 0x0000, 2),
+        "cache_ttl": 30,
+        "timeout": 1.0,
+        "fields": {
+            "humidity": (0x0000, "u16", 0.1, 0, 1, "%RH"),
+            "temperature": (0x0001, "i16", 0.1, 0, 1, "°C"),
+        },
+        "publish": ("temperature", "humidity"),
+        "set_address": (("old", 0x06, 0x07D0, "new"),),
+    },
+    # RK200 pyranometer
+    "solar": {
+        "model": "RK200",
+        "read": (0x03, 0x0000, 1),
+        "cache_ttl": 10,
+        "fields": {
+            "solar_radiation": (0x0000, "u16", 1, 0, None, "W/m²"),
+        },
+        "publish": ("solar_radiation",),
+        "set_address": (("broadcast", 0x10, None, "new"),),  # ต้องมีตัวเดียวบน bus
+    },
+    # RK400 tipping bucket (custom firmware, clears the count on read)
+    "rainfall": {
+        "model": "RK400",
+        "read": (0x03, 0x0000, 1),
+        "cache_ttl": 5,
+        "timeout": 1.0,
+        "attempts": 5,
+        "burst": False,  # อ่านแล้วตัวนับถูกล้าง ห้ามอ่านซ้ำหลายครั้ง
+        "counter": True,
+        "fields": {
+            "rain_tip_count": (0x0000, "u16", 1, 0, None, "tips"),
+            "rainfall": (0x0000, "u16", 0.2, 0, 1, "mm"),
+        },
+        "publish": ("rainfall",),
+        "set_address": (("old", 0x06, 0x0100, "new"),),
+    },
+    # RCWL ultrasonic (same firmware family as the rain gauge)
+    "ultrasonic": {
+        "model": "RCWL",
+        "read": (0x03, 0x0000, 1),
+        "cache_ttl": 5,
+        "timeout": 1.0,
+        "attempts": 5,
+        "fields": {
+            "distance_cm": (0x0000, "u16", 1, 0, None, "cm"),
+            "distance_formula": (0x0000, "u16", -1, 147, None, "cm"),  # ปรับตามการสอบเทียบ
+        },
+        "publish": ("distance_cm", "distance_formula"),
+        "set_address": (("old", 0x06, 0x0100, "new"),),
+    },
+    # RK500-23 soil EC (5 x float32 ABCD)
+    "soil_ec": {
+        "model": "RK500-23",
+        "read": (0x03, 0x0000, 10),
+        "cache_ttl": 60,
+        "fields": {
+            "ec_value": (0x0000, "f32", 1, 0, 3, "mS/cm"),
+            "parameter_1": (0x0002, "f32", 1, 0, 3, None),
+            "parameter_2": (0x0004, "f32", 1, 0, 3, None),
+            "parameter_3": (0x0006, "f32", 1, 0, 3, None),
+            "salinity": (0x0008, "f32", 1, 0, 1, "ppm"),
+        },
+        "publish": ("ec_value", "salinity"),
+        "set_address": (("old", 0x06, 0x0014, "new"),),
+    },
+    # RK500-22 soil pH (3 x float32 ABCD)
+    "soil_ph": {
+        "model": "RK500-22",
+        "read": (0x03, 0x0000, 6),
+        "cache_ttl": 60,
+        "fields": {
+            "ph_value": (0x0000, "f32", 1, 0, 2, "pH"),
+            "parameter": (0x0002, "f32", 1, 0, 2, None),
+            "temperature": (0x0004, "f32", 1, 0, 2, "°C"),
+        },
+        "derived": {
+            "ph_classification": (
+                ("ph_value",),
+                lambda values: SensorSoilPHRK500_22.classify_soil_ph(values["ph_value"])["level"],
+            ),
+        },
+        "publish": ("ph_value", "temperature", "ph_classification"),
+        "set_address": (("old", 0x06, 0x0014, "new"),),
+    },
+    # RKL-01 liquid level, reported like the ultrasonic (73 cm mount offset)
+    "liquid_level": {
+        "model": "RKL-01",
+        "read": (0x03, 0x0004, 1),
+        "cache_ttl": 30,
+        "fields": {
+            "raw_value": (0x0004, "u16", 1, 0, None, "mm"),
+            "water_level": (0x0004, "u16", -0.1, 73, 1, "cm"),
+        },
+        "publish": ("water_level", "raw_value"),
+        "set_address": (("old", 0x06, 0x0000, "new"), ("new", 0x06, 0x000F, 0)),  # set + save
+    },
+}
+
+# Fraction dropped at each end by the trimmed mean
+TRIM_FRACTION = 0.2
+
+
+def _trimmed_mean(values):
+    ordered = sorted(values)
+    k = int(len(ordered) * TRIM_FRACTION)
+    if len(ordered) > 2 * k:
+        ordered = ordered[k:len(ordered) - k]
+    return sum(ordered) / len(ordered)
+
+
+def _mode(values):
+    # Most frequent value; ties go to the median of the tied values
+    return statistics.median(statistics.multimode(values))
+
+
+REDUCERS = {
+    "median": statistics.median,
+    "trimmed": _trimmed_mean,
+    "mode": _mode,
+}
+
+
+class CompiledModel:
+    def __init__(self, name, spec):
+        """
+        Precompute the decoder of one MODELS entry
+
+        Args:
+            name (str): Key in MODELS
+            spec (dict): The MODELS entry
+        """
+        self.name = name
+        self.spec = spec
+        self.function, self.start, self.count = spec["read"]
+        self.response_len = 5 + 2 * self.count
+        self.publish_keys = spec["publish"]
+        derived = spec.get("derived", {})
+        self.derived = tuple((field, fn) for field, (_, fn) in derived.items())
+        self.units = {field: entry[5] for field, entry in spec["fields"].items()}
+
+        # Fields ModelSensor reads: the published ones plus the inputs of the
+        # derived values; read_planner drops the registers of the rest
+        needed = set()
+        for inputs, _ in derived.values():
+            needed.update(inputs)
+        for key in self.publish_keys:
+            if key in spec["fields"]:
+                needed.add(key)
+            elif key not in derived:
+                raise ValueError(f"{name}: published key {key} is neither a field nor derived")
+        self.quantities = frozenset(needed)
+
+        # One struct code per distinct (register, type); gaps become pad bytes
+        slots = sorted({(reg, kind) for reg, kind, *_ in spec["fields"].values()})
+        fmt = spec.get("byteorder", ">")
+        index = {}
+        position = self.start
+        for reg, kind in slots:
+            code, size = TYPES[kind]
+            if reg < position or reg + size > self.start + self.count:
+                raise ValueError(f"{name}: field at 0x{reg:04X} outside the read block or overlapping")
+            fmt += "x" * (2 * (reg - position)) + code
+            index[(reg, kind)] = len(index)
+            position = reg + size
+        self.struct = struct.Struct(fmt)
+
+        self.fields = tuple(
+            (field, index[(reg, kind)], scale, offset, digits)
+            for field, (reg, kind, scale, offset, digits, _) in spec["fields"].items()
+        )
+        self.read_fields = tuple(entry for entry in self.fields if entry[0] in self.quantities)
+
+    def decode(self, frame):
+        """
+        Decode a CRC-checked response frame
+
+        Returns:
+            dict: {field: scaled value, derived: value}
+        """
+        return self.derive(self.decode_fields(frame))
+
+    def decode_fields(self, frame):
+        """Scaled register fields of a response frame (no derived values)"""
+        raw = self.struct.unpack_from(frame, 3)
+        values = {}
+        for field, i, scale, offset, digits in self.fields:
+            value = raw[i] * scale + offset
+            values[field] = value if digits is None else round(value, digits)
+        return values
+
+    def scale(self, raw):
+        """Scaled values of the planned fields from read_planner output ({field: raw})"""
+        values = {}
+        for field, _, scale, offset, digits in self.read_fields:
+            value = raw[field] * scale + offset
+            values[field] = value if digits is None else round(value, digits)
+        return values
+
+    def derive(self, values):
+        """Add the derived values (in place) and return the dict"""
+        for field, fn in self.derived:
+            values[field] = fn(values)
+        return values
+
+    def aggregate(self, samples, reduce="median"):
+        """
+        Reduce burst samples field by field
+
+        Args:
+            samples (list): scale() dicts
+            reduce (str): Key in REDUCERS
+
+        Returns:
+            tuple: (values with derived, {field: {"min", "max", "stdev"}})
+        """
+        reducer = REDUCERS[reduce]
+        values = {}
+        spread = {}
+        for field, _, _, _, digits in self.read_fields:
+            column = [sample[field] for sample in samples]
+            value = reducer(column)
+            values[field] = value if digits is None else round(value, digits)
+            spread[field] = {
+                "min": min(column),
+                "max": max(column),
+                "stdev": round(statistics.pstdev(column), 4)
+            }
+        return self.derive(values), spread
+
+
+@lru_cache(maxsize=None)
+def compile_model(name):
+    """CompiledModel for a MODELS key (compiled once per process)"""
+    return CompiledModel(name, MODELS[name])
+
+
+class ModelSensor:
+    def __init__(self, model, port="/dev/ttyS2", slave_address=1, baudrate=9600, burst=None):
+        """
+        Generic driver for any MODELS entry
+
+        Args:
+            model (str): Key in MODELS (sensor type)
+            port (str): Serial port path
+            slave_address (int): Modbus slave address
+            baudrate (int): Line speed
+            burst (dict, optional): {"samples": N, "reduce": "median" | "trimmed" | "mode"}
+        """
+        self.model = compile_model(model)
+        self.port = port
+        self.slave_address = slave_address
+        self.baudrate = baudrate
+        self.burst = None
+        self.last_burst = None
+        if burst and burst.get("samples", 1) > 1:
+            if self.model.spec.get("burst", True) is False:
+                print(f"⚠️ {model}: burst mode not allowed, using single reads")
+            else:
+                if burst.get("reduce", "median") not in REDUCERS:
+                    raise ValueError(f"Unknown burst reduce: {burst['reduce']}")
+                self.burst = {"samples": burst["samples"], "reduce": burst.get("reduce", "median")}
+        self.modbus = Modbus_Film69(port=port, slaveaddress=slave_address, baudrate=baudrate)
+        self.timeout = self.model.spec.get("timeout", self.modbus.timeout)
+        self.modbus.timeout = self.timeout
+        self.attempts = self.model.spec.get("attempts", DEFAULT_ATTEMPTS)
+        self.modbus.bus.cache.set_ttl(port, slave_address, self.model.spec.get("cache_ttl", 0))
+
+        # Register block for modbus_async.read_sensor()
+        method = "read_holding" if self.model.function == 0x03 else "read_input"
+        self.READ = (method, self.model.start, self.model.count)
+
+    def read(self, addr=None, max_attempts=None, cached=False):
+        """
+        Read and decode the fields the model publishes
+
+        The registers are read as read_planner plans them for the
+        published fields and the inputs of the derived values. Retries follow the device's retry policy and split the
+        remaining deadline window between them (bus.budget); exception
+        responses (illegal address etc.) and a spent deadline stop at once.
+        cached=True accepts a block younger than the model's "cache_ttl"
+        (ignored for "counter" models: the read is what clears them).
+
+        Returns:
+            dict or None: Planned fields and derived values, None if the device did not answer
+        """
+        address = addr if addr is not None else self.slave_address
+        if max_attempts is None:
+            max_attempts = get_policy(self.port, address).attempts(self.attempts)
+        model = self.model
+        cached = cached and not model.spec.get("counter")
+        for attempt in range(1, max_attempts + 1):
+            self.modbus.timeout = self.modbus.bus.budget(self.timeout, max_attempts - attempt + 1)
+            try:
+                return model.derive(self._read_fields(address, cached))
+            except ModbusError as e:
+                print(f"{model.name} 0x{address:02X} read failed ({attempt}/{max_attempts}): {e}")
+                if not e.retryable:
+                    break
+        return None
+
+    def read_burst(self, samples, reduce="median", addr=None):
+        """
+        N back-to-back reads in one bus session, reduced to one reading
+
+        The bus is held for the whole burst, so the reads follow each
+        other with only the device's learned turnaround in between.
+        Each sample gets its share of the remaining deadline window
+        (bus.budget). Failed samples are skipped; the burst stops early
+        when the deadline is spent or the device rejects the request.
+
+        Returns:
+            dict or None: Aggregated values, None if no sample succeeded
+        """
+        address = addr if addr is not None else self.slave_address
+        model = self.model
+        collected = []
+        bus = self.modbus.bus
+        with bus:
+            for sample in range(samples):
+                # ส่วนแบ่งของ deadline ต่อ sample ที่เหลือ (เหมือน read())
+                self.modbus.timeout = bus.budget(self.timeout, samples - sample)
+                try:
+                    collected.append(self._read_fields(address))
+                except BusDeadlineExceeded:
+                    break
+                except ModbusError as e:
+                    print(f"{model.name} 0x{address:02X} burst sample failed: {e}")
+                    if not e.retryable:
+                        break
+        if not collected:
+            self.last_burst = {"samples": 0, "requested": samples}
+            return None
+        values, spread = model.aggregate(collected, reduce)
+        self.last_burst = {"samples": len(collected), "requested": samples, "reduce": reduce, "spread": spread}
+        return values
+
+    def _read_fields(self, address, cached=False):
+        """Scaled register fields of one planned read (no derived values)"""
+        raw = read_planned(self.modbus, address, self.model.name, self.model.quantities, self.baudrate, cached)
+        return self.model.scale(raw)
+
+    def publish(self, addr=None, cached=False):
+        """Read (burst if configured) and keep only the quantities published to ThingsBoard"""
+        if self.burst:
+            values = self.read_burst(self.burst["samples"], self.burst["reduce"], addr)
+        else:
+            values = self.read(addr, cached=cached)
+        if values is None:
+            return None
+        return {key: values.get(key) for key in self.model.publish_keys}
+
+    def decode(self, registers):
+        """Decode uint16 registers (as returned by modbus_async read_holding)"""
+        frame = bytes(3) + struct.pack(f">{len(registers)}H", *registers)
+        return self.model.decode(frame)
+
+    def set_address(self, new_address):
+        """
+        Run the model's address-change procedure
+
+        Returns:
+            bool: True if every step was acknowledged
+        """
+        if not (1 <= new_address <= 247):
+            raise ValueError("Address must be between 1 and 247")
+        targets = {"old": self.slave_address, "new": new_address, "broadcast": 0x00}
+        for target, function, register, value in self.model.spec["set_address"]:
+            address = targets[target]
+            value = new_address if value == "new" else value
+            if register is None:
+                frame = append_crc(bytes((address, function, value)))
+            else:
+                frame = request_frame(address, function, register, value)
+            try:
+                if address == 0x00:
+                    # Broadcast: no answer is required
+                    self.modbus.bus.transaction(frame, 3, baudrate=self.baudrate, timeout=self.timeout)
+                else:
+                    response = check_response(self.modbus.transact(frame))
+                    if response != frame:
+                        print(f"Set address step not echoed: {response.hex(' ')}")
+                        return False
+            except ModbusError as e:
+                print(f"Set address failed: {e}")
+                return False
+        print(f"Address changed 0x{self.slave_address:02X} -> 0x{new_address:02X}")
+        cache = self.modbus.bus.cache
+        cache.invalidate(self.port, self.slave_address)
+        cache.invalidate(self.port, new_address)
+        cache.set_ttl(self.port, self.slave_address, 0)
+        cache.set_ttl(self.port, new_address, self.model.spec.get("cache_ttl", 0))
+        self.slave_address = new_address
+        self.modbus.slaveaddress = new_address
+        return True
+
+    def close(self):
+        self.modbus.close()
@@ -5,31 +5,32 @@ Luckfox Pico ProMax with Multiple Sensors
 RS485 Sequential Communication + ThingsBoard Integration
 """
 
+import os
 import time
 import threading
 import json
 from datetime import datetime
 import signal
 import sys
-import serial
 import pytz
 import subprocess
 import socket
 import requests
 
+# Import Shared RS485 Bus
+from rs485_bus import get_bus, close_all_buses
+from retry_policy import get_policy
+from circuit_breaker import CircuitBreaker
+from bus_scheduler import BusScheduler, INTERACTIVE, PERIODIC, DISCOVERY
+from auto_baud import detect_baudrate, cached_baudrate, remember_baudrate
+
 # Import MCP Control System
 from test_mcp01 import SensorControlSystem
 
-# Import All Sensor Classes
-from class_wind_modbus import SensorWindSpeedDirection
-from class_solar_modbus import SensorPyranometer  
-from class_soil_modbus import SensorSoilMoistureTemp
-from class_temp_modbus import SensorAirTempHumidityRS30
-from class_rain_modbus import RainTipModbus
-from class_ultra_modbus import UltrasonicModbus
-from class_soil_EC_RK500 import SensorSoilECRK500_23  
-from class_soilPH_RK500 import SensorSoilPHRK500_22 
-from class_RKL01 import SensorWaterLevelRKL01
+# Sensor models (register maps + generic driver), see sensor_models.MODELS
+from sensor_models import ModelSensor
+from modbus_gateway import ModbusTCPGateway
+from register_cache import get_cache
 
 # Import ThingsBoard Sender
 from telemetry_sending_paho import ThingsBoardSender
@@ -68,14 +69,14 @@ class IntegratedSensorSystem:
         self.thingsboard_sender = None
         self._initialize_thingsboard()
         
-        # Sensor Configuration - ทุกตัวใช้ RS485
+        # Sensor Configuration - ทุกตัวใช้ RS485, "bus" = UART ที่ sensor ต่ออยู่
         self.sensor_config = {
             1: {
                 "address": 0x1A, #26-37 Default addr is 26
                 "type": "wind", 
-                "class": SensorWindSpeedDirection,
                 "model": "RK120",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS2",
                 "timeout": 1.5,
                 "instance": "01",
                 "enabled": True
@@ -83,9 +84,9 @@ class IntegratedSensorSystem:
             2: {
                 "address": 0x02, #01-13 Default addr is 1
                 "type": "soil", 
-                "class": SensorSoilMoistureTemp,
                 "model": "RK520",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS2",
                 "timeout": 1.5,
                 "instance": "01",  #ถ้า sensor ชนิดเดียวกันมีมากกว่า 1 ตัวให้เปลี่ยนเลข instance ดูsoil เป็นตัวอย่าง
                 "enabled": True
@@ -93,9 +94,9 @@ class IntegratedSensorSystem:
             3: {
                 "address": 0x03, #01-13 Default addr is 1
                 "type": "soil", 
-                "class": SensorSoilMoistureTemp,
                 "model": "RK520",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS2",
                 "timeout": 1.5,
                 "instance": "02",
                 "enabled": True
@@ -103,9 +104,9 @@ class IntegratedSensorSystem:
             4: {
                 "address": 0x0E,  #14-25 Default addr is 14
                 "type": "air_temp", 
-                "class": SensorAirTempHumidityRS30,
                 "model": "MW485",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS2",
                 "timeout": 5,
                 "instance": "01",
                 "enabled": True
@@ -113,19 +114,20 @@ class IntegratedSensorSystem:
             5: {
                 "address": 0x4E,  #76-87 Default addr is 76
                 "type": "ultrasonic", 
-                "class": UltrasonicModbus,
                 "model": "RCWL",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS2",
                 "timeout": 5,
+                "burst": {"samples": 5, "reduce": "median"},  # ผิวน้ำกระเพื่อม อ่านหลายครั้งแล้วใช้ค่ากลาง
                 "instance": "01",
                 "enabled": True
             },
             6: {
                 "address": 0x32, #50-61 Default addr is 50 
                 "type": "rainfall", 
-                "class": RainTipModbus,
                 "model": "RK400",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS2",
                 "timeout": 1.5,
                 "instance": "01",
                 "enabled": True
@@ -133,9 +135,9 @@ class IntegratedSensorSystem:
             7: {
                 "address": 0x26, #38-49 Default addr is 38 
                 "type": "solar", 
-                "class": SensorPyranometer,
                 "model": "RK200",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS2",
                 "timeout": 1.5,
                 "instance": "01",
                 "enabled": False
@@ -143,9 +145,9 @@ class IntegratedSensorSystem:
             8: {
                 "address": 0x58, #88-99 Default addr is 88
                 "type": "soil_ec", 
-                "class": SensorSoilECRK500_23,
                 "model": "RK500-23",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS2",
                 "timeout": 1.5,
                 "instance": "01",
                 "enabled": False
@@ -153,9 +155,9 @@ class IntegratedSensorSystem:
             9: {
                 "address": 0x64, #100-111 Default addr is 100
                 "type": "soil_ph", 
-                "class": SensorSoilPHRK500_22,
                 "model": "RK500-22",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS2",
                 "timeout": 1.5,
                 "instance": "01",
                 "enabled": False
@@ -163,9 +165,9 @@ class IntegratedSensorSystem:
             10: {
                 "address": 0x70, #112-123 Default addr is 112
                 "type": "liquid_level", 
-                "class": SensorWaterLevelRKL01,
                 "model": "RKL-01",
                 "baudrate": 9600,
+                "bus": "/dev/ttyS4",  # RKL-01 ต่อที่ UART ttyS4 (ค่า default ของ driver)
                 "timeout": 5,
                 "instance": "01",
                 "enabled": False
@@ -209,10 +211,26 @@ class IntegratedSensorSystem:
             },
         }
         
-        # Serial port settings
+        # Serial port settings - sensor ทุกตัวใช้ bus (file descriptor) เดียวกัน
         self.serial_port = "/dev/ttyS2"
         self.current_baudrate = None
-        self.serial_connection = None
+        self.bus = get_bus(self.serial_port)
+        # แต่ละ bus (UART) มี worker + lock ของตัวเอง -> อ่าน sensor ต่าง bus พร้อมกันได้
+        # งานทุกอย่างบน bus ผ่าน scheduler: RPC แทรกคิวก่อนการอ่านตามรอบได้
+        bus_paths = {self.serial_port} | {
+            cfg.get("bus", self.serial_port) for cfg in self.sensor_config.values() if cfg.get("enabled", True)
+        }
+        self.buses = {path: get_bus(path) for path in sorted(bus_paths)}
+        self.schedulers = {path: BusScheduler(path) for path in self.buses}
+        self.scheduler = self.schedulers[self.serial_port]
+        # Modbus TCP (localhost) ให้ script commissioning / debug ใช้ bus ร่วมกับ poller ได้
+        # แต่ละ bus ได้ TCP port = port + ลำดับ bus
+        self.gateway_config = {"enabled": False, "host": "127.0.0.1", "port": 5020}
+        self.gateways = {}
+        # บันทึก frame ดิบบน RS485 (frame_recorder) ไว้ replay ตอน field box มีปัญหา
+        # เปิดได้ทาง RPC "capture" โดยไม่ต้อง restart
+        self.capture_config = {"enabled": False, "directory": "/root/rs485_capture",
+                               "max_bytes": 4 * 1024 * 1024, "backups": 20}
         
         # Sensor Instances
         self.sensors = {}
@@ -221,15 +239,24 @@ class IntegratedSensorSystem:
         # Status Tracking
         self.previous_status = {}  # เก็บ status ครั้งก่อน
         self.last_communication_status = {}  # เก็บผล communication ล่าสุด
+        self.read_outcomes = {}  # ผลการอ่านล่าสุด: ok / timeout / crc / exception / no-device
+        self.breakers = {port: CircuitBreaker() for port in self.sensor_config}  # กัก port ที่ไม่ตอบ
+        self.last_connection_state = {}  # สถานะ sensor_check pin รอบก่อน (ดู connect ใหม่)
+        self.baud_probed = {}  # port -> breaker.opened_at ที่ probe baudrate ไปแล้ว
         self.first_run = True  # เช็คครั้งแรก
+        # รอบถัดจาก test cycle ตอน start รับค่าจาก register cache ได้ (เพิ่งอ่านบนสายไป)
+        # ตั้งใน start() และล้างทันทีที่รอบนั้นใช้ รอบอื่นอ่านบนสายเสมอ
+        self.cached_cycle = False
         
         # Control Flags
         self.running = True
         self.read_interval = 60  # seconds
+        self.bus_metrics_interval = 900  # seconds: histogram summary ไป IO_Monitor
+        self.last_bus_metrics = 0.0
         
         # Threading
         self.sensor_thread = None
-        self.serial_lock = threading.Lock()
+        self.serial_lock = self.bus.lock
         
         # Initialize Serial and Sensors
         self._initialize_serial()
@@ -317,6 +344,56 @@ class IntegratedSensorSystem:
                     {"required": ["param"], "types": {"param": "bool"}}
                 )
 
+                def rpc_read_sensor(method, params):
+                    # อ่าน sensor ทันที (แทรกคิวก่อนการอ่านตามรอบ) เช่นตอน calibrate ที่หน้างาน
+                    # "cached": true รับค่าจาก register cache ได้ถ้ายังไม่หมดอายุ (ไม่แตะ bus)
+                    port = params.get("port")
+                    cached = bool(params.get("cached", False))
+                    if port not in self.sensors or self.sensors[port] is None:
+                        return {"success": False, "message": f"port {port} not enabled"}
+                    if self.sensors[port]["instance"].model.spec.get("counter"):
+                        # rain: อ่านแล้วตัวนับถูกล้าง -> ห้ามอ่านนอกรอบ ส่งค่ารอบล่าสุดแทน (เหมือน gateway protected)
+                        last = self.sensor_data.get("sensors", {}).get(f"port_{port}")
+                        return {
+                            "success": last is not None,
+                            "data": last["data"] if last else None,
+                            "source": "last_poll",
+                            "polled_at": last["timestamp"] if last else None,
+                            "message": "reading clears the counter; last polled value returned",
+                            "timestamp": int(time.time() * 1000)
+                        }
+                    try:
+                        scheduler = self.schedulers[self._bus_path(port)]
+                        data = scheduler.call(INTERACTIVE, self.read_sensor_with_timeout, port, cached, timeout=10)
+                    except Exception as e:
+                        return {"success": False, "message": f"read failed: {e}"}
+                    return {
+                        "success": data is not None,
+                        "data": data,
+                        "outcome": self.read_outcomes.get(port),
+                        "timestamp": int(time.time() * 1000)
+                    }
+
+                self.thingsboard_sender.register_rpc_method(
+                    "read_sensor", rpc_read_sensor,
+                    {"required": ["port"], "types": {"port": "int"}}
+                )
+
+                def rpc_capture(method, params):
+                    # เปิด/ปิดการบันทึก frame ดิบ (ดึงไฟล์ไป replay ด้วย frame_replay.py)
+                    self._set_capture(params["param"])
+                    return {
+                        "success": True,
+                        "capturing": {path: bus.recorder is not None for path, bus in self.buses.items()},
+                        "directory": self.capture_config["directory"],
+                        "timestamp": int(time.time() * 1000)
+                    }
+
+                self.thingsboard_sender.register_rpc_method(
+                    "capture", rpc_capture,
+                    {"required": ["param"], "types": {"param": "bool"}}
+                )
+
   
                 self.thingsboard_sender.start_rpc_handler()
 
@@ -328,47 +405,65 @@ class IntegratedSensorSystem:
             self.thingsboard_sender = None
             
     def _initialize_serial(self):
-        """Initialize serial connection"""
+        """Open every RS485 bus (one file descriptor per UART, shared by its sensors)"""
         print("🔌 Initializing RS485 serial connection...")
-        try:
-            self.serial_connection = serial.Serial(
-                port=self.serial_port,
-                baudrate=9600,
-                timeout=1.5,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS
-            )
-            self.current_baudrate = 9600
-            print(f"✅ Serial connection established on {self.serial_port}")
-        except Exception as e:
-            print(f"❌ Failed to initialize serial connection: {e}")
-            self.serial_connection = None
+        for path, bus in self.buses.items():
+            try:
+                bus.open()
+                bus.configure(baudrate=9600, timeout=1.5)
+                print(f"✅ Serial connection established on {path}")
+            except Exception as e:
+                print(f"❌ Failed to initialize serial connection on {path}: {e}")
+        self.current_baudrate = self.bus.baudrate
             
-    def _change_baudrate(self, new_baudrate):
-        """Change serial baudrate if needed"""
-        if self.current_baudrate != new_baudrate and self.serial_connection:
+    def _bus_path(self, port):
+        """UART of the sensor on a port"""
+        return self.sensor_config[port].get("bus", self.serial_port)
+
+    def _change_baudrate(self, new_baudrate, bus=None):
+        """Change serial baudrate if needed (in place on the open port)"""
+        bus = bus or self.bus
+        if bus.baudrate != new_baudrate and bus.is_open:
             try:
-                self.serial_connection.close()
-                time.sleep(0.1)
-                
-                self.serial_connection = serial.Serial(
-                    port=self.serial_port,
-                    baudrate=new_baudrate,
-                    timeout=1.5,
-                    parity=serial.PARITY_NONE,
-                    stopbits=serial.STOPBITS_ONE,
-                    bytesize=serial.EIGHTBITS
-                )
-                self.current_baudrate = new_baudrate
-                print(f"🔄 Baudrate changed to {new_baudrate}")
-                time.sleep(0.2)
+                bus.configure(baudrate=new_baudrate)
+                if bus is self.bus:
+                    self.current_baudrate = new_baudrate
+                print(f"🔄 Baudrate on {bus.port} changed to {new_baudrate}")
                 return True
             except Exception as e:
                 print(f"❌ Failed to change baudrate to {new_baudrate}: {e}")
                 return False
         return True
         
+    def _count_line_changes(self, ports):
+        """Number of baudrate changes needed to poll ports in this order (per bus)"""
+        changes = 0
+        current = {path: bus.baudrate for path, bus in self.buses.items()}
+        for port in ports:
+            path = self._bus_path(port)
+            baudrate = self.sensor_config[port]["baudrate"]
+            if baudrate != current.get(path):
+                changes += 1
+                current[path] = baudrate
+        return changes
+
+    def _plan_poll_order(self, ports):
+        """
+        Group ports by line settings so each baudrate is applied once per cycle
+
+        Groups are per bus. On each bus the group already on the line goes
+        first; ports keep their config order inside a group.
+
+        Returns:
+            list: Ports in poll order
+        """
+        groups = {}
+        for port in ports:
+            key = (self._bus_path(port), self.sensor_config[port]["baudrate"])
+            groups.setdefault(key, []).append(port)
+        keys = sorted(groups, key=lambda key: (key[0], key[1] != self.buses[key[0]].baudrate, key[1]))
+        return [port for key in keys for port in groups[key]]
+
     def _initialize_sensors(self):
         print("🔧 Initializing sensors...")
         for port, config in self.sensor_config.items():
@@ -377,7 +472,14 @@ class IntegratedSensorSystem:
                 self.sensors[port] = None
                 continue
             try:
-                sensor = config["class"](port=self.serial_port, slave_address=config["address"], baudrate=config["baudrate"])
+                bus_path = config.get("bus", self.serial_port)
+                # ใช้ baudrate ที่ auto-baud เคยเจอ (ถ้ามี) แทนค่าใน config
+                detected = cached_baudrate(bus_path, config["address"])
+                if detected and detected != config["baudrate"]:
+                    print(f"🔎 Port {port}: using detected baudrate {detected} (config {config['baudrate']})")
+                    config["baudrate"] = detected
+                sensor = ModelSensor(config["type"], port=bus_path, slave_address=config["address"],
+                                     baudrate=config["baudrate"], burst=config.get("burst"))
                 self.sensors[port] = {
                     "instance": sensor,
                     "type": config["type"],
@@ -385,7 +487,9 @@ class IntegratedSensorSystem:
                     "baudrate": config["baudrate"],
                     "timeout": config["timeout"],
                     "model": config["model"],
-                    "instance_num": config["instance"]
+                    "instance_num": config["instance"],
+                    "bus": self.buses[bus_path],
+                    "retry_policy": get_policy(bus_path, config["address"])
                 }
                 self.previous_status[port] = {"current_status": None, "operation_status": None}
                 self.last_communication_status[port] = False
@@ -394,6 +498,86 @@ class IntegratedSensorSystem:
                 print(f"❌ Failed to initialize sensor on port {port}: {e}")
                 self.sensors[port] = None
                 
+    def _start_gateways(self):
+        """Start one Modbus TCP gateway per bus if enabled in gateway_config"""
+        if not self.gateway_config.get("enabled"):
+            return
+        for index, (path, bus) in enumerate(self.buses.items()):
+            units = [cfg for cfg in self.sensor_config.values() if cfg.get("bus", self.serial_port) == path]
+            gateway = ModbusTCPGateway(
+                bus, self.schedulers[path],
+                host=self.gateway_config["host"],
+                port=self.gateway_config["port"] + index,
+                baudrates={cfg["address"]: cfg["baudrate"] for cfg in units},
+                protected={cfg["address"] for cfg in units if cfg["type"] == "rainfall"}
+            )
+            try:
+                gateway.start()
+                self.gateways[path] = gateway
+            except OSError as e:
+                print(f"❌ Modbus TCP gateway for {path} failed: {e}")
+
+    def _stop_gateways(self):
+        for gateway in self.gateways.values():
+            try:
+                gateway.stop()
+            except Exception:
+                pass
+        self.gateways = {}
+
+    def _set_capture(self, enabled):
+        """Start / stop frame capture on every bus (one log per tty)"""
+        self.capture_config["enabled"] = enabled
+        for path, bus in self.buses.items():
+            if not enabled:
+                bus.stop_recording()
+                continue
+            log_path = os.path.join(self.capture_config["directory"], os.path.basename(path) + ".bin")
+            try:
+                bus.start_recording(log_path, max_bytes=self.capture_config["max_bytes"],
+                                    backups=self.capture_config["backups"])
+            except OSError as e:
+                print(f"❌ Frame capture for {path} failed: {e}")
+
+    def _apply_baudrate(self, port, baudrate):
+        """Switch a sensor to a new baudrate (config, poll grouping and driver)"""
+        self.sensor_config[port]["baudrate"] = baudrate
+        gateway = self.gateways.get(self._bus_path(port))
+        if gateway is not None:
+            gateway.baudrates[self.sensor_config[port]["address"]] = baudrate
+        sensor_info = self.sensors.get(port)
+        if not sensor_info:
+            return
+        sensor_info["baudrate"] = baudrate
+        sensor = sensor_info["instance"]
+        if hasattr(sensor, "modbus"):
+            sensor.modbus.baudrate = baudrate
+        if hasattr(sensor, "baudrate"):
+            sensor.baudrate = baudrate
+
+    def _reprobe_baudrate(self, port):
+        """
+        Auto-baud a port whose breaker just opened (sustained failure)
+
+        Runs as a DISCOVERY job on the port's bus. A new rate is persisted,
+        applied and probed at once; the poll order picks it up next cycle.
+
+        Returns:
+            int or None: Detected baudrate
+        """
+        config = self.sensor_config[port]
+        bus_path = self._bus_path(port)
+        baudrate = detect_baudrate(self.buses[bus_path], config["address"], config["type"],
+                                   first=config["baudrate"])
+        if baudrate is None:
+            return None
+        remember_baudrate(bus_path, config["address"], baudrate)
+        if baudrate != config["baudrate"]:
+            print(f"🔄 Port {port} ({config['type']}): baudrate {config['baudrate']} -> {baudrate}")
+            self._apply_baudrate(port, baudrate)
+            self.breakers[port].probe_now()
+        return baudrate
+
     def get_thailand_timestamp(self):
         """Get current timestamp in Thailand timezone (milliseconds)"""
         now = datetime.now(self.thailand_tz)
@@ -415,14 +599,20 @@ class IntegratedSensorSystem:
             # power_normal = True  # สมมติว่า power ปกติ
             connection_status = self.get_mcp_sensor_connection(port)
             power_status = self.get_mcp_power_status(port)
+            link_health = self.get_link_health(port)["health"]
 
             print(f"   Physical Connection: {connection_status}")
             print(f"   Power Status: {power_status}")  
             print(f"   Communication: {'Success' if communication_success else 'Failed'}")
+            print(f"   Link Health: {link_health}")
             
             # กำหนด status ตาม logic
-            if connection_status == "CONNECTED" and power_status == "normal" and communication_success:
+            # degraded = ตอบแต่ต้อง retry บ่อย, failing = แทบไม่ตอบเลย (เหลือแค่ probe ครั้งเดียว)
+            if (connection_status == "CONNECTED" and power_status == "normal" and communication_success
+                    and link_health != "degraded"):
                 status = ("healthy", "online")
+            elif connection_status == "CONNECTED" and link_health == "failing" and not communication_success:
+                status = ("weekly", "offline")
             elif connection_status == "CONNECTED":
                 status = ("weekly", "online")  
             else:
@@ -435,6 +625,13 @@ class IntegratedSensorSystem:
             print(f"❌ Error determining status for port {port}: {e}")
             return "weekly", "offline"
         
+    def get_link_health(self, port):
+        """Retry policy state of the sensor on a port (success history)"""
+        sensor_info = self.sensors.get(port)
+        if not sensor_info:
+            return {"health": "unknown"}
+        return sensor_info["retry_policy"].state(sensor_info["instance"].attempts)
+
     def get_mcp_sensor_connection(self, port):
         """ดึงสถานะการเชื่อมต่อจาก MCP จริงๆ"""
         try:
@@ -746,6 +943,7 @@ class IntegratedSensorSystem:
             sensor_info = self.sensors[port]
             sensor_type = sensor_info["type"]
             ts_now = self.get_thailand_timestamp()
+            link_health = self.get_link_health(port)
 
             messages = {}
             for measurement_key in self.measurement_names[sensor_type].keys():
@@ -754,7 +952,10 @@ class IntegratedSensorSystem:
                     "ts": ts_now,
                     "values": {
                         "current_status": current_status,
-                        "operation_status": operation_status
+                        "operation_status": operation_status,
+                        "link_health": link_health["health"],
+                        "success_rate": link_health.get("success_rate"),
+                        "retry_budget": link_health.get("retry_budget")
                     }
                 }]
 
@@ -820,6 +1021,49 @@ class IntegratedSensorSystem:
             print(f"❌ Error sending controller status: {e}")
 
 
+    def get_bus_metrics(self):
+        """
+        Transaction histograms summary per sensor port (bus_metrics.py)
+
+        Returns:
+            dict: {port: {"tx", "ok", "crc", "timeout", ..., "rtt_p95", "attempts_p95"}}
+        """
+        metrics = {}
+        for port, config in self.sensor_config.items():
+            bus = self.buses.get(self._bus_path(port))
+            if bus is not None and config["address"] in bus.metrics.devices:
+                metrics[port] = bus.metrics.device(config["address"]).summary()
+        return metrics
+
+    def send_bus_metrics_to_thingsboard(self):
+        """
+        ส่งสรุป latency / error ของแต่ละ sensor ไปที่ device IO_Monitor (รอบช้า)
+        เช่น port_3_rtt_p95 = 64 (ms), port_3_crc = 2 (สะสมตั้งแต่ start)
+        """
+        self.last_bus_metrics = time.time()
+        if not self.thingsboard_sender:
+            return
+        keys = ("tx", "crc", "exception", "failed_reads", "rtt_p50", "rtt_p95", "rtt_max", "attempts_p95")
+        telemetry_values = {}
+        for port, summary in self.get_bus_metrics().items():
+            for key in keys:
+                if summary[key] is not None:
+                    telemetry_values[f"port_{port}_{key}"] = summary[key]
+            telemetry_values[f"port_{port}_timeout"] = summary["timeout"] + summary["no-device"]
+        if not telemetry_values:
+            return
+        monitor_device_name = f"{self.control_box_id}_IO_Monitor"
+        try:
+            ok = self.thingsboard_sender.send_telemetry({
+                monitor_device_name: [{"ts": self.get_thailand_timestamp(), "values": telemetry_values}]
+            })
+            if ok:
+                print(f"📤 Sent bus metrics to {monitor_device_name}")
+            else:
+                print("⚠️ Failed to send bus metrics")
+        except Exception as e:
+            print(f"❌ Error sending bus metrics: {e}")
+
     def enable_all_sensors(self):
         """Enable all sensor ports via MCP"""
         print("⚡ Enabling sensor ports...")
@@ -843,8 +1087,18 @@ class IntegratedSensorSystem:
             except Exception as e:
                 print(f"❌ Failed to disable port {port}: {e}")
                 
-    def read_sensor_with_timeout(self, port):
-        """Read sensor data with timeout and baudrate management"""
+    def read_sensor_with_timeout(self, port, cached=False):
+        """
+        Read sensor data with timeout and baudrate management
+
+        The sensor's "timeout" is a hard deadline for the whole read (retries
+        included): the bus clips every transaction to the remaining budget and
+        refuses new ones once it is spent. The result of the read is kept in
+        self.read_outcomes[port] as ok / timeout / crc / exception / no-device.
+
+        cached=True accepts registers read less than the model's cache_ttl
+        ago (register_cache.py) instead of a wire transaction.
+        """
         if port not in self.sensors or self.sensors[port] is None:
             return None
             
@@ -854,127 +1108,46 @@ class IntegratedSensorSystem:
         required_baudrate = sensor_info["baudrate"]
         timeout = sensor_info["timeout"]
         
-        with self.serial_lock:
+        start_time = time.time()
+        result = None
+        bus = sensor_info["bus"]
+        with bus.deadline(timeout) as window:
             try:
-                if not self._change_baudrate(required_baudrate):
+                if not self._change_baudrate(required_baudrate, bus):
                     return None
                 
                 print(f"📡 Reading {sensor_type} sensor (Port {port})...")
                 
-                start_time = time.time()
-                data = None
-                
-                if sensor_type == "wind":
-                    data = sensor.read_wind()
-                    if data:
-                        result = {
-                            "wind_speed": data.get("wind_speed"),
-                            "wind_direction": data.get("wind_direction")
-                        }
-                    else:
-                        result = None
-                        
-                elif sensor_type == "solar":
-                    data = sensor.read_radiation()
-                    if data and "radiation" in data:
-                        result = {
-                            "solar_radiation": data.get("radiation")
-                        }
-                    else:
-                        result = None
-                        
-                elif sensor_type == "soil":
-                    data = sensor.read_data()
-                    if data:
-                        result = {
-                            "soil_moisture": data.get("soil_moisture"),
-                            "soil_temperature": data.get("soil_temperature")
-                        }
-                    else:
-                        result = None
-                        
-                elif sensor_type == "air_temp":
-                    data = sensor.read_temp()
-                    if data:
-                        result = {
-                            "temperature": data.get("temperature"),
-                            "humidity": data.get("humidity")
-                        }
-                    else:
-                        result = None
-                elif sensor_type == "rainfall":
-                    data = sensor.read_tip() 
-                    if data and data.get("success"):
-                        result = {
-                            "rainfall": data.get("rainfall")
-                        }
-                    else:
-                        result = None
-                elif sensor_type == "ultrasonic":
-                    data = sensor.read_distance() 
-                    if data and data.get("success"):
-                        result = {
-                            "distance_cm": data.get("distance_cm"),
-                            "distance_formula": data.get("distance_formula")
-                        }
-                    else:
-                        result = None
-
-                elif sensor_type == "soil_ec":
-                    data = self.read_soil_ec_data(sensor)
-                    if data:
-                        result = {
-                            "ec_value": data.get("ec_value"),
-                            "salinity": data.get("salinity"),
-                            "temperature": data.get("temperature")
-                        }
-                    else:
-                        result = None
-                        
-                elif sensor_type == "soil_ph":
-                    data = self.read_soil_ph_data(sensor)
-                    if data:
-                        result = {
-                            "ph_value": data.get("ph_value"),
-                            "temperature": data.get("temperature"),
-                            "ph_classification": data.get("ph_classification")
-                        }
-                    else:
-                        result = None
-                
-                elif sensor_type == "liquid_level":
-                    data = self.read_water_level_data(sensor)
-                    if data:
-                        result = {
-                            "water_level": data.get("water_level"),
-                            "water_level_cm": data.get("water_level_cm"),
-                            "raw_value": data.get("raw_value")
-                        }
-                    else:
-                        result = None
+                # ทุกชนิด sensor อ่านผ่าน model registry (sensor_models.MODELS)
+                result = sensor.publish(cached=cached)
                 
                 elapsed_time = time.time() - start_time
-                if elapsed_time > timeout:
-                    print(f"⏰ Timeout: {sensor_type} sensor took {elapsed_time:.2f}s")
-                    return None
-                    
                 if result:
                     print(f"✅ {sensor_type} sensor responded in {elapsed_time:.2f}s")
-                    return result
+                elif window.expired:
+                    print(f"⏰ Timeout: {sensor_type} sensor: No response within {timeout}s")
                 else:
-                    print(f"⚠️  {sensor_type} sensor: No valid data")
-                    return None
+                    print(f"⚠️  {sensor_type} sensor: No valid data ({window.outcome})")
                     
             except Exception as e:
-                elapsed_time = time.time() - start_time
-                if elapsed_time > timeout:
-                    print(f"❌ {sensor_type} sensor: No response within {timeout}s")
-                else:
-                    print(f"❌ {sensor_type} sensor error: {e}")
-                return None
-                
-            finally:
-                time.sleep(0.2)
+                result = None
+                print(f"❌ {sensor_type} sensor error: {e}")
+
+        self.read_outcomes[port] = {
+            "outcome": "ok" if result else window.outcome,
+            "transactions": window.transactions,
+            "cache_hits": window.cache_hits,
+            "elapsed": round(time.time() - start_time, 3)
+        }
+        attempts = window.transactions
+        if sensor.burst and sensor.last_burst:
+            self.read_outcomes[port]["burst"] = sensor.last_burst
+            # burst ตั้งใจอ่านหลายครั้ง: นับเฉพาะครั้งที่ล้มเป็น retry
+            attempts = window.transactions - sensor.last_burst["samples"] + 1
+        sensor_info["retry_policy"].record(result is not None, attempts)
+        if window.transactions:  # cache hit ไม่นับเป็นการอ่าน
+            bus.metrics.record_read(sensor_info["address"], attempts, result is not None)
+        return result
 
     def test_sensor_power_control(self):
         """ทดสอบการเปิด/ปิดไฟเซ็นเซอร์"""
@@ -993,7 +1166,13 @@ class IntegratedSensorSystem:
         print("\nTest completed!")
                 
     def read_all_sensors_sequential(self):
-        """Read all sensors sequentially with ThingsBoard integration"""
+        """
+        Read all sensors with ThingsBoard integration
+
+        Reads on the same bus run one after another on that bus's worker;
+        different buses (UARTs) are read in parallel. Results are then
+        processed in poll order into one cycle snapshot.
+        """
         print(f"📊 Reading all sensors sequentially... [{datetime.now().strftime('%H:%M:%S')}]")
         
         try:
@@ -1007,18 +1186,55 @@ class IntegratedSensorSystem:
             "sensors": {}
         }
         
-        sensor_order = [p for p, cfg in self.sensor_config.items() if cfg.get("enabled", True)]
+        config_order = [p for p, cfg in self.sensor_config.items() if cfg.get("enabled", True)]
+        sensor_order = self._plan_poll_order(config_order)
+        
+        # นับจำนวนการเปลี่ยน baudrate ที่ประหยัดได้จากการเรียงตาม line settings
+        planned_changes = self._count_line_changes(sensor_order)
+        saved_changes = self._count_line_changes(config_order) - planned_changes
+        line_changes_before = sum(bus.stats["line_changes"] for bus in self.buses.values())
+        cycle_start = time.time()
+        
+        # ส่งงานอ่านให้ worker ของแต่ละ bus ทีเดียว: bus ต่างกันอ่านพร้อมกัน
+        cached = self.cached_cycle
+        self.cached_cycle = False
+        jobs = {}
+        for port in sensor_order:
+            # sensor เพิ่งเสียบ (sensor_check pin เปลี่ยนเป็น CONNECTED) -> probe ทันที
+            breaker = self.breakers[port]
+            connection_status = self.get_mcp_sensor_connection(port)
+            if connection_status == "CONNECTED" and self.last_connection_state.get(port) != "CONNECTED":
+                breaker.probe_now()
+            self.last_connection_state[port] = connection_status
+
+            # ข้ามถ้า port ถูกกักไว้ และยังไม่ถึงเวลา probe
+            if breaker.allow_request():
+                scheduler = self.schedulers[self._bus_path(port)]
+                # cached: เฉพาะรอบแรกหลัง test cycle ตอน start ไม่ต้องอ่านซ้ำบนสาย
+                jobs[port] = scheduler.submit(PERIODIC, self.read_sensor_with_timeout, port, cached)
         
         for port in sensor_order:
-            if port not in self.sensor_config:
-                continue
-                
             sensor_type = self.sensor_config[port]["type"]
             print(f"\n🔍 Reading sensor {port} ({sensor_type})...")
             
             try:
-                # อ่านข้อมูลจาก sensor
-                data = self.read_sensor_with_timeout(port)
+                # รอผลอ่านจาก worker ของ bus นั้น
+                breaker = self.breakers[port]
+                if port in jobs:
+                    try:
+                        data = jobs[port].wait()
+                    except Exception:
+                        # งานล้มก็นับเป็นการอ่านพลาด ไม่งั้น breaker ที่ half-open (probe) ค้างอยู่ตลอด
+                        breaker.record(False)
+                        raise
+                    breaker.record(data is not None)
+                    # เพิ่งถูกกัก -> ลองหา baudrate ใหม่ครั้งเดียวต่อการกัก (config baudrate ผิดดูเหมือน sensor ตาย)
+                    if breaker.state == "open" and self.baud_probed.get(port) != breaker.opened_at:
+                        self.baud_probed[port] = breaker.opened_at
+                        self.schedulers[self._bus_path(port)].submit(DISCOVERY, self._reprobe_baudrate, port)
+                else:
+                    data = None
+                    print(f"🚧 Port {port} quarantined (next probe in {breaker.status()['next_probe_in']}s)")
                 communication_success = data is not None
                 print(f"📡 Communication Debug for Port {port}:")
                 print(f"   - Raw data: {data}")
@@ -1044,6 +1260,7 @@ class IntegratedSensorSystem:
                         "data": data,
                         "current_status": current_status,
                         "operation_status": operation_status,
+                        "read_outcome": self.read_outcomes.get(port),
                         "timestamp": datetime.now(self.thailand_tz).isoformat()
                     }
                     
@@ -1061,8 +1278,10 @@ class IntegratedSensorSystem:
                     all_data["sensors"][f"port_{port}"] = {
                         "type": sensor_type,
                         "status": "no_response",
+                        "breaker": breaker.status(),
                         "current_status": current_status,
                         "operation_status": operation_status,
+                        "read_outcome": self.read_outcomes.get(port),
                         "timestamp": datetime.now(self.thailand_tz).isoformat()
                     }
                     
@@ -1093,15 +1312,25 @@ class IntegratedSensorSystem:
                     "operation_status": operation_status
                 }
             
+            # ไม่ต้อง sleep ระหว่าง sensor: bus รอ turnaround ที่เรียนรู้ของแต่ละ address เอง
             self.send_controller_status_to_thingsboard()
-            
-            if port < max(sensor_order):
-                print(f"⏳ Waiting before next sensor...")
-                time.sleep(0.5)
         
         # เปลี่ยน first_run เป็น False หลังรอบแรก
         self.first_run = False
         
+        all_data["cycle_time"] = round(time.time() - cycle_start, 3)
+        all_data["bus_scheduler"] = {path: scheduler.metrics() for path, scheduler in self.schedulers.items()}
+        all_data["register_cache"] = get_cache().stats()
+        all_data["line_changes"] = {
+            "applied": sum(bus.stats["line_changes"] for bus in self.buses.values()) - line_changes_before,
+            "planned": planned_changes,
+            "saved": saved_changes
+        }
+        print(f"🔄 Line changes this cycle: {all_data['line_changes']['applied']} "
+              f"(saved {saved_changes} by grouping by baudrate)")
+        if time.time() - self.last_bus_metrics >= self.bus_metrics_interval:
+            self.send_bus_metrics_to_thingsboard()
+        
         self.sensor_data = all_data
         responsive_sensors = len([s for s in all_data['sensors'].values() 
                                 if 'status' not in s or s['status'] != 'no_response'])
@@ -1340,8 +1569,10 @@ class IntegratedSensorSystem:
             try:
                 if self.thingsboard_sender:
                     self.thingsboard_sender.close()
-                if self.serial_connection:
-                    self.serial_connection.close()
+                self._stop_gateways()
+                for scheduler in self.schedulers.values():
+                    scheduler.stop(timeout=1.0)
+                close_all_buses()
             except:
                 pass
             
@@ -1389,10 +1620,19 @@ class IntegratedSensorSystem:
         print("🌟 Starting Integrated Sensor System...")
         
         try:
-            if not self.serial_connection:
+            closed = [path for path, bus in self.buses.items() if not bus.is_open]
+            if len(closed) == len(self.buses):
                 print("❌ No serial connection available!")
                 return
+            for path in closed:
+                print(f"⚠️ Serial connection not available on {path}")
             
+            for scheduler in self.schedulers.values():
+                scheduler.start()
+            self._start_gateways()
+            if self.capture_config["enabled"]:
+                self._set_capture(True)
+
             print("🌐 Starting Internet connection monitoring...")
             self.start_internet_monitor()
 
@@ -1410,6 +1650,7 @@ class IntegratedSensorSystem:
             responsive_sensors = len([s for s in test_data['sensors'].values() 
                                     if 'status' not in s or s['status'] != 'no_response'])
             print(f"📊 Test complete: {responsive_sensors}/{len(self.sensor_config)} sensors responding")
+            self.cached_cycle = True
             
             # Start main loop
             self.sensor_thread = threading.Thread(
@@ -1464,12 +1705,14 @@ class IntegratedSensorSystem:
                 pass
         
         # Close serial connection
-        if self.serial_connection:
-            try:
-                self.serial_connection.close()
-                print("✅ Serial connection closed")
-            except:
-                pass
+        try:
+            self._stop_gateways()
+            for scheduler in self.schedulers.values():
+                scheduler.stop()
+            close_all_buses()
+            print("✅ Serial connection closed")
+        except:
+            pass
         
         # Close MCP monitoring
         try:
@@ -1530,12 +1773,14 @@ class IntegratedSensorSystem:
                 pass
         
         # Close serial connection
-        if self.serial_connection:
-            try:
-                self.serial_connection.close()
-                print("✅ Serial connection closed")
-            except:
-                pass
+        try:
+            self._stop_gateways()
+            for scheduler in self.schedulers.values():
+                scheduler.stop()
+            close_all_buses()
+            print("✅ Serial connection closed")
+        except:
+            pass
                 
         # ปิด MCP monitoring (ถ้ามี)
         try:
@@ -172,17 +172,7 @@
 
 import serial
 import time
-
-def modbus_crc(buf):
-    crc = 0xFFFF
-    for b in buf:
-        crc ^= b
-        for _ in range(8):
-            if crc & 1:
-                crc = (crc >> 1) ^ 0xA001
-            else:
-                crc >>= 1
-    return crc
+from modbus_crc import crc16 as modbus_crc
 
 def read_ultrasonic_loop(port="/dev/ttyS2", slave_addr=0x4C, timeout=1.0, delay_between=0.5, max_attempts=50):
     ser = serial.Serial(port, baudrate=4800, bytesize=8, parity="N", stopbits=1, timeout=timeout)